@@ -130,14 +130,14 @@ def change_password(request):
         form = PasswordChangeForm(user=request.user)
 
     confirmed = Reservation.objects.filter(
-        user=request.user,
-        status=ReservationStatus.CONFIRMEE,
+        utilisateur=request.user,
+        statut=ReservationStatus.CONFIRMEE,
     )
     context = {
         "active_tab": "profile",
         "nb_voyages": confirmed.count(),
         "total_depense": confirmed.aggregate(total=Sum("prix_total"))["total"] or 0,
-        "nb_villes": confirmed.values("departure__trip__arret_arrivee__ville").distinct().count(),
+        "nb_villes": confirmed.values("depart__trip__arret_arrivee__ville").distinct().count(),
         "edit_form": ProfileEditForm(instance=request.user),
         "password_form": _style_password_form(form),
     }
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Conducteur, Gare
+from .models import AffectationConducteur, AlerteDepart, Conducteur, Gare
 
 
 @admin.register(Conducteur)
@@ -13,3 +13,18 @@ class ConducteurAdmin(admin.ModelAdmin):
 class GareAdmin(admin.ModelAdmin):
 	list_display = ('nom', 'ville', 'adresse')
 	search_fields = ('nom', 'ville')
+
+
+@admin.register(AffectationConducteur)
+class AffectationConducteurAdmin(admin.ModelAdmin):
+	list_display = ('conducteur', 'departure', 'role')
+	list_filter = ('role',)
+	search_fields = ('conducteur__nom', 'conducteur__prenom', 'departure__trip__nom')
+	list_select_related = ('conducteur', 'departure__trip')
+
+
+@admin.register(AlerteDepart)
+class AlerteDepartAdmin(admin.ModelAdmin):
+	list_display = ('type', 'depart', 'conducteur', 'echeance', 'created_at', 'resolue_le')
+	list_filter = ('type', ('resolue_le', admin.EmptyFieldListFilter))
+	list_select_related = ('depart__trip', 'conducteur')
@@ -0,0 +1,111 @@
+"""Requetes de l'API analytique, servies uniquement depuis OccupationJournaliere.
+
+Pour les longues periodes, les points sont regroupes en base par semaine puis
+par mois (TruncWeek / TruncMonth) afin de ne jamais depasser `max_points` ; une
+periode trop longue meme par mois est refusee (ValueError).
+"""
+from datetime import timedelta
+
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+
+from .models import OccupationJournaliere
+
+
+def _nb_jours(du, au):
+    return (au - du).days + 1
+
+
+def _nb_semaines(du, au):
+    # Semaines entamees (lundi), bornes comprises : comme TruncWeek.
+    return ((au - timedelta(days=au.weekday())) - (du - timedelta(days=du.weekday()))).days // 7 + 1
+
+
+def _nb_mois(du, au):
+    return (au.year - du.year) * 12 + au.month - du.month + 1
+
+
+# (nom, fonction de troncature, nombre de points sur [du, au])
+GRANULARITES = [
+    ("jour", None, _nb_jours),
+    ("semaine", TruncWeek, _nb_semaines),
+    ("mois", TruncMonth, _nb_mois),
+]
+
+AXES_REPARTITION = {
+    "trajet": ("trip_id", "trip__nom"),
+    "heure": ("heure_depart",),
+    "categorie": ("categorie_id", "categorie__nom"),
+}
+
+CRITERES_TOP = {
+    "recettes": "-total_recettes",
+    "places": "-total_places",
+    "remplissage": "-taux",
+}
+
+
+def choisir_granularite(du, au, max_points):
+    for nom, troncature, nb_points in GRANULARITES:
+        if nb_points(du, au) <= max_points:
+            return nom, troncature
+    raise ValueError(
+        f"Periode trop longue : {_nb_mois(du, au)} mois pour {max_points} points au plus ; "
+        "reduire la periode ou augmenter max_points."
+    )
+
+
+def filtrer_occupations(du, au, trajet=None, categorie=None):
+    occupations = OccupationJournaliere.objects.filter(date__range=(du, au))
+    if trajet:
+        occupations = occupations.filter(trip=trajet)
+    if categorie:
+        occupations = occupations.filter(categorie=categorie)
+    return occupations
+
+
+def _totaux(queryset):
+    return queryset.annotate(
+        total_places=Sum("places_vendues"),
+        total_capacite=Sum("capacite"),
+        total_recettes=Sum("recettes"),
+        total_annulations=Sum("annulations"),
+    )
+
+
+def _point(ligne):
+    capacite = ligne["total_capacite"] or 0
+    places = ligne["total_places"] or 0
+    return {
+        "places_vendues": places,
+        "capacite": capacite,
+        "taux_remplissage": round(places / capacite, 4) if capacite else 0,
+        "recettes": float(ligne["total_recettes"] or 0),
+        "annulations": ligne["total_annulations"] or 0,
+    }
+
+
+def serie_temporelle(occupations, du, au, max_points):
+    granularite, troncature = choisir_granularite(du, au, max_points)
+    if troncature is None:
+        lignes = occupations.values(periode=F("date"))
+    else:
+        lignes = occupations.annotate(periode=troncature("date")).values("periode")
+    lignes = _totaux(lignes).order_by("periode")
+    return granularite, [{"periode": ligne["periode"], **_point(ligne)} for ligne in lignes]
+
+
+def top_trajets(occupations, n, critere):
+    lignes = (
+        _totaux(occupations.values("trip_id", "trip__nom"))
+        .annotate(taux=1.0 * F("total_places") / F("total_capacite"))
+        .filter(total_capacite__gt=0)
+        .order_by(CRITERES_TOP[critere], "trip__nom")[:n]
+    )
+    return [{"trip_id": ligne["trip_id"], "trajet": ligne["trip__nom"], **_point(ligne)} for ligne in lignes]
+
+
+def repartition(occupations, axe):
+    champs = AXES_REPARTITION[axe]
+    lignes = _totaux(occupations.values(*champs)).order_by(*champs)
+    return [{**{champ: ligne[champ] for champ in champs}, **_point(ligne)} for ligne in lignes]
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class GareciAdminConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'gareci_admin'
+
+    def ready(self):
+        from . import signals  # noqa: F401
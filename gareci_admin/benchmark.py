@@ -0,0 +1,468 @@
+"""Jeu de donnees synthetique et mesures de performance a grande echelle.
+
+`generer()` (commande `seed_benchmark`) cree en bulk_create un reseau ivoirien
+fictif : villes et gares, trajets directs ou avec escale, bus, departs,
+voyageurs et reservations avec leurs paiements. Les lignes generees sont
+marquees par le prefixe BM (codes, immatriculations, references) ou bench_
+(utilisateurs) : `reinitialiser()` ne supprime qu'elles.
+
+`mesurer()` (commande `benchmark`) chronometre les parcours critiques sur
+ces donnees avec le client de test Django ; les ecritures se font dans une
+transaction annulee, la base n'est donc pas modifiee par les mesures.
+"""
+import math
+import random
+import statistics
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from datetime import time, timedelta
+from decimal import Decimal
+from time import perf_counter
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from gareci_project.instrumentation import JournalSQL
+from reservations.models import Paiement, Reservation, ReservationStatus
+from reservations.retention import purger
+from reservations.services import ReservationService
+from trips.models import Arret, Bus, Calendrier, Depart, EtapeTrajet, Segment, Trip, Ville, get_default_category_pk
+
+from .models import DashboardStats
+from .signals import conserver_compteurs
+
+PREFIXE = "BM"
+PREFIXE_UTILISATEUR = "bench_"
+MOT_DE_PASSE = "benchmark"
+TAILLE_LOT = 5000
+
+VILLES = [
+    "Abidjan", "Bouake", "Daloa", "Yamoussoukro", "San-Pedro", "Korhogo", "Man", "Divo", "Gagnoa",
+    "Abengourou", "Anyama", "Agboville", "Grand-Bassam", "Dabou", "Bondoukou", "Seguela", "Odienne",
+    "Ferkessedougou", "Sinfra", "Soubre", "Issia", "Bouafle", "Katiola", "Dimbokro", "Toumodi", "Adzope",
+    "Aboisso", "Tiassale", "Guiglo", "Duekoue", "Daoukro", "Tengrela", "Boundiali", "Danane", "Touba",
+    "Sassandra", "Lakota", "Oume", "Bingerville", "Jacqueville", "Bongouanou", "Zuenoula", "Vavoua",
+    "Mankono", "Beoumi", "Sakassou", "M'Bahiakro", "Tabou", "Meagui", "Bangolo", "Biankouma", "Bouna",
+    "Tanda", "Agnibilekrou", "Grand-Lahou", "Akoupe", "Alepe", "Tiebissou", "Didievi", "Fresco",
+]
+QUARTIERS = ["Nord", "Sud", "Est", "Ouest", "Centre", "Plateau", "Commerce", "Residentiel"]
+GARES = ["Gare routiere", "Gare UTB", "Gare STIF", "Gare AVS", "Gare Sabe", "Gare CTE"]
+
+
+@dataclass(frozen=True)
+class Echelle:
+    villes: int
+    arrets_par_ville: int
+    trips: int
+    departs_par_trip: int
+    bus: int
+    utilisateurs: int
+    reservations: int
+
+
+ECHELLES = {
+    "petite": Echelle(30, 2, 300, 4, 150, 1_000, 50_000),
+    "moyenne": Echelle(200, 3, 2_000, 5, 1_500, 20_000, 500_000),
+    "grande": Echelle(400, 3, 5_000, 6, 5_000, 100_000, 3_000_000),
+}
+
+
+def _nom_ville(rang):
+    nom = VILLES[rang % len(VILLES)]
+    tour = rang // len(VILLES)
+    if tour == 0:
+        return nom
+    if tour <= len(QUARTIERS):
+        return f"{nom} {QUARTIERS[tour - 1]}"
+    return f"{nom} {tour}"
+
+
+def _distance_km(a, b):
+    """Distance routiere approchee : grand cercle majore de 25 %."""
+    lat_a, lon_a, lat_b, lon_b = map(math.radians, (a.latitude, a.longitude, b.latitude, b.longitude))
+    arc = math.sin((lat_b - lat_a) / 2) ** 2 + math.cos(lat_a) * math.cos(lat_b) * math.sin((lon_b - lon_a) / 2) ** 2
+    return max(5, 1.25 * 6371 * 2 * math.asin(math.sqrt(arc)))
+
+
+def _par_lots(objets, taille_lot, modele):
+    for debut in range(0, len(objets), taille_lot):
+        modele.objects.bulk_create(objets[debut:debut + taille_lot])
+    return objets
+
+
+def generer(echelle, graine=42, taille_lot=TAILLE_LOT, progression=None):
+    """Cree le jeu de donnees ; retourne {modele: nombre de lignes creees}."""
+    hasard = random.Random(graine)
+    progression = progression or (lambda message: None)
+    aujourd_hui = timezone.localdate()
+    crees = {}
+
+    villes = _par_lots(
+        [Ville(nom=_nom_ville(rang), code=f"{PREFIXE}{rang:05d}") for rang in range(echelle.villes)],
+        taille_lot,
+        Ville,
+    )
+    arrets = []
+    for ville in villes:
+        latitude, longitude = hasard.uniform(4.4, 10.5), hasard.uniform(-8.5, -2.6)
+        for rang in range(echelle.arrets_par_ville):
+            arrets.append(
+                Arret(
+                    ville=ville,
+                    nom=f"{GARES[rang % len(GARES)]} {ville.nom}",
+                    adresse=f"{ville.nom}, Cote d'Ivoire",
+                    latitude=Decimal(f"{latitude + hasard.uniform(-0.05, 0.05):.6f}"),
+                    longitude=Decimal(f"{longitude + hasard.uniform(-0.05, 0.05):.6f}"),
+                )
+            )
+    _par_lots(arrets, taille_lot, Arret)
+    crees["villes"], crees["arrets"] = len(villes), len(arrets)
+    progression(f"{len(villes)} villes, {len(arrets)} arrets")
+
+    segments = {}
+
+    def segment(depart, arrivee):
+        if (depart.pk, arrivee.pk) not in segments:
+            distance = _distance_km(depart, arrivee)
+            segments[depart.pk, arrivee.pk] = Segment(
+                arret_depart=depart,
+                arret_arrivee=arrivee,
+                distance_km=Decimal(f"{distance:.2f}"),
+                duree_minutes=int(distance / 60 * 60) + 15,
+            )
+        return segments[depart.pk, arrivee.pk]
+
+    categorie = get_default_category_pk()
+    trips, parcours = [], []
+    for rang in range(echelle.trips):
+        origine, destination = hasard.sample(arrets, 2)
+        while origine.ville_id == destination.ville_id:
+            destination = hasard.choice(arrets)
+        etapes = [origine, destination]
+        if hasard.random() < 0.2:
+            etapes.insert(1, hasard.choice(arrets))
+        troncons = [segment(a, b) for a, b in zip(etapes, etapes[1:]) if a.pk != b.pk]
+        distance = sum(troncon.distance_km for troncon in troncons)
+        trips.append(
+            Trip(
+                nom=f"{origine.ville.nom} - {destination.ville.nom}"[:100],
+                category_id=categorie,
+                ville_depart=origine.ville,
+                ville_arrivee=destination.ville,
+                arret_depart=origine,
+                arret_arrivee=destination,
+                price=(distance * 25).quantize(Decimal("1")),
+                code_gtfs=f"{PREFIXE}-{rang}",
+            )
+        )
+        parcours.append(troncons)
+    _par_lots(list(segments.values()), taille_lot, Segment)
+    _par_lots(trips, taille_lot, Trip)
+    _par_lots(
+        [
+            EtapeTrajet(trip=trip, segment=troncon, ordre=ordre)
+            for trip, troncons in zip(trips, parcours)
+            for ordre, troncon in enumerate(troncons, start=1)
+        ],
+        taille_lot,
+        EtapeTrajet,
+    )
+    crees["segments"], crees["trips"] = len(segments), len(trips)
+    progression(f"{len(trips)} trajets, {len(segments)} segments")
+
+    bus = _par_lots(
+        [
+            Bus(
+                immatriculation=f"{PREFIXE}-{rang:05d}-CI",
+                modele=hasard.choice(["Higer KLQ6129", "Yutong ZK6122", "Mercedes Tourismo", "King Long XMQ6127"]),
+                capacite=hasard.choice([50, 60, 70]),
+                categorie_id=categorie,
+                derniere_revision=aujourd_hui - timedelta(days=hasard.randint(0, 150)),
+            )
+            for rang in range(echelle.bus)
+        ],
+        taille_lot,
+        Bus,
+    )
+    week_end = Calendrier.objects.create(
+        nom=f"{PREFIXE} Week-end", lundi=False, mardi=False, mercredi=False, jeudi=False, vendredi=False
+    )
+    departs = []
+    for trip, troncons in zip(trips, parcours):
+        duree = sum(troncon.duree_minutes for troncon in troncons)
+        for _ in range(echelle.departs_par_trip):
+            debut = hasard.randint(4 * 60, max(4 * 60, 23 * 60 - duree)) // 15 * 15
+            fin = min(debut + duree, 23 * 60 + 59)
+            departs.append(
+                Depart(
+                    trip=trip,
+                    bus=hasard.choice(bus),
+                    heure_depart=time(debut // 60, debut % 60),
+                    heure_arrivee=time(fin // 60, fin % 60),
+                    prix=trip.price,
+                    calendrier=week_end if hasard.random() < 0.1 else None,
+                )
+            )
+    _par_lots(departs, taille_lot, Depart)
+    crees["bus"], crees["departs"] = len(bus), len(departs)
+    progression(f"{len(bus)} bus, {len(departs)} departs")
+
+    User = get_user_model()
+    mot_de_passe = make_password(MOT_DE_PASSE)
+    User.objects.create(
+        username=f"{PREFIXE_UTILISATEUR}staff", email="staff@bench.gareci.ci", password=mot_de_passe, is_staff=True
+    )
+    utilisateurs = _par_lots(
+        [
+            User(
+                username=f"{PREFIXE_UTILISATEUR}{rang:06d}",
+                email=f"voyageur{rang}@bench.gareci.ci",
+                password=mot_de_passe,
+            )
+            for rang in range(echelle.utilisateurs)
+        ],
+        taille_lot,
+        User,
+    )
+    crees["utilisateurs"] = len(utilisateurs) + 1
+    progression(f"{crees['utilisateurs']} utilisateurs")
+
+    crees["reservations"] = crees["paiements"] = 0
+    for debut in range(0, echelle.reservations, taille_lot):
+        lot = []
+        for rang in range(debut, min(debut + taille_lot, echelle.reservations)):
+            depart = hasard.choice(departs)
+            jour = aujourd_hui + timedelta(days=hasard.randint(-180, 30))
+            statuts = (
+                [ReservationStatus.CONFIRMEE, ReservationStatus.ANNULEE]
+                if jour < aujourd_hui
+                else [ReservationStatus.CONFIRMEE, ReservationStatus.EN_ATTENTE, ReservationStatus.ANNULEE]
+            )
+            places = hasard.choice([1, 1, 1, 2, 2, 3, 4])
+            lot.append(
+                Reservation(
+                    utilisateur=hasard.choice(utilisateurs),
+                    depart=depart,
+                    date_voyage=jour,
+                    reference=f"{PREFIXE}{rang:010d}",
+                    nombre_places=places,
+                    prix_total=depart.prix * places,
+                    statut=hasard.choices(statuts, weights=[7, 2, 1][: len(statuts)])[0],
+                )
+            )
+        with transaction.atomic():
+            Reservation.objects.bulk_create(lot)
+            paiements = [
+                Paiement(
+                    reservation=reservation,
+                    montant=reservation.prix_total,
+                    statut=Paiement.Statut.REUSSI,
+                    reference_paiement=f"PAY-{reservation.reference}",
+                )
+                for reservation in lot
+                if reservation.statut == ReservationStatus.CONFIRMEE
+            ]
+            Paiement.objects.bulk_create(paiements)
+        crees["reservations"] += len(lot)
+        crees["paiements"] += len(paiements)
+        progression(f"{crees['reservations']}/{echelle.reservations} reservations")
+
+    # bulk_create n'emet pas les signaux qui tiennent les compteurs a jour.
+    DashboardStats.recalculer()
+    return crees
+
+
+def reinitialiser(taille_lot=TAILLE_LOT):
+    """Supprime les donnees generees (et uniquement elles) ; retourne le nombre de reservations."""
+    with conserver_compteurs():
+        total = purger(Reservation.objects.filter(reference__startswith=PREFIXE), taille_lot=taille_lot)
+    Depart.objects.filter(trip__code_gtfs__startswith=f"{PREFIXE}-").delete()
+    Trip.objects.filter(code_gtfs__startswith=f"{PREFIXE}-").delete()
+    Ville.objects.filter(code__startswith=PREFIXE).delete()
+    Bus.objects.filter(immatriculation__startswith=f"{PREFIXE}-").delete()
+    Calendrier.objects.filter(nom__startswith=f"{PREFIXE} ").delete()
+    get_user_model().objects.filter(username__startswith=PREFIXE_UTILISATEUR).delete()
+    DashboardStats.recalculer()
+    return total
+
+
+def volumetrie():
+    return {
+        "villes": Ville.objects.count(),
+        "trips": Trip.objects.count(),
+        "departs": Depart.objects.count(),
+        "utilisateurs": get_user_model().objects.count(),
+        "reservations": Reservation.objects.count(),
+    }
+
+
+@dataclass
+class Mesure:
+    iterations: int
+    min_ms: float
+    mediane_ms: float
+    p95_ms: float
+    max_ms: float
+    requetes_sql: int
+
+
+class Contexte:
+    """Donnees representatives choisies dans le jeu genere, et clients connectes."""
+
+    def __init__(self):
+        User = get_user_model()
+        self.jour = timezone.localdate() + timedelta(days=2)
+        self.depart = (
+            Depart.objects.circulant_le(self.jour).exploitables(self.jour)
+            .filter(actif=True, trip__code_gtfs__startswith=f"{PREFIXE}-")
+            .annotate(nb=Count("reservations")).order_by("-nb").select_related("trip__arret_depart__ville",
+                                                                               "trip__arret_arrivee__ville")
+            .first()
+        )
+        if self.depart is None:
+            raise LookupError("Aucun depart genere : lancez d'abord manage.py seed_benchmark.")
+        self.billet = (
+            Reservation.objects.filter(
+                statut=ReservationStatus.CONFIRMEE, utilisateur__username__startswith=PREFIXE_UTILISATEUR
+            ).select_related("utilisateur").order_by("-date_voyage").first()
+        )
+        # Voyageur sans reservation : le quota par client ne fausse pas les mesures d'achat.
+        self.voyageur, _ = User.objects.get_or_create(
+            username=f"{PREFIXE_UTILISATEUR}mesure", defaults={"email": "mesure@bench.gareci.ci"}
+        )
+        self.client_voyageur = Client()
+        self.client_voyageur.force_login(self.voyageur)
+        self.client_titulaire = Client()
+        self.client_titulaire.force_login(self.billet.utilisateur)
+        self.client_staff = Client()
+        self.client_staff.force_login(User.objects.get(username=f"{PREFIXE_UTILISATEUR}staff"))
+
+    @contextmanager
+    def annule(self):
+        """Transaction annulee en sortie : les scenarios d'ecriture ne laissent aucune trace."""
+        with transaction.atomic():
+            yield
+            transaction.set_rollback(True)
+
+
+def _ok(response):
+    if response.status_code >= 400:
+        raise AssertionError(f"HTTP {response.status_code} sur {response.request['PATH_INFO']}")
+
+
+def _recherche(contexte, chrono):
+    trip = contexte.depart.trip
+    parametres = {
+        "ville_depart": trip.arret_depart.ville.nom,
+        "ville_arrivee": trip.arret_arrivee.ville.nom,
+        "date": contexte.jour.isoformat(),
+    }
+    with chrono():
+        _ok(contexte.client_voyageur.get(reverse("trips:search_results"), parametres))
+
+
+def _reservation(contexte, chrono):
+    url = reverse("reservations:reserve", args=[contexte.depart.pk, contexte.jour.isoformat()])
+    with contexte.annule(), chrono():
+        _ok(contexte.client_voyageur.post(url, {"nombre_places": 1}))
+
+
+def _paiement(contexte, chrono):
+    with contexte.annule():
+        reservation = ReservationService.creer(contexte.depart.pk, contexte.jour, contexte.voyageur, 1)
+        Paiement.objects.create(reservation=reservation, montant=reservation.prix_total)
+        url = reverse("reservations:traiter_paiement", args=[reservation.pk])
+        with chrono():
+            _ok(contexte.client_voyageur.post(url, {"action": "payer"}))
+
+
+def _tableau_de_bord(contexte, chrono):
+    with chrono():
+        _ok(contexte.client_staff.get(reverse("dashboard:index")))
+
+
+def _liste_departs(contexte, chrono):
+    with chrono():
+        _ok(contexte.client_staff.get(reverse("dashboard:depart_list")))
+
+
+def _billet(contexte, chrono):
+    url = reverse("reservations:telecharger_billet", args=[contexte.billet.pk])
+    with chrono():
+        _ok(contexte.client_titulaire.get(url))
+
+
+SCENARIOS = {
+    "recherche": _recherche,
+    "reservation": _reservation,
+    "paiement": _paiement,
+    "tableau_de_bord": _tableau_de_bord,
+    "liste_departs": _liste_departs,
+    "billet": _billet,
+}
+
+
+def _mesurer_scenario(scenario, contexte, iterations, echauffement):
+    durees, requetes = [], []
+
+    @contextmanager
+    def chrono():
+        journal = JournalSQL()
+        debut = perf_counter()
+        with journal.capturer():
+            yield
+        durees.append((perf_counter() - debut) * 1000)
+        requetes.append(len(journal))
+
+    for _ in range(echauffement):
+        scenario(contexte, chrono)
+    durees.clear()
+    requetes.clear()
+    for _ in range(iterations):
+        scenario(contexte, chrono)
+
+    ordonnees = sorted(durees)
+    return Mesure(
+        iterations=iterations,
+        min_ms=round(ordonnees[0], 2),
+        mediane_ms=round(statistics.median(ordonnees), 2),
+        p95_ms=round(ordonnees[min(len(ordonnees) - 1, math.ceil(0.95 * len(ordonnees)) - 1)], 2),
+        max_ms=round(ordonnees[-1], 2),
+        requetes_sql=max(requetes),
+    )
+
+
+def mesurer(noms=None, iterations=20, echauffement=2):
+    """{scenario: Mesure ou {"erreur": ...}} ; les e-mails partent dans une boite locale."""
+    resultats = {}
+    with override_settings(
+        EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+        ALLOWED_HOSTS=["testserver"],
+        SQL_INSTRUMENTATION=False,
+    ):
+        contexte = Contexte()
+        for nom in noms or SCENARIOS:
+            try:
+                resultats[nom] = asdict(_mesurer_scenario(SCENARIOS[nom], contexte, iterations, echauffement))
+            except Exception as erreur:
+                resultats[nom] = {"erreur": f"{type(erreur).__name__}: {erreur}"}
+    return resultats
+
+
+def comparer(actuels, precedents, seuil=0.2):
+    """[(scenario, mediane precedente, mediane actuelle, ratio)] des scenarios ralentis de plus de `seuil`."""
+    regressions = []
+    for nom, mesure in actuels.items():
+        ancienne = precedents.get(nom, {})
+        if "mediane_ms" not in mesure or not ancienne.get("mediane_ms"):
+            continue
+        ratio = mesure["mediane_ms"] / ancienne["mediane_ms"]
+        if ratio > 1 + seuil:
+            regressions.append((nom, ancienne["mediane_ms"], mesure["mediane_ms"], ratio))
+    return regressions
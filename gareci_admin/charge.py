@@ -0,0 +1,295 @@
+"""Generateur de charge asyncio pour le parcours de reservation.
+
+Chaque voyageur virtuel se connecte puis enchaine recherche -> reservation
+-> paiement -> billet contre un serveur en marche, sur quelques departs
+partages pour provoquer la contention. Le client HTTP/1.1 minimal ci-dessous
+(bibliotheque standard uniquement) garde une connexion et ses cookies par
+voyageur. Les comptes `charge_NNNN` et les verifications de surreservation
+passent par l'ORM : la commande doit viser la base du serveur teste.
+"""
+import asyncio
+import math
+import random
+import re
+import ssl
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+
+from reservations.models import Reservation, ReservationStatus
+from trips.models import Depart
+
+PREFIXE_UTILISATEUR = "charge_"
+MOT_DE_PASSE = "charge-gareci"
+ETAPES = ["connexion", "recherche", "reservation", "paiement", "billet"]
+
+_CSRF = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+_PAIEMENT = re.compile(r"/reservations/paiement/(\d+)/")
+
+
+class ErreurHTTP(Exception):
+    pass
+
+
+class ClientHTTP:
+    """Une connexion keep-alive et un pot a cookies ; rouverte si le serveur la ferme."""
+
+    def __init__(self, base, delai):
+        adresse = urlsplit(base)
+        self.hote = adresse.hostname
+        self.port = adresse.port or (443 if adresse.scheme == "https" else 80)
+        self.ssl = ssl.create_default_context() if adresse.scheme == "https" else None
+        self.schema = adresse.scheme
+        self.entete_hote = adresse.netloc
+        self.delai = delai
+        self.cookies = {}
+        self._flux = None
+
+    async def fermer(self):
+        if self._flux:
+            self._flux[1].close()
+            self._flux = None
+
+    async def requete(self, methode, chemin, donnees=None):
+        reutilisee = self._flux is not None
+        try:
+            return await asyncio.wait_for(self._requete(methode, chemin, donnees), self.delai)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            # Seule une connexion keep-alive inactive fermee par le serveur est reessayee :
+            # rejouer un POST sur une connexion neuve pourrait reserver deux fois.
+            await self.fermer()
+            if not reutilisee:
+                raise
+            return await asyncio.wait_for(self._requete(methode, chemin, donnees), self.delai)
+
+    async def _requete(self, methode, chemin, donnees):
+        if self._flux is None:
+            self._flux = await asyncio.open_connection(self.hote, self.port, ssl=self.ssl)
+        lecteur, ecrivain = self._flux
+        corps = urlencode(donnees).encode() if donnees is not None else b""
+        entetes = [
+            f"{methode} {chemin} HTTP/1.1",
+            f"Host: {self.entete_hote}",
+            "Connection: keep-alive",
+            f"Content-Length: {len(corps)}",
+        ]
+        if donnees is not None:
+            entetes.append("Content-Type: application/x-www-form-urlencoded")
+            entetes.append(f"Referer: {self.schema}://{self.entete_hote}{chemin}")
+            if "csrftoken" in self.cookies:
+                entetes.append(f"X-CSRFToken: {self.cookies['csrftoken']}")
+        if self.cookies:
+            entetes.append("Cookie: " + "; ".join(f"{nom}={valeur}" for nom, valeur in self.cookies.items()))
+        ecrivain.write(("\r\n".join(entetes) + "\r\n\r\n").encode() + corps)
+        await ecrivain.drain()
+
+        ligne = await lecteur.readuntil(b"\r\n")
+        statut = int(ligne.split()[1])
+        reponse = {}
+        while (ligne := await lecteur.readuntil(b"\r\n")) != b"\r\n":
+            nom, _, valeur = ligne.decode("latin-1").partition(":")
+            nom, valeur = nom.strip().lower(), valeur.strip()
+            if nom == "set-cookie":
+                for morsel in SimpleCookie(valeur).values():
+                    self.cookies[morsel.key] = morsel.value
+            reponse[nom] = valeur
+
+        if reponse.get("transfer-encoding", "").lower() == "chunked":
+            contenu = b""
+            while (taille := int((await lecteur.readuntil(b"\r\n")).split(b";")[0], 16)) > 0:
+                contenu += await lecteur.readexactly(taille)
+                await lecteur.readexactly(2)
+            await lecteur.readuntil(b"\r\n")
+        elif "content-length" in reponse:
+            contenu = await lecteur.readexactly(int(reponse["content-length"]))
+        else:
+            contenu = await lecteur.read()
+            reponse["connection"] = "close"
+        if reponse.get("connection", "").lower() == "close":
+            await self.fermer()
+        return statut, reponse, contenu.decode("utf-8", "replace")
+
+
+@dataclass
+class Cible:
+    depart_id: int
+    ville_depart: str
+    ville_arrivee: str
+
+
+@dataclass
+class Resultats:
+    latences: dict = field(default_factory=lambda: defaultdict(list))
+    issues: Counter = field(default_factory=Counter)
+    erreurs_5xx: Counter = field(default_factory=Counter)
+    delais_depasses: Counter = field(default_factory=Counter)
+    exemples_erreurs: list = field(default_factory=list)
+    parcours: int = 0
+    debut: float = 0.0
+    fin: float = 0.0
+
+    @property
+    def duree(self):
+        return self.fin - self.debut
+
+    @property
+    def requetes(self):
+        return sum(len(valeurs) for valeurs in self.latences.values())
+
+    def percentile(self, etape, rang):
+        valeurs = sorted(self.latences[etape])
+        if not valeurs:
+            return None
+        return valeurs[max(0, math.ceil(rang / 100 * len(valeurs)) - 1)]
+
+
+async def _appel(client, methode, chemin, donnees=None):
+    statut, entetes, corps = await client.requete(methode, chemin, donnees)
+    if statut >= 500:
+        # Verrou non obtenu (SQLite "database is locked", lock_timeout PostgreSQL) ou panne.
+        raise ErreurHTTP(f"HTTP {statut} sur {methode} {chemin}")
+    return statut, entetes, corps
+
+
+async def _formulaire(client, chemin, donnees):
+    """GET du formulaire (jeton CSRF) puis POST ; retourne (statut, en-tetes) du POST."""
+    _, _, page = await _appel(client, "GET", chemin)
+    jeton = _CSRF.search(page)
+    statut, entetes, _ = await _appel(
+        client, "POST", chemin, {**donnees, "csrfmiddlewaretoken": jeton.group(1) if jeton else ""}
+    )
+    return statut, entetes
+
+
+async def _etape(resultats, etape, appel):
+    """Chronometre une etape complete (toutes ses requetes HTTP)."""
+    debut = time.perf_counter()
+    try:
+        resultat = await appel
+    except asyncio.TimeoutError:
+        resultats.delais_depasses[etape] += 1
+        raise ErreurHTTP(f"{etape} : delai depasse")
+    except ErreurHTTP:
+        resultats.erreurs_5xx[etape] += 1
+        raise
+    resultats.latences[etape].append((time.perf_counter() - debut) * 1000)
+    return resultat
+
+
+async def _payer(client, reservation_id):
+    _, _, page = await _appel(client, "GET", reverse("reservations:paiement", args=[reservation_id]))
+    jeton = _CSRF.search(page)
+    return await _appel(
+        client,
+        "POST",
+        reverse("reservations:traiter_paiement", args=[reservation_id]),
+        {"action": "payer", "csrfmiddlewaretoken": jeton.group(1) if jeton else ""},
+    )
+
+
+async def voyageur(rang, base, cibles, jour, iterations, resultats, delai, pause, hasard):
+    client = ClientHTTP(base, delai)
+    try:
+        statut, _ = await _etape(
+            resultats,
+            "connexion",
+            _formulaire(
+                client,
+                reverse("accounts:login"),
+                {"username": f"{PREFIXE_UTILISATEUR}{rang:04d}", "password": MOT_DE_PASSE},
+            ),
+        )
+        if statut != 302:
+            resultats.issues["connexion_refusee"] += 1
+            return
+
+        for _ in range(iterations):
+            cible = hasard.choice(cibles)
+            recherche = reverse("trips:search_results") + "?" + urlencode(
+                {"ville_depart": cible.ville_depart, "ville_arrivee": cible.ville_arrivee, "date": jour.isoformat()}
+            )
+            await _etape(resultats, "recherche", _appel(client, "GET", recherche))
+
+            url_reserver = reverse("reservations:reserve", args=[cible.depart_id, jour.isoformat()])
+            statut, entetes = await _etape(
+                resultats, "reservation", _formulaire(client, url_reserver, {"nombre_places": hasard.choice([1, 1, 2, 3])})
+            )
+            paiement = _PAIEMENT.search(entetes.get("location", "")) if statut == 302 else None
+            if paiement is None:
+                resultats.issues["reservation_refusee"] += 1
+                continue
+            reservation_id = int(paiement.group(1))
+
+            await _etape(resultats, "paiement", _payer(client, reservation_id))
+            url_billet = reverse("reservations:telecharger_billet", args=[reservation_id])
+            await _etape(resultats, "billet", _appel(client, "GET", url_billet))
+            resultats.issues["parcours_complet"] += 1
+            resultats.parcours += 1
+            if pause:
+                await asyncio.sleep(hasard.uniform(0, 2 * pause))
+    except (ErreurHTTP, OSError) as erreur:
+        resultats.issues["abandon"] += 1
+        if len(resultats.exemples_erreurs) < 5:
+            resultats.exemples_erreurs.append(f"{type(erreur).__name__}: {erreur}")
+    finally:
+        await client.fermer()
+
+
+async def lancer(base, cibles, jour, nombre, iterations, delai=30, montee=0, pause=0, graine=None):
+    resultats = Resultats(debut=time.perf_counter())
+
+    async def demarrer(rang):
+        if montee:
+            await asyncio.sleep(montee * rang / nombre)
+        await voyageur(rang, base, cibles, jour, iterations, resultats, delai, pause, random.Random(
+            None if graine is None else graine + rang
+        ))
+
+    await asyncio.gather(*(demarrer(rang) for rang in range(nombre)))
+    resultats.fin = time.perf_counter()
+    return resultats
+
+
+def preparer_voyageurs(nombre):
+    """Cree les comptes charge_NNNN manquants et annule leurs reservations actives (quota par client)."""
+    User = get_user_model()
+    for rang in range(nombre):
+        utilisateur, cree = User.objects.get_or_create(
+            username=f"{PREFIXE_UTILISATEUR}{rang:04d}", defaults={"email": f"charge{rang}@charge.gareci.ci"}
+        )
+        if cree:
+            utilisateur.set_password(MOT_DE_PASSE)
+            utilisateur.save(update_fields=["password"])
+    actives = Reservation.objects.filter(
+        utilisateur__username__startswith=PREFIXE_UTILISATEUR,
+        statut__in=[ReservationStatus.EN_ATTENTE, ReservationStatus.CONFIRMEE],
+    )
+    for reservation in actives:
+        reservation.annuler()
+
+
+def choisir_cibles(jour, nombre):
+    departs = (
+        Depart.objects.circulant_le(jour).exploitables(jour).filter(actif=True)
+        .select_related("trip__arret_depart__ville", "trip__arret_arrivee__ville")
+        .order_by("?")[:nombre]
+    )
+    return [
+        Cible(depart.pk, depart.trip.arret_depart.ville.nom, depart.trip.arret_arrivee.ville.nom) for depart in departs
+    ]
+
+
+def surreservations(cibles, jour):
+    """[(depart_id, places reservees, capacite)] des cibles vendues au-dela de la capacite du bus."""
+    departs = (
+        Depart.objects.filter(pk__in=[cible.depart_id for cible in cibles])
+        .avec_places_pour(jour)
+        .filter(places_disponibles__lt=0)
+        .values_list("pk", "places_reservees", "bus__capacite")
+    )
+    return list(departs)
@@ -1,8 +1,16 @@
+from datetime import timedelta
+
 from django import forms
 from django.forms import BaseInlineFormSet, inlineformset_factory
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from reservations.exports import FORMATS
+from reservations.models import ContactMessage, ReservationStatus
+from trips.models import JOURS_SEMAINE, Arret, Bus, Calendrier, Category, Depart, EtapeTrajet, ExceptionCalendrier, Segment, Trip, Ville
+from trips.services import conflits_bus, temps_retournement
 
-from reservations.models import ContactMessage
-from trips.models import Arret, Depart, EtapeTrajet, Segment, Trip, Ville
+from .analytique import AXES_REPARTITION, CRITERES_TOP
 
 
 class ContactReplyForm(forms.ModelForm):
@@ -30,6 +38,11 @@ class TripAdminForm(forms.ModelForm):
             "actif",
         ]
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for champ in ("arret_depart", "arret_arrivee"):
+            self.fields[champ].queryset = Arret.objects.select_related("ville")
+
     def save(self, commit=True):
         trip = super().save(commit=False)
         # Keep legacy columns in sync with the modern route fields.
@@ -43,6 +56,16 @@ class TripAdminForm(forms.ModelForm):
 
 
 class BaseEtapeTrajetInlineFormSet(BaseInlineFormSet):
+    @cached_property
+    def choix_segments(self):
+        # Lus une fois pour toutes les lignes du formset (et la ligne vide).
+        segments = Segment.objects.select_related("arret_depart__ville", "arret_arrivee__ville")
+        return [("", "---------"), *((segment.pk, str(segment)) for segment in segments)]
+
+    def add_fields(self, form, index):
+        super().add_fields(form, index)
+        form.fields["segment"].choices = self.choix_segments
+
     def _get_active_forms(self):
         active_forms = []
         for form in self.forms:
@@ -130,7 +153,7 @@ class VilleForm(forms.ModelForm):
 class ArretForm(forms.ModelForm):
     class Meta:
         model = Arret
-        fields = ["ville", "nom", "adresse"]
+        fields = ["ville", "nom", "adresse", "latitude", "longitude"]
 
 
 class SegmentForm(forms.ModelForm):
@@ -138,6 +161,11 @@ class SegmentForm(forms.ModelForm):
         model = Segment
         fields = ["arret_depart", "arret_arrivee", "distance_km", "duree_minutes"]
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for champ in ("arret_depart", "arret_arrivee"):
+            self.fields[champ].queryset = Arret.objects.select_related("ville")
+
     def clean(self):
         cleaned_data = super().clean()
         if cleaned_data.get("arret_depart") == cleaned_data.get("arret_arrivee"):
@@ -153,6 +181,7 @@ class DepartForm(forms.ModelForm):
             "bus",
             "heure_depart",
             "heure_arrivee",
+            "calendrier",
             "actif",
         ]
         widgets = {
@@ -173,6 +202,26 @@ class DepartForm(forms.ModelForm):
 
         if h_depart and h_arrivee and h_arrivee <= h_depart:
             raise forms.ValidationError("L'heure d'arrivee doit etre apres l'heure de depart.")
+
+        bus = cleaned.get("bus")
+        if bus and h_depart and h_arrivee and cleaned.get("actif"):
+            candidat = Depart(
+                pk=self.instance.pk,
+                bus=bus,
+                heure_depart=h_depart,
+                heure_arrivee=h_arrivee,
+                calendrier=cleaned.get("calendrier"),
+            )
+            conflits = conflits_bus(candidat)
+            if conflits:
+                self.add_error("bus", forms.ValidationError(
+                    f"Le bus {bus} est deja engage (retournement de {temps_retournement()} min compris) : "
+                    + ", ".join(
+                        f"{conflit['trip__nom']} {conflit['heure_depart']:%H:%M}-{conflit['heure_arrivee']:%H:%M}"
+                        for conflit in conflits
+                    )
+                    + "."
+                ))
         return cleaned
 
     def save(self, commit=True):
@@ -182,3 +231,106 @@ class DepartForm(forms.ModelForm):
         if commit:
             depart.save()
         return depart
+
+
+class CalendrierForm(forms.ModelForm):
+    class Meta:
+        model = Calendrier
+        fields = ["nom", *JOURS_SEMAINE, "date_debut", "date_fin"]
+        widgets = {
+            "date_debut": forms.DateInput(attrs={"type": "date"}, format="%Y-%m-%d"),
+            "date_fin": forms.DateInput(attrs={"type": "date"}, format="%Y-%m-%d"),
+        }
+
+    def clean(self):
+        cleaned = super().clean()
+        if not any(cleaned.get(jour) for jour in JOURS_SEMAINE):
+            raise forms.ValidationError("Selectionnez au moins un jour de circulation.")
+        debut, fin = cleaned.get("date_debut"), cleaned.get("date_fin")
+        if debut and fin and fin < debut:
+            raise forms.ValidationError("La fin de validite doit suivre le debut.")
+        return cleaned
+
+
+ExceptionCalendrierFormSet = inlineformset_factory(
+    Calendrier,
+    ExceptionCalendrier,
+    fields=("date", "type"),
+    widgets={"date": forms.DateInput(attrs={"type": "date"}, format="%Y-%m-%d")},
+    extra=3,
+    can_delete=True,
+)
+
+
+class GenerationDepartsForm(forms.Form):
+    trip = forms.ModelChoiceField(queryset=Trip.objects.filter(actif=True), label="Trajet")
+    bus = forms.ModelChoiceField(queryset=Bus.objects.filter(en_service=True))
+    calendrier = forms.ModelChoiceField(
+        queryset=Calendrier.objects.all(),
+        required=False,
+        help_text="Vide : les departs circulent tous les jours.",
+    )
+    premier_depart = forms.TimeField(widget=forms.TimeInput(attrs={"type": "time"}, format="%H:%M"))
+    dernier_depart = forms.TimeField(widget=forms.TimeInput(attrs={"type": "time"}, format="%H:%M"))
+    frequence_minutes = forms.IntegerField(min_value=5, max_value=24 * 60, initial=60)
+    duree_minutes = forms.IntegerField(
+        min_value=1,
+        required=False,
+        help_text="Vide : duree totale des etapes du trajet.",
+    )
+    desactiver_absents = forms.BooleanField(
+        required=False,
+        label="Desactiver les departs du trajet absents de la grille",
+    )
+
+    def clean(self):
+        cleaned = super().clean()
+        premier, dernier = cleaned.get("premier_depart"), cleaned.get("dernier_depart")
+        if premier and dernier and dernier < premier:
+            raise forms.ValidationError("Le dernier depart doit suivre le premier.")
+        trip = cleaned.get("trip")
+        if trip and not cleaned.get("duree_minutes"):
+            cleaned["duree_minutes"] = trip.duree_totale
+            if not cleaned["duree_minutes"]:
+                raise forms.ValidationError("Ce trajet n'a pas d'etapes : indiquez la duree.")
+        return cleaned
+
+
+class ExportReservationsForm(forms.Form):
+    format = forms.ChoiceField(choices=[(nom, nom.upper()) for nom in FORMATS], required=False)
+    du = forms.DateField(required=False)
+    au = forms.DateField(required=False)
+    trajet = forms.ModelChoiceField(queryset=Trip.objects.all(), required=False)
+    statut = forms.ChoiceField(choices=[("", "Tous")] + ReservationStatus.choices, required=False)
+
+    def clean(self):
+        cleaned = super().clean()
+        du = cleaned.get("du")
+        au = cleaned.get("au")
+        if du and au and du > au:
+            raise forms.ValidationError("La date de debut doit preceder la date de fin.")
+        return cleaned
+
+
+class AnalytiqueForm(forms.Form):
+    du = forms.DateField(required=False)
+    au = forms.DateField(required=False)
+    trajet = forms.ModelChoiceField(queryset=Trip.objects.all(), required=False)
+    categorie = forms.ModelChoiceField(queryset=Category.objects.all(), required=False)
+    max_points = forms.IntegerField(min_value=2, max_value=1000, required=False)
+    n = forms.IntegerField(min_value=1, max_value=100, required=False)
+    critere = forms.ChoiceField(choices=[(c, c) for c in CRITERES_TOP], required=False)
+    axe = forms.ChoiceField(choices=[(a, a) for a in AXES_REPARTITION], required=False)
+
+    def clean(self):
+        cleaned = super().clean()
+        au = cleaned.get("au") or timezone.localdate()
+        du = cleaned.get("du") or au - timedelta(days=29)
+        if du > au:
+            raise forms.ValidationError("La date de debut doit preceder la date de fin.")
+        cleaned["du"], cleaned["au"] = du, au
+        cleaned["max_points"] = cleaned.get("max_points") or 120
+        cleaned["n"] = cleaned.get("n") or 10
+        cleaned["critere"] = cleaned.get("critere") or "recettes"
+        cleaned["axe"] = cleaned.get("axe") or "trajet"
+        return cleaned
@@ -0,0 +1,85 @@
+import json
+import subprocess
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from gareci_admin import benchmark
+from gareci_project.base_de_donnees import description
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=settings.BASE_DIR, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+class Command(BaseCommand):
+    help = (
+        "Chronometre recherche, reservation, paiement, tableau de bord, liste des departs et billet "
+        "sur le jeu de seed_benchmark ; ecrit les resultats en JSON et signale les regressions. "
+        "La base mesuree est celle des reglages (BASE_MOTEUR=postgresql pour PostgreSQL)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scenario", action="append", choices=sorted(benchmark.SCENARIOS), dest="scenarios")
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument("--echauffement", type=int, default=2)
+        parser.add_argument("--sortie", help="Fichier JSON (defaut : benchmarks/<date>-<commit>.json).")
+        parser.add_argument("--comparer", help="Resultats precedents (JSON) auxquels comparer les medianes.")
+        parser.add_argument("--seuil", type=float, default=0.2, help="Ralentissement tolere (0.2 = +20 %%).")
+        parser.add_argument(
+            "--echouer-si-regression", action="store_true", help="Code de sortie non nul en cas de regression."
+        )
+
+    def handle(self, *args, **options):
+        try:
+            resultats = benchmark.mesurer(options["scenarios"], options["iterations"], options["echauffement"])
+        except LookupError as e:
+            raise CommandError(str(e))
+
+        commit = _commit()
+        rapport = {
+            "date": timezone.now().isoformat(),
+            "commit": commit,
+            "base": description(connection),
+            "volumetrie": benchmark.volumetrie(),
+            "scenarios": resultats,
+        }
+        sortie = Path(
+            options["sortie"]
+            or Path(settings.BASE_DIR) / "benchmarks" / f"{timezone.now():%Y%m%d-%H%M%S}-{commit or 'local'}.json"
+        )
+        sortie.parent.mkdir(parents=True, exist_ok=True)
+        sortie.write_text(json.dumps(rapport, indent=2))
+
+        for nom, mesure in resultats.items():
+            if "erreur" in mesure:
+                self.stdout.write(self.style.ERROR(f"{nom:<16} {mesure['erreur']}"))
+            else:
+                self.stdout.write(
+                    f"{nom:<16} mediane {mesure['mediane_ms']:>8.1f} ms  p95 {mesure['p95_ms']:>8.1f} ms  "
+                    f"{mesure['requetes_sql']:>4} requetes SQL"
+                )
+        self.stdout.write(self.style.SUCCESS(f"Resultats ecrits dans {sortie}"))
+
+        if options["comparer"]:
+            precedent = json.loads(Path(options["comparer"]).read_text())
+            moteur = precedent.get("base", {}).get("moteur")
+            if moteur and moteur != rapport["base"]["moteur"]:
+                self.stdout.write(
+                    self.style.WARNING(f"Comparaison entre moteurs differents : {moteur} -> {rapport['base']['moteur']}.")
+                )
+            regressions = benchmark.comparer(resultats, precedent["scenarios"], options["seuil"])
+            for nom, avant, apres, ratio in regressions:
+                self.stdout.write(self.style.WARNING(f"Regression {nom} : {avant:.1f} ms -> {apres:.1f} ms (x{ratio:.2f})"))
+            if regressions and options["echouer_si_regression"]:
+                raise CommandError(f"{len(regressions)} scenario(s) en regression.")
+            if not regressions:
+                self.stdout.write("Aucune regression au-dela du seuil.")
@@ -0,0 +1,27 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from gareci_admin.models import OccupationJournaliere, PolitiqueReservation
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconsolide les cumuls quotidiens d'occupation (a lancer chaque nuit). "
+        "Par defaut : d'hier jusqu'a l'horizon de reservation de la politique active."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--du", type=date.fromisoformat, help="Premiere date de voyage (AAAA-MM-JJ).")
+        parser.add_argument("--au", type=date.fromisoformat, help="Derniere date de voyage (AAAA-MM-JJ).")
+
+    def handle(self, *args, **options):
+        aujourd_hui = timezone.localdate()
+        du = options["du"] or aujourd_hui - timedelta(days=1)
+        au = options["au"] or aujourd_hui + timedelta(days=PolitiqueReservation.get_active().delai_max_avant_depart)
+        if du > au:
+            raise CommandError("--du doit preceder --au.")
+
+        total = OccupationJournaliere.consolider(du, au)
+        self.stdout.write(self.style.SUCCESS(f"{total} ligne(s) d'occupation consolidee(s) du {du} au {au}."))
@@ -0,0 +1,77 @@
+import asyncio
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from gareci_admin import charge
+
+
+class Command(BaseCommand):
+    help = (
+        "Simule N voyageurs concurrents (recherche -> reservation -> paiement -> billet) contre un "
+        "serveur en marche ; affiche debit, latences p50/p95/p99 par etape, surreservations et verrous."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000", help="Adresse du serveur teste.")
+        parser.add_argument("--voyageurs", type=int, default=50)
+        parser.add_argument("--iterations", type=int, default=3, help="Parcours par voyageur (quota : 5 actifs).")
+        parser.add_argument("--departs", type=int, default=3, help="Nombre de departs disputes.")
+        parser.add_argument("--jours", type=int, default=2, help="Date de voyage : aujourd'hui + N jours.")
+        parser.add_argument("--montee", type=float, default=0, help="Secondes pour demarrer tous les voyageurs.")
+        parser.add_argument("--pause", type=float, default=0, help="Pause moyenne entre deux parcours (s).")
+        parser.add_argument("--delai", type=float, default=30, help="Delai maximal d'une requete (s).")
+        parser.add_argument("--graine", type=int)
+
+    def handle(self, *args, **options):
+        jour = timezone.localdate() + timedelta(days=options["jours"])
+        cibles = charge.choisir_cibles(jour, options["departs"])
+        if not cibles:
+            raise CommandError(f"Aucun depart exploitable le {jour:%d/%m/%Y}.")
+        charge.preparer_voyageurs(options["voyageurs"])
+
+        self.stdout.write(
+            f"{options['voyageurs']} voyageurs x {options['iterations']} parcours sur {len(cibles)} depart(s) "
+            f"le {jour:%d/%m/%Y} contre {options['url']}"
+        )
+        resultats = asyncio.run(
+            charge.lancer(
+                options["url"],
+                cibles,
+                jour,
+                options["voyageurs"],
+                options["iterations"],
+                delai=options["delai"],
+                montee=options["montee"],
+                pause=options["pause"],
+                graine=options["graine"],
+            )
+        )
+
+        self.stdout.write(
+            f"\nDuree {resultats.duree:.1f} s : {resultats.parcours} parcours complets "
+            f"({resultats.parcours / resultats.duree:.2f}/s), {resultats.requetes} etapes "
+            f"({resultats.requetes / resultats.duree:.1f}/s)"
+        )
+        self.stdout.write(f"{'etape':<12} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'5xx':>5} {'delai':>6}")
+        for etape in charge.ETAPES:
+            mesures = [resultats.percentile(etape, rang) for rang in (50, 95, 99)]
+            colonnes = " ".join(f"{m:>9.1f}" if m is not None else f"{'-':>9}" for m in mesures)
+            self.stdout.write(
+                f"{etape:<12} {len(resultats.latences[etape]):>6} {colonnes} "
+                f"{resultats.erreurs_5xx[etape]:>5} {resultats.delais_depasses[etape]:>6}"
+            )
+        for issue, nombre in sorted(resultats.issues.items()):
+            self.stdout.write(f"  {issue} : {nombre}")
+        for exemple in resultats.exemples_erreurs:
+            self.stdout.write(self.style.WARNING(f"  {exemple}"))
+
+        verrous = resultats.erreurs_5xx["reservation"] + resultats.erreurs_5xx["paiement"]
+        self.stdout.write(f"Verrous non obtenus (5xx en ecriture) : {verrous}")
+        depassements = charge.surreservations(cibles, jour)
+        for depart_id, reservees, capacite in depassements:
+            self.stdout.write(self.style.ERROR(f"Surreservation depart #{depart_id} : {reservees}/{capacite} places"))
+        if depassements:
+            raise CommandError(f"{len(depassements)} depart(s) surreserve(s).")
+        self.stdout.write(self.style.SUCCESS("Aucune surreservation."))
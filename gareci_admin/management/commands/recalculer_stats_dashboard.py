@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from gareci_admin.models import DashboardStats, StatistiqueJournaliere
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcule entierement l'instantane des statistiques du tableau de bord "
+        "(a planifier periodiquement, ex. cron nocturne, pour corriger la derive)."
+    )
+
+    def handle(self, *args, **options):
+        stats = DashboardStats.recalculer()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Statistiques recalculees : {stats.total_reservations} reservation(s), "
+                f"{StatistiqueJournaliere.objects.count()} jour(s)."
+            )
+        )
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from gareci_admin.services import ConformitePermisService
+
+
+class Command(BaseCommand):
+    help = (
+        "Signale les departs dont un conducteur affecte a un permis expirant bientot "
+        "(a lancer chaque jour) et envoie un recapitulatif par email."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--jours",
+            type=int,
+            help="Horizon d'expiration en jours (defaut : CONDUCTEUR_ALERTE_PERMIS_JOURS).",
+        )
+        parser.add_argument("--sans-email", action="store_true", help="Met a jour les alertes sans notifier.")
+
+    def handle(self, *args, **options):
+        lignes = ConformitePermisService.scanner(jours=options["jours"])
+        ouvertes, levees = ConformitePermisService.signaler(lignes)
+        conducteurs = {ligne["conducteur_id"] for ligne in lignes}
+        self.stdout.write(
+            f"{len(conducteurs)} conducteur(s) concerne(s), {ouvertes} alerte(s) ouverte(s), {levees} levee(s)."
+        )
+        if not options["sans_email"]:
+            envoyes = ConformitePermisService.notifier(lignes)
+            self.stdout.write(self.style.SUCCESS(f"{envoyes} email(s) envoye(s)."))
@@ -0,0 +1,49 @@
+from dataclasses import replace
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gareci_admin import benchmark
+from trips.models import Ville
+
+
+class Command(BaseCommand):
+    help = (
+        "Genere un reseau ivoirien synthetique (villes, trajets, departs, voyageurs, "
+        "reservations) pour mesurer les performances a grande echelle."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--echelle", choices=sorted(benchmark.ECHELLES), default="petite")
+        parser.add_argument("--reservations", type=int, help="Remplace le nombre de reservations de l'echelle.")
+        parser.add_argument("--graine", type=int, default=42, help="Graine aleatoire (jeu reproductible).")
+        parser.add_argument("--taille-lot", type=int, default=benchmark.TAILLE_LOT)
+        parser.add_argument(
+            "--reinitialiser", action="store_true", help="Supprime d'abord les donnees generees precedemment."
+        )
+        parser.add_argument("--supprimer", action="store_true", help="Supprime les donnees generees et s'arrete.")
+
+    def handle(self, *args, **options):
+        existant = Ville.objects.filter(code__startswith=benchmark.PREFIXE).exists()
+        if options["reinitialiser"] or options["supprimer"]:
+            total = benchmark.reinitialiser(taille_lot=options["taille_lot"])
+            self.stdout.write(f"Donnees de benchmark supprimees ({total} reservation(s)).")
+            if options["supprimer"]:
+                return
+        elif existant:
+            raise CommandError("Des donnees de benchmark existent deja : relancez avec --reinitialiser.")
+
+        echelle = benchmark.ECHELLES[options["echelle"]]
+        if options["reservations"] is not None:
+            echelle = replace(echelle, reservations=options["reservations"])
+        crees = benchmark.generer(
+            echelle,
+            graine=options["graine"],
+            taille_lot=options["taille_lot"],
+            progression=lambda message: self.stdout.write(f"  {message}"),
+        )
+        resume = ", ".join(f"{nombre} {modele}" for modele, nombre in crees.items())
+        self.stdout.write(self.style.SUCCESS(f"Jeu de donnees '{options['echelle']}' genere : {resume}."))
+        self.stdout.write(
+            f"Comptes : {benchmark.PREFIXE_UTILISATEUR}staff / {benchmark.PREFIXE_UTILISATEUR}000000..., "
+            f"mot de passe '{benchmark.MOT_DE_PASSE}'."
+        )
@@ -0,0 +1,69 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Simule une replication asynchrone entre fichiers SQLite : copie le primaire, "
+        "attend --delai secondes puis ecrase les repliques avec cette copie, en boucle. "
+        "Les repliques ont donc toujours entre --delai et deux fois --delai de retard."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--delai", type=float, default=2.0, help="Retard de replication, en secondes (2 par defaut).")
+        parser.add_argument("--une-fois", action="store_true", help="Un seul cycle copie -> attente -> restauration.")
+        parser.add_argument("--primaire", help="Fichier primaire (defaut : NAME de la base `default`).")
+        parser.add_argument(
+            "--replique", action="append", dest="repliques",
+            help="Fichier replique, repetable (defaut : repliques SQLite de REPLIQUES_LECTURE).",
+        )
+
+    def handle(self, *args, **options):
+        if options["delai"] < 0:
+            raise CommandError("--delai doit etre positif.")
+        primaire = options["primaire"] or self._fichier("default")
+        repliques = options["repliques"] or [
+            self._fichier(alias) for alias in getattr(settings, "REPLIQUES_LECTURE", [])
+        ]
+        if not repliques:
+            raise CommandError("Aucune replique : definir BASE_REPLIQUES ou passer --replique.")
+        if str(primaire) in map(str, repliques):
+            raise CommandError("Une replique ne peut pas etre le fichier primaire.")
+
+        self.stdout.write(f"Replication {primaire} -> {', '.join(map(str, repliques))}, retard {options['delai']} s.")
+        try:
+            while True:
+                self._cycle(primaire, repliques, options["delai"])
+                if options["une_fois"]:
+                    break
+        except KeyboardInterrupt:
+            pass
+
+    def _fichier(self, alias):
+        reglages = settings.DATABASES.get(alias)
+        if reglages is None or reglages["ENGINE"] != "django.db.backends.sqlite3":
+            raise CommandError(f"La base {alias!r} n'est pas un fichier SQLite : passer --primaire/--replique.")
+        return reglages["NAME"]
+
+    def _cycle(self, primaire, repliques, delai):
+        copie = sqlite3.connect(":memory:")
+        try:
+            source = sqlite3.connect(primaire)
+            try:
+                # API de sauvegarde : copie coherente meme pendant des ecritures.
+                source.backup(copie)
+            finally:
+                source.close()
+            time.sleep(delai)
+            for replique in repliques:
+                cible = sqlite3.connect(replique)
+                try:
+                    copie.backup(cible)
+                finally:
+                    cible.close()
+        finally:
+            copie.close()
+        self.stdout.write(f"{time.strftime('%H:%M:%S')} repliques a jour (etat d'il y a {delai} s).")
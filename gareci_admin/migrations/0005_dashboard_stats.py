@@ -0,0 +1,51 @@
+# Generated by Django 5.2.4 on 2026-10-19 16:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gareci_admin', '0004_affectation_depart_model'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_reservations', models.IntegerField(default=0)),
+                ('reservations_en_attente', models.IntegerField(default=0)),
+                ('reservations_confirmees', models.IntegerField(default=0)),
+                ('reservations_annulees', models.IntegerField(default=0)),
+                ('recettes', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('paiements_reussis', models.IntegerField(default=0)),
+                ('paiements_echoues', models.IntegerField(default=0)),
+                ('total_utilisateurs', models.IntegerField(default=0)),
+                ('departs_actifs', models.IntegerField(default=0)),
+                ('recalcule_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Statistiques du tableau de bord',
+                'verbose_name_plural': 'Statistiques du tableau de bord',
+            },
+        ),
+        migrations.CreateModel(
+            name='StatistiqueJournaliere',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('nb_reservations', models.IntegerField(default=0)),
+                ('nb_confirmees', models.IntegerField(default=0)),
+                ('nb_annulees', models.IntegerField(default=0)),
+                ('places', models.IntegerField(default=0)),
+                ('recettes', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'verbose_name': 'Statistique journalière',
+                'verbose_name_plural': 'Statistiques journalières',
+                'ordering': ['-date'],
+            },
+        ),
+    ]
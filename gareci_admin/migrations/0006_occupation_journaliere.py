@@ -0,0 +1,37 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gareci_admin', '0005_dashboard_stats'),
+        ('trips', '0010_depart_permanent_simple'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OccupationJournaliere',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('heure_depart', models.TimeField()),
+                ('capacite', models.PositiveIntegerField(default=0)),
+                ('places_vendues', models.IntegerField(default=0, help_text='Places en attente ou confirmées')),
+                ('recettes', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('annulations', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('categorie', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='occupations', to='trips.category')),
+                ('depart', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occupations', to='trips.depart')),
+                ('trip', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occupations', to='trips.trip')),
+            ],
+            options={
+                'verbose_name': 'Occupation journalière',
+                'verbose_name_plural': 'Occupations journalières',
+                'indexes': [models.Index(fields=['date', 'trip'], name='occupation_date_trip_idx')],
+                'constraints': [models.UniqueConstraint(fields=('date', 'depart'), name='occupation_unique_date_depart')],
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("gareci_admin", "0006_occupation_journaliere"),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[],
+            state_operations=[
+                migrations.AddField(
+                    model_name="conducteur",
+                    name="actif",
+                    field=models.BooleanField(default=True, editable=False),
+                ),
+            ],
+        ),
+    ]
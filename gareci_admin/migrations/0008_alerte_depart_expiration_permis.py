@@ -0,0 +1,48 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gareci_admin', '0007_state_add_legacy_conducteur_actif'),
+        ('trips', '0013_bus_echeance_revision'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlerteDepart',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('PERMIS', 'Permis conducteur')], max_length=10)),
+                ('message', models.CharField(max_length=255)),
+                ('echeance', models.DateField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('resolue_le', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Alerte départ',
+                'verbose_name_plural': 'Alertes départs',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='conducteur',
+            index=models.Index(fields=['date_expiration_permis'], name='conducteur_expiration_idx'),
+        ),
+        migrations.AddField(
+            model_name='alertedepart',
+            name='conducteur',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='alertes', to='gareci_admin.conducteur'),
+        ),
+        migrations.AddField(
+            model_name='alertedepart',
+            name='depart',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alertes', to='trips.depart'),
+        ),
+        migrations.AddConstraint(
+            model_name='alertedepart',
+            constraint=models.UniqueConstraint(fields=('type', 'depart', 'conducteur'), name='alerte_unique_type_depart_conducteur'),
+        ),
+    ]
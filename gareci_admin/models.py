@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from django.db import models
 
@@ -25,10 +25,15 @@ class Conducteur(models.Model):
 	date_expiration_permis = models.DateField(null=True, blank=True)
 	statut = models.CharField(max_length=10, choices=STATUT, default='ACTIF')
 	photo = models.ImageField(upload_to='conducteurs/', null=True, blank=True)
+	# Legacy column still present in DB (NOT NULL) ; le statut fait foi.
+	actif = models.BooleanField(default=True, editable=False)
 
 	class Meta:
 		verbose_name = 'Conducteur'
 		verbose_name_plural = 'Conducteurs'
+		indexes = [
+			models.Index(fields=['date_expiration_permis'], name='conducteur_expiration_idx'),
+		]
 
 	def __str__(self):
 		return f"{self.prenom} {self.nom}"
@@ -41,7 +46,7 @@ class Conducteur(models.Model):
 
 	@property
 	def disponible(self):
-		# Simple check: disponible si statut ACTIF (affectations gérées ailleurs)
+		# Statut seulement : les conflits d'horaires sont verifies par AffectationService.
 		return self.statut == 'ACTIF'
 
 
@@ -62,6 +67,42 @@ class AffectationConducteur(models.Model):
 	def __str__(self):
 		return f"{self.departure} - {self.conducteur} ({self.role})"
 
+	def clean(self):
+		# Chevauchements, repos minimum et limite de conduite journaliere.
+		from .services import AffectationService
+
+		if self.conducteur_id and self.departure_id:
+			AffectationService.verifier(self.conducteur, self.departure, exclure=self.pk)
+
+
+class AlerteDepart(models.Model):
+	"""Anomalie signalee sur un depart au tableau de bord d'exploitation.
+
+	Creee et levee par les scans planifies (`manage.py scanner_permis`) :
+	une alerte par (type, depart, conducteur), rouverte si l'anomalie revient.
+	"""
+	TYPE = [
+		('PERMIS', 'Permis conducteur'),
+	]
+
+	type = models.CharField(max_length=10, choices=TYPE)
+	depart = models.ForeignKey('trips.Depart', on_delete=models.CASCADE, related_name='alertes')
+	conducteur = models.ForeignKey(Conducteur, on_delete=models.CASCADE, null=True, blank=True, related_name='alertes')
+	message = models.CharField(max_length=255)
+	echeance = models.DateField(null=True, blank=True)
+	created_at = models.DateTimeField(auto_now_add=True)
+	resolue_le = models.DateTimeField(null=True, blank=True)
+
+	class Meta:
+		verbose_name = 'Alerte départ'
+		verbose_name_plural = 'Alertes départs'
+		constraints = [
+			models.UniqueConstraint(fields=['type', 'depart', 'conducteur'], name='alerte_unique_type_depart_conducteur'),
+		]
+
+	def __str__(self):
+		return f"{self.get_type_display()} — {self.depart} : {self.message}"
+
 
 
 class Gare(models.Model):
@@ -105,3 +146,233 @@ class PolitiqueReservation(models.Model):
 		# create default policy if none
 		return cls.objects.create()
 
+
+
+class DashboardStats(models.Model):
+	"""Singleton: instantané des compteurs du tableau de bord.
+
+	Maintenu de façon incrémentale par les signaux (voir signals.py) et
+	recalculé périodiquement par `manage.py recalculer_stats_dashboard`
+	pour corriger toute dérive.
+	"""
+	total_reservations = models.IntegerField(default=0)
+	reservations_en_attente = models.IntegerField(default=0)
+	reservations_confirmees = models.IntegerField(default=0)
+	reservations_annulees = models.IntegerField(default=0)
+	recettes = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+	paiements_reussis = models.IntegerField(default=0)
+	paiements_echoues = models.IntegerField(default=0)
+	total_utilisateurs = models.IntegerField(default=0)
+	departs_actifs = models.IntegerField(default=0)
+	recalcule_at = models.DateTimeField(null=True, blank=True)
+	updated_at = models.DateTimeField(auto_now=True)
+
+	class Meta:
+		verbose_name = 'Statistiques du tableau de bord'
+		verbose_name_plural = 'Statistiques du tableau de bord'
+
+	def __str__(self):
+		return f"Statistiques ({self.updated_at:%d/%m/%Y %H:%M})"
+
+	@classmethod
+	def get_courant(cls):
+		obj = cls.objects.filter(pk=1).first()
+		if obj:
+			return obj
+		return cls.recalculer()
+
+	@classmethod
+	def recalculer(cls):
+		"""Recalcul complet depuis les tables sources (quelques agrégats)."""
+		from django.contrib.auth import get_user_model
+		from django.db.models import Count, Q, Sum
+		from django.db.models.functions import TruncDate
+		from reservations.models import ArchivedReservation, Paiement, Reservation, ReservationStatus
+		from trips.models import Depart
+
+		# Les reservations archivees restent comptees : l'archivage deplace, il ne supprime pas.
+		sources = (Reservation.objects.all(), ArchivedReservation.objects.all())
+		par_statut = {}
+		for source in sources:
+			agregat = source.aggregate(
+				total=Count('id'),
+				en_attente=Count('id', filter=Q(statut=ReservationStatus.EN_ATTENTE)),
+				confirmees=Count('id', filter=Q(statut=ReservationStatus.CONFIRMEE)),
+				annulees=Count('id', filter=Q(statut=ReservationStatus.ANNULEE)),
+				recettes=Sum('prix_total', filter=Q(statut=ReservationStatus.CONFIRMEE)),
+			)
+			for cle, valeur in agregat.items():
+				par_statut[cle] = par_statut.get(cle, 0) + (valeur or 0)
+		paiements = Paiement.objects.aggregate(
+			reussis=Count('id', filter=Q(statut=Paiement.Statut.REUSSI)),
+			echoues=Count('id', filter=Q(statut=Paiement.Statut.ECHOUE)),
+		)
+		paiements_archives = ArchivedReservation.objects.aggregate(
+			reussis=Count('id', filter=Q(paiement_statut=Paiement.Statut.REUSSI)),
+			echoues=Count('id', filter=Q(paiement_statut=Paiement.Statut.ECHOUE)),
+		)
+		valeurs = {
+			'total_reservations': par_statut['total'],
+			'reservations_en_attente': par_statut['en_attente'],
+			'reservations_confirmees': par_statut['confirmees'],
+			'reservations_annulees': par_statut['annulees'],
+			'recettes': par_statut['recettes'],
+			'paiements_reussis': paiements['reussis'] + paiements_archives['reussis'],
+			'paiements_echoues': paiements['echoues'] + paiements_archives['echoues'],
+			'total_utilisateurs': get_user_model().objects.count(),
+			'departs_actifs': Depart.objects.filter(actif=True).count(),
+			'recalcule_at': timezone.now(),
+		}
+		obj, _ = cls.objects.update_or_create(pk=1, defaults=valeurs)
+
+		par_jour = {}
+		for source in sources:
+			jours = (
+				source.annotate(jour=TruncDate('created_at'))
+				.values('jour')
+				.annotate(
+					nb_reservations=Count('id'),
+					nb_confirmees=Count('id', filter=Q(statut=ReservationStatus.CONFIRMEE)),
+					nb_annulees=Count('id', filter=Q(statut=ReservationStatus.ANNULEE)),
+					places=Sum('nombre_places'),
+					recettes=Sum('prix_total', filter=Q(statut=ReservationStatus.CONFIRMEE)),
+				)
+				.order_by()
+			)
+			for jour in jours:
+				cumul = par_jour.setdefault(jour.pop('jour'), {})
+				for cle, valeur in jour.items():
+					cumul[cle] = cumul.get(cle, 0) + (valeur or 0)
+		lignes = [
+			StatistiqueJournaliere(date=jour, **cumul)
+			for jour, cumul in par_jour.items()
+		]
+		with transaction.atomic():
+			StatistiqueJournaliere.objects.all().delete()
+			StatistiqueJournaliere.objects.bulk_create(lignes, batch_size=500)
+		return obj
+
+
+class StatistiqueJournaliere(models.Model):
+	"""Cumul par jour de création des réservations (alimente le tableau de bord)."""
+	date = models.DateField(unique=True)
+	nb_reservations = models.IntegerField(default=0)
+	nb_confirmees = models.IntegerField(default=0)
+	nb_annulees = models.IntegerField(default=0)
+	places = models.IntegerField(default=0)
+	recettes = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+	class Meta:
+		verbose_name = 'Statistique journalière'
+		verbose_name_plural = 'Statistiques journalières'
+		ordering = ['-date']
+
+	def __str__(self):
+		return f"{self.date:%d/%m/%Y} ({self.nb_reservations} réservations)"
+
+
+class OccupationJournaliere(models.Model):
+	"""Cumul quotidien par départ (date de voyage) : remplissage et recettes.
+
+	Mis à jour de façon incrémentale par les signaux de réservation et
+	reconsolidé chaque nuit par `manage.py consolider_occupation`.
+	"""
+	date = models.DateField()
+	trip = models.ForeignKey('trips.Trip', on_delete=models.CASCADE, related_name='occupations')
+	depart = models.ForeignKey('trips.Depart', on_delete=models.CASCADE, related_name='occupations')
+	categorie = models.ForeignKey('trips.Category', on_delete=models.SET_NULL, null=True, blank=True, related_name='occupations')
+	heure_depart = models.TimeField()
+	capacite = models.PositiveIntegerField(default=0)
+	places_vendues = models.IntegerField(default=0, help_text='Places en attente ou confirmées')
+	recettes = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+	annulations = models.IntegerField(default=0)
+	updated_at = models.DateTimeField(auto_now=True)
+
+	class Meta:
+		verbose_name = 'Occupation journalière'
+		verbose_name_plural = 'Occupations journalières'
+		constraints = [
+			models.UniqueConstraint(fields=['date', 'depart'], name='occupation_unique_date_depart'),
+		]
+		indexes = [
+			models.Index(fields=['date', 'trip'], name='occupation_date_trip_idx'),
+		]
+
+	def __str__(self):
+		return f"{self.depart} — {self.date:%d/%m/%Y} ({self.places_vendues}/{self.capacite})"
+
+	@classmethod
+	def depuis_depart(cls, depart, date, **valeurs):
+		return cls(
+			date=date,
+			depart=depart,
+			trip_id=depart.trip_id,
+			categorie_id=depart.bus.categorie_id,
+			heure_depart=depart.heure_depart,
+			capacite=depart.bus.capacite,
+			**valeurs,
+		)
+
+	@classmethod
+	def consolider(cls, du, au, departs=None):
+		"""Recalcule les lignes [du, au] : un agrégat GROUP BY puis un upsert par jour."""
+		from datetime import timedelta
+		from django.db.models import Count, Q, Sum
+		from reservations.models import Reservation, ReservationStatus
+		from trips.models import Depart
+
+		reservations = Reservation.objects.filter(date_voyage__range=(du, au))
+		if departs is not None:
+			reservations = reservations.filter(depart__in=departs)
+		agregats = {
+			(ligne['date_voyage'], ligne['depart_id']): ligne
+			for ligne in reservations.values('date_voyage', 'depart_id').annotate(
+				places=Sum('nombre_places', filter=Q(statut__in=[ReservationStatus.EN_ATTENTE, ReservationStatus.CONFIRMEE])),
+				montant=Sum('prix_total', filter=Q(statut=ReservationStatus.CONFIRMEE)),
+				nb_annulations=Count('id', filter=Q(statut=ReservationStatus.ANNULEE)),
+			)
+		}
+
+		departs_qs = Depart.objects.select_related('bus')
+		if departs is not None:
+			departs_qs = departs_qs.filter(pk__in=departs)
+		else:
+			departs_qs = departs_qs.filter(Q(actif=True) | Q(pk__in={depart_id for _, depart_id in agregats}))
+		departs_list = list(departs_qs)
+
+		total = 0
+		jour = du
+		while jour <= au:
+			# Capacite offerte seulement les jours ou le depart circule avec un bus exploitable.
+			en_service = Depart.objects.circulant_le(jour).exploitables(jour).filter(actif=True)
+			if departs is not None:
+				en_service = en_service.filter(pk__in=departs)
+			en_service = set(en_service.values_list('pk', flat=True))
+			lignes = []
+			for depart in departs_list:
+				agregat = agregats.get((jour, depart.pk))
+				if agregat is None and depart.pk not in en_service:
+					continue
+				agregat = agregat or {}
+				lignes.append(cls.depuis_depart(
+					depart,
+					jour,
+					places_vendues=agregat.get('places') or 0,
+					recettes=agregat.get('montant') or 0,
+					annulations=agregat.get('nb_annulations') or 0,
+				))
+			cls.objects.bulk_create(
+				lignes,
+				batch_size=1000,
+				update_conflicts=True,
+				unique_fields=['date', 'depart'],
+				update_fields=['trip', 'categorie', 'heure_depart', 'capacite', 'places_vendues', 'recettes', 'annulations', 'updated_at'],
+			)
+			# Lignes d'une consolidation anterieure pour un jour sans circulation.
+			perimees = cls.objects.filter(date=jour).exclude(depart_id__in=[ligne.depart_id for ligne in lignes])
+			if departs is not None:
+				perimees = perimees.filter(depart__in=departs)
+			perimees.delete()
+			total += len(lignes)
+			jour += timedelta(days=1)
+		return total
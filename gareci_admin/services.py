@@ -0,0 +1,297 @@
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.mail import get_connection, send_mail, send_mass_mail
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from trips.intervalles import (
+    CHAMPS_DEPART,
+    IndexIntervalles,
+    creneaux,
+    creneaux_depart,
+    duree_minutes,
+    periodes_chevauchent,
+)
+from trips.models import JOURS_SEMAINE
+
+from .models import AffectationConducteur, AlerteDepart, Conducteur
+
+CHAMPS_AFFECTATION = [f"departure__{champ}" for champ in CHAMPS_DEPART]
+
+
+def _repos_minimum():
+    return getattr(settings, "CONDUCTEUR_REPOS_MIN_MINUTES", 60)
+
+
+def _conduite_max_par_jour():
+    return getattr(settings, "CONDUCTEUR_CONDUITE_MAX_MINUTES_JOUR", 9 * 60)
+
+
+def _delai_alerte_permis():
+    return getattr(settings, "CONDUCTEUR_ALERTE_PERMIS_JOURS", 30)
+
+
+def _destinataires_conformite():
+    destinataires = getattr(settings, "CONFORMITE_EMAILS", None)
+    if destinataires:
+        return list(destinataires)
+    return [email for _, email in getattr(settings, "ADMINS", ())]
+
+
+class PlanningConducteur:
+    """Index des creneaux hebdomadaires d'un conducteur et temps de conduite par jour."""
+
+    def __init__(self):
+        self.index = IndexIntervalles()
+        self.departs = set()
+
+    def ajouter(self, ligne, depart_id, prefixe="departure__"):
+        self.departs.add(depart_id)
+        for creneau in creneaux(ligne, prefixe=prefixe, valeur=depart_id):
+            self.index.ajouter(creneau)
+
+    def conduite_par_jour(self, periode):
+        """Minutes de conduite par jour de la semaine, sur les calendriers compatibles avec `periode`."""
+        totaux = Counter()
+        for creneau in self.index:
+            if creneau.jour is not None and periodes_chevauchent(creneau.periode, periode):
+                totaux[creneau.jour] += creneau.fin - creneau.debut
+        return totaux
+
+    def problemes(self, depart):
+        """Messages expliquant pourquoi `depart` ne peut pas s'ajouter a ce planning."""
+        if depart.pk in self.departs:
+            return ["Le conducteur est deja affecte a ce depart."]
+
+        repos = _repos_minimum()
+        candidats = creneaux_depart(depart)
+        messages = []
+        for creneau in candidats:
+            for existant in self.index.chevauchements(creneau, marge=repos):
+                if existant.fin > creneau.debut and existant.debut < creneau.fin:
+                    messages.append(f"Chevauchement avec le depart #{existant.valeur}.")
+                else:
+                    messages.append(f"Moins de {repos} min de repos avec le depart #{existant.valeur}.")
+                break
+            if messages:
+                break
+
+        if candidats:
+            limite = _conduite_max_par_jour()
+            duree = duree_minutes(depart.heure_depart, depart.heure_arrivee)
+            totaux = self.conduite_par_jour(candidats[0].periode)
+            for creneau in candidats:
+                if creneau.jour is not None and totaux[creneau.jour] + duree > limite:
+                    messages.append(
+                        f"Limite de conduite de {limite} min depassee le {JOURS_SEMAINE[creneau.jour]}."
+                    )
+                    break
+        return messages
+
+
+class AffectationService:
+    @staticmethod
+    def planning(conducteur_id, exclure=None):
+        planning = PlanningConducteur()
+        affectations = AffectationConducteur.objects.filter(
+            conducteur_id=conducteur_id,
+            departure__actif=True,
+        )
+        if exclure is not None:
+            affectations = affectations.exclude(pk=exclure)
+        for ligne in affectations.values("departure_id", *CHAMPS_AFFECTATION):
+            planning.ajouter(ligne, ligne["departure_id"])
+        return planning
+
+    @staticmethod
+    def verifier(conducteur, depart, exclure=None):
+        if not conducteur.disponible:
+            raise ValidationError(f"{conducteur} n'est pas disponible ({conducteur.get_statut_display()}).")
+        if not conducteur.permis_valide:
+            raise ValidationError(f"Le permis de {conducteur} est expire ou non renseigne.")
+        problemes = AffectationService.planning(conducteur.pk, exclure=exclure).problemes(depart)
+        if problemes:
+            raise ValidationError(problemes)
+
+    @staticmethod
+    @transaction.atomic
+    def affecter(conducteur, depart, role="PRINCIPAL"):
+        # Verrouille le conducteur : deux affectations simultanees sont verifiees l'une apres l'autre.
+        conducteur = Conducteur.objects.select_for_update().get(pk=conducteur.pk)
+        AffectationService.verifier(conducteur, depart)
+        return AffectationConducteur.objects.create(conducteur=conducteur, departure=depart, role=role)
+
+    @staticmethod
+    def suggerer(depart, limite=10):
+        """
+        Conducteurs actifs, permis valide, pouvant prendre `depart` : une requete
+        (jointure gauche sur leurs affectations) puis un balayage en memoire.
+        Les moins charges sur les jours du depart viennent en premier.
+        """
+        lignes = (
+            Conducteur.objects.filter(statut="ACTIF", date_expiration_permis__gte=timezone.localdate())
+            .order_by("nom", "prenom", "pk")
+            .values(
+                "pk",
+                "nom",
+                "prenom",
+                "telephone",
+                "affectations__departure_id",
+                "affectations__departure__actif",
+                *(f"affectations__{champ}" for champ in CHAMPS_AFFECTATION),
+            )
+        )
+        conducteurs, plannings = {}, defaultdict(PlanningConducteur)
+        for ligne in lignes:
+            conducteurs.setdefault(ligne["pk"], ligne)
+            if ligne["affectations__departure__actif"]:
+                plannings[ligne["pk"]].ajouter(
+                    ligne, ligne["affectations__departure_id"], prefixe="affectations__departure__"
+                )
+
+        candidats = creneaux_depart(depart)
+        jours = {creneau.jour for creneau in candidats if creneau.jour is not None}
+        periode = candidats[0].periode if candidats else (None, None)
+        suggestions = []
+        for pk, ligne in conducteurs.items():
+            planning = plannings[pk]
+            if planning.problemes(depart):
+                continue
+            totaux = planning.conduite_par_jour(periode)
+            suggestions.append({
+                "id": pk,
+                "nom": ligne["nom"],
+                "prenom": ligne["prenom"],
+                "telephone": ligne["telephone"],
+                "charge_minutes": max((totaux[jour] for jour in jours), default=0),
+            })
+        suggestions.sort(key=lambda suggestion: suggestion["charge_minutes"])
+        return suggestions[:limite]
+
+
+class ConformitePermisService:
+    """Scan planifie des permis qui expirent avant la fin des departs affectes."""
+
+    @staticmethod
+    def scanner(jours=None, aujourd_hui=None):
+        """
+        Affectations a des departs actifs encore en circulation dont le
+        conducteur a un permis expirant sous `jours` jours (ou deja expire) :
+        une requete, filtree par l'index sur date_expiration_permis.
+        """
+        aujourd_hui = aujourd_hui or timezone.localdate()
+        jours = _delai_alerte_permis() if jours is None else jours
+        return list(
+            AffectationConducteur.objects.filter(
+                conducteur__date_expiration_permis__lte=aujourd_hui + timedelta(days=jours),
+                departure__actif=True,
+            )
+            .filter(
+                Q(departure__calendrier__isnull=True)
+                | Q(departure__calendrier__date_fin__isnull=True)
+                | Q(departure__calendrier__date_fin__gte=aujourd_hui)
+            )
+            .order_by("conducteur__date_expiration_permis", "conducteur_id", "departure__heure_depart")
+            .values(
+                "conducteur_id",
+                "conducteur__nom",
+                "conducteur__prenom",
+                "conducteur__email",
+                "conducteur__date_expiration_permis",
+                "departure_id",
+                "departure__heure_depart",
+                "departure__trip__nom",
+            )
+        )
+
+    @staticmethod
+    @transaction.atomic
+    def signaler(lignes, aujourd_hui=None):
+        """
+        Ouvre (ou rouvre) une alerte PERMIS par affectation signalee et leve
+        celles qui ne le sont plus. Retourne (alertes ouvertes, alertes levees).
+        """
+        aujourd_hui = aujourd_hui or timezone.localdate()
+        alertes = []
+        for ligne in lignes:
+            expiration = ligne["conducteur__date_expiration_permis"]
+            alertes.append(AlerteDepart(
+                type="PERMIS",
+                depart_id=ligne["departure_id"],
+                conducteur_id=ligne["conducteur_id"],
+                message=(
+                    f"Permis de {ligne['conducteur__prenom']} {ligne['conducteur__nom']} "
+                    f"{'expire' if expiration < aujourd_hui else 'expirant'} le {expiration:%d/%m/%Y}"
+                ),
+                echeance=expiration,
+                resolue_le=None,
+            ))
+        AlerteDepart.objects.bulk_create(
+            alertes,
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=["type", "depart", "conducteur"],
+            update_fields=["message", "echeance", "resolue_le"],
+        )
+        signalees = {(ligne["departure_id"], ligne["conducteur_id"]) for ligne in lignes}
+        levees = [
+            pk
+            for pk, depart_id, conducteur_id in AlerteDepart.objects.filter(
+                type="PERMIS", resolue_le__isnull=True,
+            ).values_list("pk", "depart_id", "conducteur_id")
+            if (depart_id, conducteur_id) not in signalees
+        ]
+        AlerteDepart.objects.filter(pk__in=levees).update(resolue_le=timezone.now())
+        return len(alertes), len(levees)
+
+    @staticmethod
+    def notifier(lignes):
+        """
+        Un recapitulatif aux destinataires de conformite, puis un rappel par
+        conducteur ayant un email, envoyes sur une seule connexion.
+        """
+        if not lignes:
+            return 0
+        par_conducteur = defaultdict(list)
+        for ligne in lignes:
+            par_conducteur[ligne["conducteur_id"]].append(ligne)
+
+        paragraphes = []
+        rappels = []
+        for affectations in par_conducteur.values():
+            premiere = affectations[0]
+            nom = f"{premiere['conducteur__prenom']} {premiere['conducteur__nom']}"
+            expiration = f"{premiere['conducteur__date_expiration_permis']:%d/%m/%Y}"
+            departs = "\n".join(
+                f"  - {ligne['departure__trip__nom']} {ligne['departure__heure_depart']:%H:%M} (depart #{ligne['departure_id']})"
+                for ligne in affectations
+            )
+            paragraphes.append(f"{nom} : permis expirant le {expiration}\n{departs}")
+            if premiere["conducteur__email"]:
+                rappels.append((
+                    "Gare CI - Renouvellement de votre permis",
+                    f"Bonjour {nom},\n\nVotre permis expire le {expiration}. "
+                    f"Merci de transmettre le permis renouvele avant cette date.",
+                    None,
+                    [premiere["conducteur__email"]],
+                ))
+
+        envoyes = 0
+        destinataires = _destinataires_conformite()
+        # Connexion ouverte ici : send_mail et send_mass_mail ne la ferment pas.
+        with get_connection() as connexion:
+            if destinataires:
+                envoyes += send_mail(
+                    f"Gare CI - {len(par_conducteur)} permis a renouveler",
+                    "\n\n".join(paragraphes),
+                    None,
+                    destinataires,
+                    connection=connexion,
+                )
+            if rappels:
+                envoyes += send_mass_mail(rappels, connection=connexion)
+        return envoyes
@@ -0,0 +1,254 @@
+"""Mise à jour incrémentale de DashboardStats, StatistiqueJournaliere et OccupationJournaliere.
+
+Chaque écriture applique un delta par UPDATE ... SET x = x + n, après le
+commit de la transaction appelante, pour ne pas sérialiser les réservations
+concurrentes sur la ligne de statistiques.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from reservations.models import ArchivedReservation, Paiement, Reservation, ReservationStatus
+from trips.models import Depart
+from trips.signals import departs_modifies_en_masse
+
+from .models import DashboardStats, OccupationJournaliere, StatistiqueJournaliere
+
+
+_compteurs_conserves = ContextVar("compteurs_conserves", default=False)
+
+
+@contextmanager
+def conserver_compteurs():
+    """Suppressions qui deplacent les lignes (archivage) : les compteurs ne bougent pas."""
+    jeton = _compteurs_conserves.set(True)
+    try:
+        yield
+    finally:
+        _compteurs_conserves.reset(jeton)
+
+
+COMPTEUR_PAR_STATUT = {
+    ReservationStatus.EN_ATTENTE: "reservations_en_attente",
+    ReservationStatus.CONFIRMEE: "reservations_confirmees",
+    ReservationStatus.ANNULEE: "reservations_annulees",
+}
+COMPTEUR_PAR_PAIEMENT = {
+    Paiement.Statut.REUSSI: "paiements_reussis",
+    Paiement.Statut.ECHOUE: "paiements_echoues",
+}
+
+
+def _incrementer(queryset, deltas):
+    return queryset.update(**{champ: F(champ) + delta for champ, delta in deltas.items()})
+
+
+def _incrementer_ou_creer(lignes, deltas, creer):
+    if _incrementer(lignes, deltas):
+        return
+    try:
+        with transaction.atomic():
+            creer(deltas)
+    except IntegrityError:
+        # Creee entre-temps par une ecriture concurrente.
+        _incrementer(lignes, deltas)
+
+
+def _non_nuls(deltas):
+    return {champ: delta for champ, delta in (deltas or {}).items() if delta}
+
+
+def _appliquer(globaux, jour=None, par_jour=None):
+    globaux = _non_nuls(globaux)
+    par_jour = _non_nuls(par_jour)
+    if not globaux and not par_jour:
+        return
+
+    def _maj():
+        if globaux and not _incrementer(DashboardStats.objects.filter(pk=1), globaux):
+            # Pas encore d'instantané : le recalcul complet inclut deja ce changement.
+            DashboardStats.recalculer()
+            return
+        if jour is None or not par_jour:
+            return
+        _incrementer_ou_creer(
+            StatistiqueJournaliere.objects.filter(date=jour),
+            par_jour,
+            lambda valeurs: StatistiqueJournaliere.objects.create(date=jour, **valeurs),
+        )
+
+    transaction.on_commit(_maj)
+
+
+def _appliquer_occupation(reservation, deltas):
+    deltas = _non_nuls(deltas)
+    if not deltas:
+        return
+    depart_id = reservation.depart_id
+    date_voyage = reservation.date_voyage
+
+    def _creer(valeurs):
+        depart = Depart.objects.select_related("bus").filter(pk=depart_id).first()
+        if depart is not None:
+            OccupationJournaliere.depuis_depart(depart, date_voyage, **valeurs).save()
+
+    transaction.on_commit(lambda: _incrementer_ou_creer(
+        OccupationJournaliere.objects.filter(date=date_voyage, depart_id=depart_id),
+        deltas,
+        _creer,
+    ))
+
+
+def _deltas_occupation(deltas, statut, reservation, sens):
+    if statut in (ReservationStatus.EN_ATTENTE, ReservationStatus.CONFIRMEE):
+        deltas["places_vendues"] = deltas.get("places_vendues", 0) + reservation.nombre_places * sens
+    if statut == ReservationStatus.CONFIRMEE:
+        deltas["recettes"] = deltas.get("recettes", 0) + Decimal(reservation.prix_total) * sens
+    elif statut == ReservationStatus.ANNULEE:
+        deltas["annulations"] = deltas.get("annulations", 0) + sens
+
+
+def _deltas_statut(globaux, par_jour, statut, reservation, sens):
+    champ = COMPTEUR_PAR_STATUT.get(statut)
+    if champ is None:
+        return
+    globaux[champ] = globaux.get(champ, 0) + sens
+    if statut == ReservationStatus.CONFIRMEE:
+        montant = Decimal(reservation.prix_total) * sens
+        globaux["recettes"] = globaux.get("recettes", 0) + montant
+        par_jour["recettes"] = par_jour.get("recettes", 0) + montant
+        par_jour["nb_confirmees"] = par_jour.get("nb_confirmees", 0) + sens
+    elif statut == ReservationStatus.ANNULEE:
+        par_jour["nb_annulees"] = par_jour.get("nb_annulees", 0) + sens
+
+
+def _jour_creation(reservation):
+    return timezone.localdate(reservation.created_at) if reservation.created_at else timezone.localdate()
+
+
+@receiver(post_init, sender=Reservation)
+@receiver(post_init, sender=Paiement)
+def memoriser_statut(sender, instance, **kwargs):
+    # __dict__ evite de declencher une requete sur un champ differe (.only()).
+    instance._statut_initial = instance.__dict__.get("statut")
+
+
+@receiver(post_save, sender=Reservation)
+def reservation_enregistree(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    ancien = None if created else getattr(instance, "_statut_initial", None)
+    instance._statut_initial = instance.statut
+    if not created and (ancien is None or ancien == instance.statut):
+        return
+
+    globaux, par_jour = {}, {}
+    if created:
+        globaux["total_reservations"] = 1
+        par_jour["nb_reservations"] = 1
+        par_jour["places"] = instance.nombre_places
+    _deltas_statut(globaux, par_jour, ancien, instance, -1)
+    _deltas_statut(globaux, par_jour, instance.statut, instance, 1)
+    _appliquer(globaux, _jour_creation(instance), par_jour)
+
+    occupation = {}
+    _deltas_occupation(occupation, ancien, instance, -1)
+    _deltas_occupation(occupation, instance.statut, instance, 1)
+    _appliquer_occupation(instance, occupation)
+
+
+@receiver(post_delete, sender=Reservation)
+def reservation_supprimee(sender, instance, **kwargs):
+    if _compteurs_conserves.get():
+        return
+    globaux = {"total_reservations": -1}
+    par_jour = {"nb_reservations": -1, "places": -instance.nombre_places}
+    _deltas_statut(globaux, par_jour, instance.statut, instance, -1)
+    _appliquer(globaux, _jour_creation(instance), par_jour)
+
+    occupation = {}
+    _deltas_occupation(occupation, instance.statut, instance, -1)
+    _appliquer_occupation(instance, occupation)
+
+
+@receiver(post_save, sender=Paiement)
+def paiement_enregistre(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    ancien = None if created else getattr(instance, "_statut_initial", None)
+    instance._statut_initial = instance.statut
+    if ancien == instance.statut:
+        return
+    globaux = {}
+    if ancien in COMPTEUR_PAR_PAIEMENT:
+        globaux[COMPTEUR_PAR_PAIEMENT[ancien]] = -1
+    if instance.statut in COMPTEUR_PAR_PAIEMENT:
+        globaux[COMPTEUR_PAR_PAIEMENT[instance.statut]] = 1
+    _appliquer(globaux)
+
+
+@receiver(post_delete, sender=Paiement)
+def paiement_supprime(sender, instance, **kwargs):
+    # Cascade de la suppression d'une reservation (purge des annulees, suppression de compte).
+    if _compteurs_conserves.get():
+        return
+    if instance.statut in COMPTEUR_PAR_PAIEMENT:
+        _appliquer({COMPTEUR_PAR_PAIEMENT[instance.statut]: -1})
+
+
+@receiver(post_delete, sender=ArchivedReservation)
+def archive_supprimee(sender, instance, **kwargs):
+    # Comptee comme la reservation d'origine (DashboardStats.recalculer), paiement compris.
+    if _compteurs_conserves.get():
+        return
+    globaux = {"total_reservations": -1}
+    par_jour = {"nb_reservations": -1, "places": -instance.nombre_places}
+    _deltas_statut(globaux, par_jour, instance.statut, instance, -1)
+    if instance.paiement_statut in COMPTEUR_PAR_PAIEMENT:
+        globaux[COMPTEUR_PAR_PAIEMENT[instance.paiement_statut]] = -1
+    _appliquer(globaux, _jour_creation(instance), par_jour)
+
+
+@receiver(post_save, sender=get_user_model())
+def utilisateur_enregistre(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        _appliquer({"total_utilisateurs": 1})
+
+
+@receiver(post_delete, sender=get_user_model())
+def utilisateur_supprime(sender, instance, **kwargs):
+    _appliquer({"total_utilisateurs": -1})
+
+
+@receiver(post_init, sender=Depart)
+def memoriser_actif(sender, instance, **kwargs):
+    instance._actif_initial = instance.__dict__.get("actif")
+
+
+@receiver(post_save, sender=Depart)
+def depart_enregistre(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    ancien = False if created else getattr(instance, "_actif_initial", None)
+    instance._actif_initial = instance.actif
+    if ancien is None or bool(ancien) == bool(instance.actif):
+        return
+    _appliquer({"departs_actifs": 1 if instance.actif else -1})
+
+
+@receiver(post_delete, sender=Depart)
+def depart_supprime(sender, instance, **kwargs):
+    if instance.actif:
+        _appliquer({"departs_actifs": -1})
+
+
+@receiver(departs_modifies_en_masse)
+def departs_modifies(sender, **kwargs):
+    DashboardStats.objects.filter(pk=1).update(departs_actifs=Depart.objects.filter(actif=True).count())
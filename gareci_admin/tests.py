@@ -1,11 +1,66 @@
-from datetime import timedelta
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from contextlib import closing
+from datetime import time, timedelta
+from decimal import Decimal
+from io import StringIO
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
-from django.urls import reverse
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import Client, LiveServerTestCase, RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, get_resolver, reverse
 from django.utils import timezone
 
-from trips.models import Arret, Bus, Segment, Trip, Ville
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed, ValidationError
+from django.test import override_settings
+
+from gareci_admin import benchmark, charge
+from gareci_admin.models import AffectationConducteur, AlerteDepart, Conducteur, DashboardStats, OccupationJournaliere, StatistiqueJournaliere
+from gareci_admin.forms import DepartForm
+from gareci_admin.services import AffectationService, ConformitePermisService
+from gareci_project import base_de_donnees, metriques
+from gareci_project.repliques import CLE_SESSION, RepliquesMiddleware, lecture_replique
+from gareci_project.instrumentation import BudgetSQLDepasse, JournalSQL, budget_sql, empreinte
+from reservations import archivage
+from reservations.models import ArchivedReservation, ContactMessage, Paiement, Reservation
+from reservations.services import ReservationService
+from trips.models import Arret, Bus, Calendrier, Category, Depart, Segment, Trip, Ville
+from trips.services import conflits_bus
+
+
+
+def creer_depart(heure_depart=time(8, 0), heure_arrivee=time(10, 0), bus=None):
+    ville, _ = Ville.objects.get_or_create(code="ABJ", defaults={"nom": "Abidjan"})
+    arret_a = Arret.objects.create(ville=ville, nom="Gare A", adresse="A")
+    arret_b = Arret.objects.create(ville=ville, nom="Gare B", adresse="B")
+    trip = Trip.objects.create(
+        nom="Abidjan intra",
+        ville_depart=ville,
+        ville_arrivee=ville,
+        arret_depart=arret_a,
+        arret_arrivee=arret_b,
+        price=1000,
+    )
+    if bus is None:
+        bus = Bus.objects.create(immatriculation=f"AB-{Bus.objects.count():03d}-CD", modele="Test", capacite=50)
+    return Depart.objects.create(
+        trip=trip,
+        bus=bus,
+        heure_depart=heure_depart,
+        heure_arrivee=heure_arrivee,
+        prix=1000,
+    )
 
 
 class DashboardTripStepsTests(TestCase):
@@ -107,6 +162,36 @@ class DashboardReferenceDataViewsTests(TestCase):
         self.assertEqual(self.client.get(reverse("dashboard:ville_list")).status_code, 200)
         self.assertEqual(self.client.get(reverse("dashboard:arret_list")).status_code, 200)
         self.assertEqual(self.client.get(reverse("dashboard:segment_list")).status_code, 200)
+        self.assertEqual(self.client.get(reverse("dashboard:calendrier_list")).status_code, 200)
+        self.assertEqual(self.client.get(reverse("dashboard:calendrier_add")).status_code, 200)
+        self.assertEqual(self.client.get(reverse("dashboard:depart_generer")).status_code, 200)
+
+    def test_generation_de_grille_depuis_le_dashboard(self):
+        self.client.login(username="admin", password="adminpass123")
+        depart = creer_depart(heure_depart=time(6, 0), heure_arrivee=time(8, 0))
+
+        grille = {
+            "trip": depart.trip.pk,
+            "bus": depart.bus.pk,
+            "premier_depart": "06:00",
+            "dernier_depart": "11:00",
+            "duree_minutes": 120,
+        }
+
+        # Toutes les 90 min pour 2 h de trajet : un seul bus ne suit pas.
+        response = self.client.post(reverse("dashboard:depart_generer"), {**grille, "frequence_minutes": 90})
+        self.assertContains(response, "creneaux qui se chevauchent")
+        self.assertEqual(depart.trip.departs.count(), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("dashboard:depart_generer"), {**grille, "frequence_minutes": 150})
+
+        self.assertRedirects(response, reverse("dashboard:depart_list"))
+        self.assertEqual(
+            list(depart.trip.departs.values_list("heure_depart", flat=True)),
+            [time(6, 0), time(8, 30), time(11, 0)],
+        )
+        self.assertEqual(DashboardStats.get_courant().departs_actifs, 3)
 
 
 class DashboardDepartureFormTests(TestCase):
@@ -154,3 +239,1146 @@ class DashboardDepartureFormTests(TestCase):
         response = self.client.post(reverse("dashboard:departure_add"), data=payload)
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, "ne peut pas depasser la capacite du bus", html=False)
+
+
+class DashboardStatsTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            username="admin",
+            password="adminpass123",
+            is_staff=True,
+        )
+        self.depart = creer_depart()
+        DashboardStats.recalculer()
+
+    def _reserver(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Reservation.objects.create(
+                utilisateur=self.user,
+                depart=self.depart,
+                date_voyage=timezone.localdate() + timedelta(days=1),
+                prix_total=Decimal("2000.00"),
+                nombre_places=2,
+                **kwargs,
+            )
+
+    def test_signaux_maintiennent_les_compteurs(self):
+        premiere = self._reserver()
+        self._reserver()
+        with self.captureOnCommitCallbacks(execute=True):
+            premiere.confirmer()
+
+        stats = DashboardStats.objects.get(pk=1)
+        self.assertEqual(stats.total_reservations, 2)
+        self.assertEqual(stats.reservations_en_attente, 1)
+        self.assertEqual(stats.reservations_confirmees, 1)
+        self.assertEqual(stats.recettes, Decimal("2000.00"))
+        jour = StatistiqueJournaliere.objects.get(date=timezone.localdate())
+        self.assertEqual(jour.nb_reservations, 2)
+        self.assertEqual(jour.places, 4)
+        self.assertEqual(jour.nb_confirmees, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            premiere.delete()
+        stats.refresh_from_db()
+        self.assertEqual(stats.total_reservations, 1)
+        self.assertEqual(stats.reservations_confirmees, 0)
+        self.assertEqual(stats.recettes, Decimal("0"))
+
+    def assertCompteursExacts(self):
+        champs = [
+            "total_reservations", "reservations_en_attente", "reservations_confirmees", "reservations_annulees",
+            "recettes", "paiements_reussis", "paiements_echoues", "total_utilisateurs",
+        ]
+        maintenus = DashboardStats.objects.values(*champs).get(pk=1)
+        # Les jours ramenes a zero restent en base ; le recalcul les omet.
+        jours = StatistiqueJournaliere.objects.exclude(nb_reservations=0).order_by("date").values(
+            "date", "nb_reservations", "places", "recettes"
+        )
+        avant = list(jours)
+        DashboardStats.recalculer()
+        self.assertEqual(maintenus, DashboardStats.objects.values(*champs).get(pk=1))
+        self.assertEqual(avant, list(jours))
+
+    def test_suppression_en_cascade_du_paiement(self):
+        reservation = self._reserver()
+        with self.captureOnCommitCallbacks(execute=True):
+            Paiement.objects.create(reservation=reservation, montant=2000, statut=Paiement.Statut.ECHOUE)
+            reservation.annuler()
+        self.assertEqual(DashboardStats.objects.get(pk=1).paiements_echoues, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reservation.delete()
+        self.assertEqual(DashboardStats.objects.get(pk=1).paiements_echoues, 0)
+        self.assertCompteursExacts()
+
+    def test_suppression_des_archives_avec_le_compte(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            voyageur = get_user_model().objects.create_user(username="voyageur", password="x")
+            ancienne = Reservation.objects.create(
+                utilisateur=voyageur, depart=self.depart, date_voyage=timezone.localdate() - timedelta(days=400),
+                prix_total=Decimal("3000.00"), nombre_places=3,
+            )
+            ancienne.confirmer()
+            Paiement.objects.create(reservation=ancienne, montant=3000, statut=Paiement.Statut.REUSSI)
+            archivage.archiver()
+        self.assertTrue(ArchivedReservation.objects.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            voyageur.delete()
+        self.assertFalse(ArchivedReservation.objects.exists())
+        self.assertCompteursExacts()
+
+    def test_recalcul_corrige_la_derive(self):
+        self._reserver()
+        DashboardStats.objects.filter(pk=1).update(total_reservations=99, departs_actifs=0)
+
+        stats = DashboardStats.recalculer()
+
+        self.assertEqual(stats.total_reservations, 1)
+        self.assertEqual(stats.departs_actifs, 1)
+        self.assertEqual(StatistiqueJournaliere.objects.get().nb_reservations, 1)
+
+    def test_dashboard_lit_l_instantane(self):
+        for _ in range(3):
+            self._reserver()
+        self.client.login(username="admin", password="adminpass123")
+
+        response = self.client.get(reverse("dashboard:index"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["total_reservations"], 3)
+        self.assertEqual(response.context["total_users"], 1)
+        self.assertEqual(response.context["upcoming_trips"], 1)
+
+    def test_dashboard_borne_la_liste_des_departs(self):
+        bus = self.depart.bus
+        for heure in range(6, 18):
+            creer_depart(heure_depart=time(heure, 0), heure_arrivee=time(heure, 30), bus=bus)
+        self.client.login(username="admin", password="adminpass123")
+
+        response = self.client.get(reverse("dashboard:index"))
+
+        self.assertEqual(len(response.context["object_list"]), 10)
+        self.assertContains(response, reverse("dashboard:depart_list"))
+
+
+class ReservationListParDateTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            username="admin",
+            password="adminpass123",
+            is_staff=True,
+        )
+        self.depart = creer_depart()
+        self.jour = timezone.localdate() + timedelta(days=3)
+        self.client.login(username="admin", password="adminpass123")
+
+    def _reserver(self, nombre, statut, jour=None):
+        Reservation.objects.bulk_create(
+            Reservation(
+                utilisateur=self.user,
+                depart=self.depart,
+                date_voyage=jour or self.jour,
+                reference=f"{statut[:3]}{index:09d}",
+                prix_total=Decimal("1000.00"),
+                statut=statut,
+            )
+            for index in range(nombre)
+        )
+
+    def test_compteurs_par_date_calcules_en_base(self):
+        self._reserver(3, "CONFIRMEE")
+        self._reserver(2, "EN_ATTENTE")
+        self._reserver(4, "ANNULEE")
+
+        response = self.client.get(reverse("dashboard:reservation_list"))
+
+        self.assertEqual(response.status_code, 200)
+        [item] = list(response.context["dates"])
+        self.assertEqual(item["date_voyage"], self.jour)
+        self.assertEqual(item["nb_reservations"], 5)
+        self.assertEqual(item["nb_confirmees"], 3)
+        self.assertEqual(item["nb_en_attente"], 2)
+        self.assertEqual(item["recettes"], Decimal("3000.00"))
+        self.assertNotContains(response, "<code>")
+
+    def test_fragment_pagine_des_reservations_du_jour(self):
+        self._reserver(60, "EN_ATTENTE")
+        url = reverse("dashboard:reservation_list_jour", args=[self.jour.isoformat()])
+
+        premiere = self.client.get(url)
+        seconde = self.client.get(url, {"page": 2})
+
+        self.assertEqual(len(premiere.context["page_obj"]), 50)
+        self.assertContains(premiere, "charger-suite")
+        self.assertEqual(len(seconde.context["page_obj"]), 10)
+        self.assertNotContains(seconde, "charger-suite")
+        self.assertEqual(self.client.get(reverse("dashboard:reservation_list_jour", args=["x"])).status_code, 404)
+
+
+class ExportReservationsTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            username="admin",
+            password="adminpass123",
+            email="admin@example.com",
+            is_staff=True,
+        )
+        self.depart = creer_depart()
+        self.jour = timezone.localdate() + timedelta(days=2)
+        for index, statut in enumerate(["CONFIRMEE", "EN_ATTENTE", "ANNULEE"]):
+            Reservation.objects.create(
+                utilisateur=self.user,
+                depart=self.depart,
+                date_voyage=self.jour + timedelta(days=index),
+                prix_total=Decimal("1000.00"),
+                statut=statut,
+            )
+        self.client.login(username="admin", password="adminpass123")
+
+    def test_export_csv_en_flux_filtre(self):
+        response = self.client.get(
+            reverse("dashboard:export_reservations"),
+            {"format": "csv", "du": self.jour.isoformat(), "au": (self.jour + timedelta(days=1)).isoformat()},
+        )
+
+        self.assertTrue(response.streaming)
+        lignes = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lignes[0].split(",")[:3], ["reference", "date_voyage", "statut"])
+        self.assertEqual(len(lignes), 3)
+        self.assertIn("Abidjan intra", lignes[1])
+
+    def test_export_jsonl_par_statut(self):
+        response = self.client.get(
+            reverse("dashboard:export_reservations"),
+            {"format": "jsonl", "statut": "ANNULEE"},
+        )
+
+        [ligne] = b"".join(response.streaming_content).decode().splitlines()
+        self.assertIn('"statut": "ANNULEE"', ligne)
+        self.assertIn('"email": "admin@example.com"', ligne)
+
+    def test_export_refuse_un_intervalle_inverse(self):
+        response = self.client.get(
+            reverse("dashboard:export_reservations"),
+            {"du": "2026-02-10", "au": "2026-02-01"},
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_commande_export(self):
+        sortie = StringIO()
+        call_command("export_reservations", "--format", "jsonl", "--statut", "CONFIRMEE", stdout=sortie)
+        self.assertEqual(len(sortie.getvalue().splitlines()), 1)
+
+
+class OccupationAnalytiqueTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            username="admin",
+            password="adminpass123",
+            is_staff=True,
+        )
+        self.depart = creer_depart()
+        self.jour = timezone.localdate() + timedelta(days=1)
+        self.client.login(username="admin", password="adminpass123")
+
+    def _reserver(self, statut="EN_ATTENTE", nombre_places=2, jour=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Reservation.objects.create(
+                utilisateur=self.user,
+                depart=self.depart,
+                date_voyage=jour or self.jour,
+                nombre_places=nombre_places,
+                prix_total=Decimal("2000.00"),
+                statut=statut,
+            )
+
+    def test_signaux_et_consolidation_concordent(self):
+        reservation = self._reserver()
+        self._reserver(statut="ANNULEE")
+        with self.captureOnCommitCallbacks(execute=True):
+            reservation.confirmer()
+
+        incremental = OccupationJournaliere.objects.get(date=self.jour, depart=self.depart)
+        self.assertEqual(incremental.places_vendues, 2)
+        self.assertEqual(incremental.annulations, 1)
+        self.assertEqual(incremental.recettes, Decimal("2000.00"))
+        self.assertEqual(incremental.capacite, 50)
+
+        OccupationJournaliere.objects.all().delete()
+        OccupationJournaliere.consolider(self.jour, self.jour + timedelta(days=1))
+
+        consolide = OccupationJournaliere.objects.get(date=self.jour, depart=self.depart)
+        self.assertEqual(
+            (consolide.places_vendues, consolide.annulations, consolide.recettes),
+            (incremental.places_vendues, incremental.annulations, incremental.recettes),
+        )
+        # Le lendemain, le depart actif circule a vide : capacite comptee, zero vendu.
+        self.assertEqual(OccupationJournaliere.objects.get(date=self.jour + timedelta(days=1)).places_vendues, 0)
+
+    def test_consolidation_suit_le_calendrier(self):
+        lundi = self.jour + timedelta(days=(7 - self.jour.weekday()) % 7)
+        OccupationJournaliere.consolider(lundi, lundi + timedelta(days=6))
+        self.assertEqual(OccupationJournaliere.objects.filter(depart=self.depart).count(), 7)
+
+        self.depart.calendrier = Calendrier.objects.create(
+            nom="Week-end", lundi=False, mardi=False, mercredi=False, jeudi=False, vendredi=False
+        )
+        self.depart.save()
+        OccupationJournaliere.consolider(lundi, lundi + timedelta(days=6))
+
+        # Les lignes de semaine de la consolidation precedente disparaissent.
+        self.assertEqual(
+            list(OccupationJournaliere.objects.filter(depart=self.depart).values_list("date", flat=True).order_by("date")),
+            [lundi + timedelta(days=5), lundi + timedelta(days=6)],
+        )
+
+    def test_serie_sous_echantillonnee_pour_une_longue_periode(self):
+        du = self.jour - timedelta(days=364)
+        OccupationJournaliere.consolider(du, self.jour)
+
+        response = self.client.get(
+            reverse("dashboard:analytique_serie"),
+            {"du": du.isoformat(), "au": self.jour.isoformat(), "max_points": 60},
+        )
+
+        donnees = response.json()
+        self.assertEqual(donnees["granularite"], "semaine")
+        self.assertLessEqual(len(donnees["points"]), 60)
+        self.assertEqual(donnees["points"][0]["capacite"] % 50, 0)
+
+    def test_serie_refuse_une_periode_trop_longue(self):
+        du = self.jour - timedelta(days=365 * 3)
+        params = {"du": du.isoformat(), "au": self.jour.isoformat()}
+
+        response = self.client.get(reverse("dashboard:analytique_serie"), {**params, "max_points": 12})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("max_points", response.json()["erreurs"])
+
+        # Les mois entames aux deux bornes comptent : 37 points sur trois ans a cheval.
+        donnees = self.client.get(reverse("dashboard:analytique_serie"), {**params, "max_points": 37}).json()
+        self.assertEqual(donnees["granularite"], "mois")
+
+    def test_top_trajets_et_repartition(self):
+        self._reserver(statut="CONFIRMEE", nombre_places=10)
+        params = {"du": self.jour.isoformat(), "au": self.jour.isoformat()}
+
+        top = self.client.get(reverse("dashboard:analytique_top_trajets"), {**params, "critere": "remplissage"}).json()
+        heures = self.client.get(reverse("dashboard:analytique_repartition"), {**params, "axe": "heure"}).json()
+
+        self.assertEqual(top["trajets"][0]["taux_remplissage"], 0.2)
+        self.assertEqual(heures["lignes"][0]["heure_depart"], "08:00:00")
+        self.assertEqual(self.client.get(reverse("dashboard:analytique_serie"), {"axe": "x"}).status_code, 400)
+
+
+@override_settings(CONDUCTEUR_REPOS_MIN_MINUTES=30, CONDUCTEUR_CONDUITE_MAX_MINUTES_JOUR=480)
+class AffectationConducteurTests(TestCase):
+    def setUp(self):
+        permis = timezone.localdate() + timedelta(days=365)
+        self.kone = Conducteur.objects.create(nom="Kone", prenom="Ali", cin="C1", date_expiration_permis=permis)
+        self.yao = Conducteur.objects.create(nom="Yao", prenom="Ama", cin="C2", date_expiration_permis=permis)
+        self.matin = creer_depart(time(6, 0), time(10, 0))
+        AffectationService.affecter(self.kone, self.matin)
+
+    def test_chevauchement_et_repos_refuses(self):
+        chevauche = creer_depart(time(9, 0), time(11, 0))
+        trop_tot = creer_depart(time(10, 15), time(12, 0))
+        apres_repos = creer_depart(time(10, 30), time(12, 0))
+
+        with self.assertRaisesMessage(ValidationError, "Chevauchement"):
+            AffectationService.affecter(self.kone, chevauche)
+        with self.assertRaisesMessage(ValidationError, "repos"):
+            AffectationService.affecter(self.kone, trop_tot)
+        AffectationService.affecter(self.kone, apres_repos)
+        self.assertEqual(self.kone.affectations.count(), 2)
+
+    def test_calendriers_disjoints_et_depart_de_nuit(self):
+        weekend = Calendrier.objects.create(
+            nom="Weekend", lundi=False, mardi=False, mercredi=False, jeudi=False, vendredi=False,
+        )
+        semaine = Calendrier.objects.create(nom="Semaine", samedi=False, dimanche=False)
+        Depart.objects.filter(pk=self.matin.pk).update(calendrier=semaine)
+        samedi_matin = creer_depart(time(7, 0), time(9, 0))
+        samedi_matin.calendrier = weekend
+        AffectationService.affecter(self.kone, samedi_matin)
+
+        # Le depart de nuit du dimanche deborde sur le lundi matin.
+        dimanche_soir = creer_depart(time(23, 0), time(5, 45))
+        dimanche_soir.calendrier = weekend
+        with self.assertRaisesMessage(ValidationError, "repos"):
+            AffectationService.affecter(self.kone, dimanche_soir)
+
+    def test_limite_journaliere_et_suggestions(self):
+        AffectationService.affecter(self.kone, creer_depart(time(11, 0), time(14, 0)))
+        soir = creer_depart(time(15, 0), time(17, 0))
+
+        with self.assertRaisesMessage(ValidationError, "Limite de conduite"):
+            AffectationService.affecter(self.kone, soir)
+        self.assertEqual([s["id"] for s in AffectationService.suggerer(soir)], [self.yao.pk])
+
+        AffectationService.affecter(self.yao, creer_depart(time(6, 0), time(7, 0)))
+        nuit = creer_depart(time(20, 0), time(21, 0))
+        with self.assertNumQueries(1):
+            suggestions = AffectationService.suggerer(nuit)
+        self.assertEqual([(s["id"], s["charge_minutes"]) for s in suggestions], [(self.yao.pk, 60), (self.kone.pk, 420)])
+
+    def test_conducteur_indisponible_et_clean(self):
+        self.yao.statut = "CONGE"
+        self.yao.save()
+        with self.assertRaisesMessage(ValidationError, "pas disponible"):
+            AffectationService.affecter(self.yao, self.matin)
+
+        doublon = AffectationConducteur(conducteur=self.kone, departure=self.matin)
+        with self.assertRaisesMessage(ValidationError, "deja affecte"):
+            doublon.full_clean()
+        AffectationConducteur.objects.get(conducteur=self.kone).full_clean()
+
+    def test_page_conducteurs_du_depart(self):
+        get_user_model().objects.create_user(username="admin", password="adminpass123", is_staff=True)
+        self.client.login(username="admin", password="adminpass123")
+        url = reverse("dashboard:depart_conducteurs", args=[self.matin.pk])
+
+        response = self.client.get(url)
+        self.assertContains(response, "Ama Yao")
+        self.assertEqual([s["id"] for s in response.context["suggestions"]], [self.yao.pk])
+
+        response = self.client.post(url, {"conducteur": self.yao.pk, "role": "REMPLACANT"})
+        self.assertRedirects(response, url)
+        self.assertTrue(AffectationConducteur.objects.filter(conducteur=self.yao, role="REMPLACANT").exists())
+
+
+@override_settings(BUS_TEMPS_RETOURNEMENT_MINUTES=30)
+class DepartBusConflitTests(TestCase):
+    def setUp(self):
+        self.depart = creer_depart(time(8, 0), time(10, 0))
+        self.bus = self.depart.bus
+
+    def _form(self, debut, fin, instance=None, **donnees):
+        return DepartForm(
+            {
+                "trip": self.depart.trip_id,
+                "bus": self.bus.pk,
+                "heure_depart": debut,
+                "heure_arrivee": fin,
+                "actif": True,
+                **donnees,
+            },
+            instance=instance,
+        )
+
+    def test_chevauchement_et_retournement_refuses(self):
+        self.assertIn("bus", self._form("09:00", "11:00").errors)
+        form = self._form("10:15", "12:00")
+        self.assertIn("retournement de 30 min", form.errors["bus"][0])
+        self.assertTrue(self._form("10:30", "12:00").is_valid())
+        # Modifier le depart lui-meme ne le met pas en conflit avec sa version enregistree.
+        self.assertTrue(self._form("08:30", "10:30", instance=self.depart).is_valid())
+
+    def test_calendriers_disjoints_acceptes(self):
+        dimanche = Calendrier.objects.create(
+            nom="Dimanche", lundi=False, mardi=False, mercredi=False, jeudi=False, vendredi=False, samedi=False,
+        )
+        semaine = Calendrier.objects.create(nom="Semaine", samedi=False, dimanche=False)
+        Depart.objects.filter(pk=self.depart.pk).update(calendrier=semaine)
+
+        self.assertTrue(self._form("09:00", "11:00", calendrier=dimanche.pk).is_valid())
+        with self.assertNumQueries(1):
+            conflits = conflits_bus(Depart(bus=self.bus, heure_depart=time(9, 0), heure_arrivee=time(11, 0)))
+        self.assertEqual([conflit["pk"] for conflit in conflits], [self.depart.pk])
+
+    def test_rapport_de_flotte(self):
+        Depart.objects.create(
+            trip=self.depart.trip, bus=self.bus, heure_depart=time(9, 0), heure_arrivee=time(11, 0), prix=1000,
+        )
+        Depart.objects.create(
+            trip=self.depart.trip, bus=self.bus, heure_depart=time(23, 0), heure_arrivee=time(8, 40), prix=1000,
+        )
+        creer_depart(time(8, 0), time(10, 0))
+
+        sortie = StringIO()
+        call_command("conflits_flotte", stdout=sortie)
+        self.assertIn("3 conflit(s) de bus", sortie.getvalue())
+
+        sortie = StringIO()
+        call_command("conflits_flotte", "--retournement", "0", stdout=sortie)
+        self.assertIn("2 conflit(s) de bus", sortie.getvalue())
+
+    def test_long_depart_pas_en_conflit_avec_lui_meme(self):
+        # 23 h 45 de trajet : l'occurrence du lendemain part 15 min apres l'arrivee.
+        Depart.objects.filter(pk=self.depart.pk).update(heure_arrivee=time(7, 45))
+
+        sortie = StringIO()
+        call_command("conflits_flotte", stdout=sortie)
+        self.assertIn("Aucun conflit de bus", sortie.getvalue())
+
+
+class ConnexionsComptees(locmem.EmailBackend):
+    """Backend locmem qui compte les connexions creees."""
+
+    creees = 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        ConnexionsComptees.creees += 1
+
+
+@override_settings(CONDUCTEUR_ALERTE_PERMIS_JOURS=30, CONFORMITE_EMAILS=["exploitation@gareci.test"])
+class ConformitePermisTests(TestCase):
+    def setUp(self):
+        aujourd_hui = timezone.localdate()
+        self.kone = Conducteur.objects.create(
+            nom="Kone", prenom="Ali", cin="C1", email="ali@gareci.test",
+            date_expiration_permis=aujourd_hui + timedelta(days=10),
+        )
+        yao = Conducteur.objects.create(
+            nom="Yao", prenom="Ama", cin="C2", date_expiration_permis=aujourd_hui + timedelta(days=365),
+        )
+        self.matin = creer_depart(time(6, 0), time(8, 0))
+        termine = creer_depart(time(12, 0), time(14, 0))
+        termine.calendrier = Calendrier.objects.create(nom="Ete", date_fin=aujourd_hui - timedelta(days=1))
+        termine.save()
+        inactif = creer_depart(time(16, 0), time(18, 0))
+        inactif.actif = False
+        inactif.save()
+        for depart in (self.matin, termine, inactif):
+            AffectationConducteur.objects.create(conducteur=self.kone, departure=depart)
+        AffectationConducteur.objects.create(conducteur=yao, departure=self.matin, role="REMPLACANT")
+
+    def test_scan_signale_et_leve_les_alertes(self):
+        with self.assertNumQueries(1):
+            lignes = ConformitePermisService.scanner()
+        self.assertEqual([(l["conducteur_id"], l["departure_id"]) for l in lignes], [(self.kone.pk, self.matin.pk)])
+
+        sortie = StringIO()
+        call_command("scanner_permis", stdout=sortie)
+        self.assertIn("1 conducteur(s) concerne(s), 1 alerte(s) ouverte(s), 0 levee(s)", sortie.getvalue())
+        alerte = AlerteDepart.objects.get(resolue_le__isnull=True)
+        self.assertEqual((alerte.depart_id, alerte.conducteur_id, alerte.type), (self.matin.pk, self.kone.pk, "PERMIS"))
+
+        get_user_model().objects.create_user(username="admin", password="adminpass123", is_staff=True)
+        self.client.login(username="admin", password="adminpass123")
+        response = self.client.get(reverse("dashboard:depart_list"))
+        self.assertContains(response, "Permis de Ali Kone expirant le")
+
+        self.kone.date_expiration_permis += timedelta(days=365 * 5)
+        self.kone.save()
+        call_command("scanner_permis", "--sans-email", stdout=StringIO())
+        self.assertFalse(AlerteDepart.objects.filter(resolue_le__isnull=True).exists())
+
+    @override_settings(EMAIL_BACKEND="gareci_admin.tests.ConnexionsComptees")
+    def test_recapitulatif_et_rappels(self):
+        ConnexionsComptees.creees = 0
+        envoyes = ConformitePermisService.notifier(ConformitePermisService.scanner())
+
+        self.assertEqual((envoyes, ConnexionsComptees.creees), (2, 1))
+        recapitulatif, rappel = mail.outbox
+        self.assertEqual(recapitulatif.to, ["exploitation@gareci.test"])
+        self.assertIn("Ali Kone : permis expirant le", recapitulatif.body)
+        self.assertIn(f"(depart #{self.matin.pk})", recapitulatif.body)
+        self.assertEqual(rappel.to, ["ali@gareci.test"])
+        self.assertEqual(ConformitePermisService.notifier([]), 0)
+
+
+class InstrumentationSQLTests(TestCase):
+    def setUp(self):
+        for heure in (6, 8, 10):
+            creer_depart(time(heure, 0), time(heure + 1, 0))
+        get_user_model().objects.create_user(username="admin", password="adminpass123", is_staff=True)
+
+    def test_en_tete_server_timing_reserve_au_staff(self):
+        response = self.client.get(reverse("trips:home"))
+        self.assertNotIn("Server-Timing", response)
+
+        self.client.login(username="admin", password="adminpass123")
+        response = self.client.get(reverse("dashboard:depart_list"))
+        self.assertRegex(response["Server-Timing"], r'^db;dur=[\d.]+;desc="\d+ requetes", app;dur=[\d.]+$')
+
+    @override_settings(SQL_BUDGET_REQUETES=3)
+    def test_depassement_journalise_avec_les_doublons(self):
+        self.client.login(username="admin", password="adminpass123")
+        with self.assertLogs("gareci.sql", level="WARNING") as journal:
+            self.client.get(reverse("dashboard:depart_list"))
+        self.assertIn("GET /dashboard/departs/ hors budget (3 requetes, 500 ms)", journal.output[0])
+
+        # places_disponibles_pour : une requete par depart.
+        journal_sql = JournalSQL()
+        with journal_sql.capturer():
+            for depart in Depart.objects.select_related("bus"):
+                depart.places_disponibles_pour(timezone.localdate())
+        self.assertRegex(journal_sql.resume(), r"x3 SELECT SUM\(.*reservations_reservation")
+
+    @override_settings(SQL_BUDGET_REQUETES=3, SQL_BUDGET_STRICT=True)
+    def test_mode_strict_pour_les_tests(self):
+        self.client.login(username="admin", password="adminpass123")
+        with self.assertRaises(BudgetSQLDepasse):
+            self.client.get(reverse("dashboard:depart_list"))
+
+    def test_empreinte_et_budget_de_vue(self):
+        self.assertEqual(
+            empreinte("SELECT * FROM t WHERE id IN (%s, %s, %s) AND nom = 'x'  AND n > 3"),
+            "SELECT * FROM t WHERE id IN (...) AND nom = ? AND n > ?",
+        )
+        vue = budget_sql(requetes=2)(lambda request: None)
+        self.assertEqual(vue.budget_sql, (2, None))
+
+
+class MetriquesTests(TestCase):
+    def setUp(self):
+        metriques.registre.reinitialiser()
+        self.client_ = get_user_model().objects.create_user(username="client", password="clientpass123")
+        self.depart = creer_depart()
+        self.demain = timezone.localdate() + timedelta(days=1)
+
+    def test_reservations_creees_et_refusees_par_motif(self):
+        ReservationService.creer(self.depart.pk, self.demain, self.client_, 1)
+        with self.assertRaises(ValidationError):
+            ReservationService.creer(self.depart.pk, self.demain, self.client_, 500)
+
+        valeurs = metriques.registre.collecter()
+        self.assertEqual(valeurs[("gareci_reservations_creees_total", ())], 1)
+        self.assertEqual(valeurs[("gareci_reservations_refusees_total", ("places_max",))], 1)
+        self.assertEqual(sum(valeurs[("gareci_reservation_creer_secondes", ())][:-1]), 2)
+        self.assertEqual(sum(valeurs[("gareci_reservation_verrou_secondes", ())][:-1]), 2)
+
+    def test_exposition_au_format_prometheus(self):
+        metriques.PAIEMENTS.inc(statut="REUSSI")
+        metriques.RECHERCHE_DUREE.observer(0.02)
+        metriques.RECHERCHE_DUREE.observer(30)
+
+        texte = metriques.registre.exposition()
+        self.assertIn("# TYPE gareci_paiements_total counter", texte)
+        self.assertIn('gareci_paiements_total{statut="REUSSI"} 1', texte)
+        self.assertIn('gareci_recherche_secondes_bucket{le="0.01"} 0', texte)
+        self.assertIn('gareci_recherche_secondes_bucket{le="0.025"} 1', texte)
+        self.assertIn('gareci_recherche_secondes_bucket{le="10"} 1', texte)
+        self.assertIn('gareci_recherche_secondes_bucket{le="+Inf"} 2', texte)
+        self.assertIn("gareci_recherche_secondes_count 2", texte)
+
+    def test_agregation_des_processus(self):
+        with tempfile.TemporaryDirectory() as repertoire, override_settings(METRIQUES_REPERTOIRE=repertoire):
+            with open(os.path.join(repertoire, "1.json"), "w") as fichier:
+                fichier.write('[["gareci_paiements_total", ["ECHOUE"], 3]]')
+            metriques.PAIEMENTS.inc(statut="ECHOUE")
+            valeurs = metriques.registre.collecter()
+            self.assertTrue(os.path.exists(os.path.join(repertoire, f"{os.getpid()}.json")))
+        self.assertEqual(valeurs[("gareci_paiements_total", ("ECHOUE",))], 4)
+
+    def test_acces_au_point_de_collecte(self):
+        # Derriere un proxy local, toute requete vient de 127.0.0.1 : pas d'acces sans jeton hors DEBUG.
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        with override_settings(DEBUG=True):
+            self.assertEqual(self.client.get("/metrics").status_code, 200)
+            self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="10.0.0.5").status_code, 403)
+        staff = get_user_model().objects.create_user(username="exploitation", password="x", is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="10.0.0.5").status_code, 200)
+        self.client.logout()
+        with override_settings(METRIQUES_JETON="secret"):
+            self.assertEqual(self.client.get("/metrics").status_code, 403)
+            response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret", REMOTE_ADDR="10.0.0.5")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("# TYPE gareci_reservation_creer_secondes histogram", response.content.decode())
+
+
+class ProfilageTests(TestCase):
+    def setUp(self):
+        self.repertoire = tempfile.TemporaryDirectory()
+        self.addCleanup(self.repertoire.cleanup)
+        reglages = override_settings(PROFILAGE_REPERTOIRE=self.repertoire.name, PROFILAGE_MAX=2)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+        creer_depart()
+        User = get_user_model()
+        User.objects.create_user(username="admin", password="adminpass123", is_staff=True)
+        User.objects.create_user(username="client", password="clientpass123")
+
+    def _fichiers(self, suffixe):
+        return sorted(f for f in os.listdir(self.repertoire.name) if f.endswith(suffixe))
+
+    def test_profil_a_la_demande_du_staff(self):
+        self.client.login(username="admin", password="adminpass123")
+        response = self.client.get(reverse("dashboard:depart_list"), {"profiler": "1"})
+        identifiant = response["X-Profil"]
+        self.assertEqual(self._fichiers(".prof"), [f"{identifiant}.prof"])
+
+        response = self.client.get(reverse("dashboard:profil_list"))
+        self.assertContains(response, "GET /dashboard/departs/?profiler=1")
+        response = self.client.get(reverse("dashboard:profil_detail", args=[identifiant]))
+        self.assertContains(response, "depart_list")
+        self.assertContains(response, "reservations_reservation")
+        response = self.client.get(reverse("dashboard:profil_telecharger", args=[identifiant]))
+        self.assertEqual(response["Content-Disposition"], f'attachment; filename="{identifiant}.prof"')
+        self.assertEqual(self.client.get(reverse("dashboard:profil_detail", args=["..%2Fdb"])).status_code, 404)
+
+    def test_drapeau_ignore_hors_staff(self):
+        self.client.login(username="client", password="clientpass123")
+        response = self.client.get(reverse("trips:home"), HTTP_X_PROFILER="1")
+        self.assertNotIn("X-Profil", response)
+        self.assertEqual(self._fichiers(".json"), [])
+
+    @override_settings(PROFILAGE_ECHANTILLON=1)
+    def test_echantillonnage_et_tampon_circulaire(self):
+        for _ in range(3):
+            response = self.client.get(reverse("trips:home"))
+            self.assertNotIn("X-Profil", response)
+        self.assertEqual(len(self._fichiers(".json")), 2)
+        self.assertEqual(len(self._fichiers(".prof")), 2)
+
+
+class BenchmarkTests(TestCase):
+    def test_jeu_synthetique_mesures_et_nettoyage(self):
+        echelle = benchmark.Echelle(
+            villes=4, arrets_par_ville=2, trips=6, departs_par_trip=3, bus=4, utilisateurs=10, reservations=120
+        )
+        crees = benchmark.generer(echelle, taille_lot=50)
+        self.assertEqual(crees["departs"], 18)
+        self.assertEqual(Reservation.objects.filter(reference__startswith="BM").count(), 120)
+        self.assertEqual(
+            Paiement.objects.count(), Reservation.objects.filter(statut="CONFIRMEE").count()
+        )
+        self.assertEqual(DashboardStats.get_courant().total_reservations, 120)
+
+        with tempfile.TemporaryDirectory() as repertoire:
+            sortie = os.path.join(repertoire, "resultats.json")
+            call_command("benchmark", iterations=2, echauffement=0, sortie=sortie, stdout=StringIO())
+            with open(sortie) as fichier:
+                rapport = json.load(fichier)
+        self.assertEqual(rapport["volumetrie"]["reservations"], 120)
+        self.assertEqual(rapport["base"]["moteur"], "sqlite")
+        for nom, mesure in rapport["scenarios"].items():
+            self.assertNotIn("erreur", mesure, nom)
+            self.assertGreater(mesure["requetes_sql"], 0)
+        # Les mesures d'ecriture sont annulees.
+        self.assertEqual(Reservation.objects.count(), 120)
+
+        regressions = benchmark.comparer({"recherche": {"mediane_ms": 30}}, {"recherche": {"mediane_ms": 10}})
+        self.assertEqual(regressions, [("recherche", 10, 30, 3.0)])
+
+        benchmark.reinitialiser(taille_lot=50)
+        self.assertFalse(Reservation.objects.exists())
+        self.assertFalse(Ville.objects.filter(code__startswith="BM").exists())
+        self.assertFalse(get_user_model().objects.filter(username__startswith="bench_").exists())
+
+
+class BaseDeDonneesTests(TestCase):
+    def test_sqlite_par_defaut(self):
+        reglages = base_de_donnees.configuration("/srv/gareci", environ={})
+        self.assertEqual(reglages["ENGINE"], "django.db.backends.sqlite3")
+        self.assertEqual(str(reglages["NAME"]), "/srv/gareci/db.sqlite3")
+        self.assertEqual(reglages["OPTIONS"]["timeout"], 20)
+        self.assertEqual(
+            reglages["OPTIONS"]["init_command"],
+            "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL; PRAGMA mmap_size=268435456",
+        )
+        sans_wal = base_de_donnees.configuration("/srv/gareci", environ={"BASE_SQLITE_WAL": "0"})
+        self.assertEqual(sans_wal["OPTIONS"]["init_command"], "PRAGMA mmap_size=268435456")
+
+    def test_postgresql_connexions_persistantes_et_delais(self):
+        reglages = base_de_donnees.configuration(
+            "/srv/gareci",
+            environ={"BASE_MOTEUR": "postgresql", "BASE_HOTE": "db", "BASE_DELAI_VERROU_MS": "0", "BASE_SSL": "require"},
+        )
+        self.assertEqual(reglages["ENGINE"], "django.db.backends.postgresql")
+        self.assertEqual(reglages["HOST"], "db")
+        self.assertEqual(reglages["CONN_MAX_AGE"], 60)
+        self.assertTrue(reglages["CONN_HEALTH_CHECKS"])
+        self.assertEqual(reglages["OPTIONS"], {"options": "-c statement_timeout=30000", "sslmode": "require"})
+
+    def test_pool_sans_connexions_persistantes(self):
+        reglages = base_de_donnees.configuration(
+            "/srv/gareci", environ={"BASE_MOTEUR": "postgresql", "BASE_POOL": "1", "BASE_POOL_MAX": "20"}
+        )
+        self.assertEqual(reglages["OPTIONS"]["pool"], {"min_size": 2, "max_size": 20, "timeout": 10})
+        self.assertEqual(reglages["CONN_MAX_AGE"], 0)
+        self.assertFalse(reglages["CONN_HEALTH_CHECKS"])
+
+    def test_repliques(self):
+        self.assertEqual(base_de_donnees.configuration_repliques("/srv/gareci", environ={}), {})
+        sqlite = base_de_donnees.configuration_repliques(
+            "/srv/gareci", environ={"BASE_REPLIQUES": "/srv/r1.sqlite3, /srv/r2.sqlite3"}
+        )
+        self.assertEqual(list(sqlite), ["replique_1", "replique_2"])
+        self.assertEqual(sqlite["replique_2"]["NAME"], "/srv/r2.sqlite3")
+        self.assertEqual(sqlite["replique_1"]["TEST"], {"MIRROR": "default"})
+        postgresql = base_de_donnees.configuration_repliques(
+            "/srv/gareci", environ={"BASE_MOTEUR": "postgresql", "BASE_REPLIQUES": "lecture1,lecture2:6432"}
+        )
+        self.assertEqual(
+            [(reglages["HOST"], reglages["PORT"]) for reglages in postgresql.values()],
+            [("lecture1", "5432"), ("lecture2", "6432")],
+        )
+
+    def test_valeurs_invalides(self):
+        with self.assertRaises(ImproperlyConfigured):
+            base_de_donnees.configuration("/srv/gareci", environ={"BASE_MOTEUR": "mysql"})
+        with self.assertRaises(ImproperlyConfigured):
+            base_de_donnees.configuration(
+                "/srv/gareci", environ={"BASE_MOTEUR": "postgresql", "BASE_DUREE_CONNEXION": "longtemps"}
+            )
+
+
+class IndexReservationsTests(TestCase):
+    ACTIVES = ["EN_ATTENTE", "CONFIRMEE"]
+
+    def setUp(self):
+        self.depart = creer_depart()
+        self.jour = timezone.localdate() + timedelta(days=2)
+        self.voyageur = get_user_model().objects.create_user(username="voyageur", email="v@gareci.ci", password="x")
+        for rang, statut in enumerate(["EN_ATTENTE", "CONFIRMEE", "ANNULEE"] * 3):
+            Reservation.objects.create(
+                utilisateur=self.voyageur,
+                depart=self.depart,
+                date_voyage=self.jour + timedelta(days=rang),
+                nombre_places=1,
+                prix_total=1000,
+                statut=statut,
+            )
+            ContactMessage.objects.create(name="V", email=f"client{rang % 3}@gareci.ci", message="Bonjour")
+        if connection.vendor == "postgresql":
+            # Sur des tables minuscules, PostgreSQL prefererait un parcours sequentiel.
+            with connection.cursor() as curseur:
+                curseur.execute("SET LOCAL enable_seqscan = off")
+
+    def assertIndexUtilise(self, queryset, index):
+        plan = queryset.explain()
+        self.assertRegex(plan, rf"\b{index}\b")
+
+    def test_places_disponibles(self):
+        self.assertIndexUtilise(
+            Depart.objects.filter(pk=self.depart.pk).avec_places_pour(self.jour), "reservation_dispo_idx"
+        )
+
+    def test_quota_et_statistiques_du_client(self):
+        self.assertIndexUtilise(
+            Reservation.objects.filter(utilisateur=self.voyageur, statut__in=self.ACTIVES), "reservation_utilisateur_idx"
+        )
+
+    def test_reservations_du_jour(self):
+        self.assertIndexUtilise(
+            Reservation.objects.filter(date_voyage=self.jour, statut__in=self.ACTIVES), "reservation_jour_idx"
+        )
+
+    def test_messages(self):
+        self.assertIndexUtilise(
+            ContactMessage.objects.filter(email="client1@gareci.ci").order_by("-submitted_at"), "contact_email_idx"
+        )
+        self.assertIndexUtilise(ContactMessage.objects.order_by("-submitted_at"), "contact_date_idx")
+
+
+@override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend")
+class TransactionEcritureTests(TransactionTestCase):
+    def setUp(self):
+        self.depart = creer_depart()
+        self.jour = timezone.localdate() + timedelta(days=2)
+        self.voyageurs = [
+            get_user_model().objects.create_user(username=f"voyageur{rang}", password="x") for rang in range(4)
+        ]
+
+    def test_reservation_en_begin_immediate(self):
+        with CaptureQueriesContext(connection) as requetes:
+            ReservationService.creer(self.depart.pk, self.jour, self.voyageurs[0], 1)
+        self.assertEqual(requetes[0]["sql"], "BEGIN IMMEDIATE")
+        self.assertIsNone(connection.transaction_mode)
+
+        # Dans une transaction deja ouverte, seul un savepoint est possible.
+        with transaction.atomic(), CaptureQueriesContext(connection) as requetes:
+            ReservationService.creer(self.depart.pk, self.jour, self.voyageurs[1], 1)
+        self.assertNotIn("BEGIN IMMEDIATE", [requete["sql"] for requete in requetes])
+
+    def test_reservations_simultanees_sans_verrou_refuse(self):
+        depart_commun = threading.Barrier(len(self.voyageurs))
+        erreurs = []
+
+        def reserver(voyageur):
+            try:
+                depart_commun.wait()
+                ReservationService.creer(self.depart.pk, self.jour, voyageur, 2)
+            except Exception as erreur:
+                erreurs.append(erreur)
+            finally:
+                connection.close()
+
+        fils = [threading.Thread(target=reserver, args=(voyageur,)) for voyageur in self.voyageurs]
+        for fil in fils:
+            fil.start()
+        for fil in fils:
+            fil.join()
+
+        self.assertEqual(erreurs, [])
+        self.assertEqual(Reservation.objects.filter(depart=self.depart).count(), len(self.voyageurs))
+
+
+@override_settings(REPLIQUES_LECTURE=["replique_1"])
+class RepliquesTests(TestCase):
+    def setUp(self):
+        self.fabrique = RequestFactory()
+        self.session = SessionStore()
+
+    def traiter(self, vue, methode="get"):
+        """Passe une requete dans RepliquesMiddleware ; retourne la base lue par la vue."""
+        lue = []
+
+        def reponse(request):
+            middleware.process_view(request, vue, (), {})
+            lue.append(vue(request))
+            return HttpResponse()
+
+        middleware = RepliquesMiddleware(reponse)
+        request = getattr(self.fabrique, methode)("/")
+        request.session = self.session
+        middleware(request)
+        return lue[0]
+
+    def test_vue_marquee_lue_sur_replique(self):
+        vue = lecture_replique(lambda request: Ville.objects.all().db)
+        self.assertEqual(self.traiter(vue), "replique_1")
+        # Hors requete, tout revient au primaire.
+        self.assertEqual(Ville.objects.all().db, "default")
+
+    def test_sessions_et_vues_non_marquees_sur_primaire(self):
+        self.assertEqual(self.traiter(lambda request: Ville.objects.all().db), "default")
+        vue = lecture_replique(lambda request: Session.objects.all().db)
+        self.assertEqual(self.traiter(vue), "default")
+
+    def test_post_puis_lecture_collante(self):
+        vue = lecture_replique(lambda request: Ville.objects.all().db)
+        self.assertEqual(self.traiter(vue, "post"), "default")
+        self.assertEqual(self.traiter(vue), "default")
+        self.session[CLE_SESSION] = 0
+        self.assertEqual(self.traiter(vue), "replique_1")
+
+    def test_ecriture_bascule_sur_primaire(self):
+        def vue(request):
+            Ville.objects.create(code="BKE", nom="Bouake")
+            return Ville.objects.all().db
+
+        self.assertEqual(self.traiter(lecture_replique(vue)), "default")
+        self.assertGreater(self.session[CLE_SESSION], 0)
+
+    @override_settings(REPLIQUES_LECTURE=[])
+    def test_desactive_sans_replique(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            RepliquesMiddleware(lambda request: HttpResponse())
+
+    def test_simuler_replication(self):
+        with tempfile.TemporaryDirectory() as dossier:
+            primaire, replique = os.path.join(dossier, "primaire.sqlite3"), os.path.join(dossier, "replique.sqlite3")
+            with closing(sqlite3.connect(primaire)) as base, base:
+                base.execute("CREATE TABLE ville (nom TEXT)")
+                base.execute("INSERT INTO ville VALUES ('Abidjan')")
+            call_command(
+                "simuler_replication", "--une-fois", "--delai", "0",
+                "--primaire", primaire, "--replique", replique, stdout=StringIO(),
+            )
+            with closing(sqlite3.connect(replique)) as base:
+                self.assertEqual(base.execute("SELECT nom FROM ville").fetchall(), [("Abidjan",)])
+
+
+def _motifs(resolveur, espace=None):
+    for motif in resolveur.url_patterns:
+        if isinstance(motif, URLResolver):
+            yield from _motifs(motif, motif.namespace or espace)
+        else:
+            yield espace, motif
+
+
+class BudgetRequetesTests(TestCase):
+    """Chaque page doit executer autant de requetes SQL sur un petit et un gros jeu de donnees."""
+
+    ESPACES = ("trips", "reservations", "accounts", "dashboard")
+    ANONYMES = {"accounts:login", "accounts:register"}
+    EXCLUES = {
+        # Importe reservations.ticket.generer_billet_pdf, qui n'existe pas.
+        "dashboard:admin_voir_billet",
+    }
+    PK = {
+        "bus": Bus,
+        "category": Category,
+        "ville": Ville,
+        "arret": Arret,
+        "segment": Segment,
+        "conducteur": Conducteur,
+        "trip": Trip,
+        "depart": Depart,
+        "calendrier": Calendrier,
+        "message": ContactMessage,
+        "reservation": Reservation,
+    }
+
+    def _peupler(self, echelle, facteur):
+        benchmark.generer(echelle, taille_lot=500)
+        jour = timezone.localdate() + timedelta(days=2)
+        departs = list(Depart.objects.circulant_le(jour).exploitables(jour).filter(actif=True).order_by("pk"))
+        voyageur = get_user_model().objects.create_user("budget", email="budget@gareci.ci", password="budget")
+
+        for rang in range(4 * facteur):
+            depart = departs[rang % len(departs)]
+            for date_voyage in (jour, timezone.localdate() - timedelta(days=400)):
+                Reservation.objects.create(
+                    utilisateur=voyageur,
+                    depart=depart,
+                    date_voyage=date_voyage,
+                    nombre_places=1,
+                    prix_total=depart.prix,
+                    statut="CONFIRMEE" if rang % 2 else "EN_ATTENTE",
+                )
+        archivage.archiver()
+        for rang in range(3 * facteur):
+            ContactMessage.objects.create(
+                name="Budget", email=voyageur.email, message=f"Message {rang}", reply="Reponse" if rang % 2 else None
+            )
+            Category.objects.create(nom=f"Categorie {rang}")
+            Calendrier.objects.create(nom=f"Calendrier {rang}")
+            conducteur = Conducteur.objects.create(nom=f"Conducteur {rang}", prenom="Test", cin=f"CI-{rang:04d}")
+            AffectationConducteur.objects.create(departure=departs[rang], conducteur=conducteur)
+            AlerteDepart.objects.create(type="PERMIS", depart=departs[rang], conducteur=conducteur, message="Permis")
+        DashboardStats.recalculer()
+
+        staff = get_user_model().objects.get(username=f"{benchmark.PREFIXE_UTILISATEUR}staff")
+        clients = {"anonyme": Client(), "voyageur": Client(), "staff": Client()}
+        clients["voyageur"].force_login(voyageur)
+        clients["staff"].force_login(staff)
+        profil = clients["staff"].get(reverse("dashboard:index"), {"profiler": "1"})["X-Profil"]
+
+        reservations = Reservation.objects.filter(utilisateur=voyageur, date_voyage=jour).order_by("pk")
+        depart = departs[0]
+        return {
+            "clients": clients,
+            "jour": jour,
+            "depart": depart,
+            "confirmee": reservations.filter(statut="CONFIRMEE").first(),
+            "en_attente": reservations.filter(statut="EN_ATTENTE").first(),
+            "message": ContactMessage.objects.filter(email=voyageur.email).first(),
+            "profil": profil,
+        }
+
+    def _requete(self, espace, motif, donnees):
+        nom = f"{espace}:{motif.name}"
+        arguments = {}
+        for argument in motif.pattern.converters:
+            if argument == "depart_id":
+                arguments[argument] = donnees["depart"].pk
+            elif argument == "date_str":
+                arguments[argument] = donnees["jour"].isoformat()
+            elif argument == "identifiant":
+                arguments[argument] = donnees["profil"]
+            elif argument == "reservation_id":
+                attente = motif.name in ("attente_validation", "annuler", "paiement", "traiter_paiement")
+                arguments[argument] = donnees["en_attente" if attente else "confirmee"].pk
+            elif nom == "reservations:delete_message":
+                arguments[argument] = donnees["message"].pk
+            else:
+                arguments[argument] = self.PK[motif.name.split("_")[0]].objects.order_by("pk").first().pk
+        parametres = {}
+        if nom == "trips:search_results":
+            trip = donnees["depart"].trip
+            parametres = {
+                "ville_depart": trip.arret_depart.ville.nom,
+                "ville_arrivee": trip.arret_arrivee.ville.nom,
+                "date": donnees["jour"].isoformat(),
+            }
+        if nom in self.ANONYMES:
+            client = "anonyme"
+        elif espace == "dashboard":
+            client = "staff"
+        else:
+            client = "voyageur"
+        return donnees["clients"][client], reverse(nom, kwargs=arguments), parametres
+
+    def _mesurer(self, echelle, facteur):
+        donnees = self._peupler(echelle, facteur)
+        mesures = {}
+        for espace, motif in _motifs(get_resolver()):
+            nom = f"{espace}:{motif.name}"
+            if espace not in self.ESPACES or nom in self.EXCLUES:
+                continue
+            client, url, parametres = self._requete(espace, motif, donnees)
+            client.get(url, parametres)  # Echauffement : caches, session, paiement cree au premier affichage.
+            journal = JournalSQL()
+            with journal.capturer():
+                response = client.get(url, parametres)
+                if response.streaming:
+                    b"".join(response.streaming_content)
+            mesures[nom] = (response.status_code, len(journal), journal)
+        return mesures
+
+    @override_settings(
+        PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"],
+        EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+        SQL_INSTRUMENTATION=False,
+    )
+    def test_requetes_independantes_du_volume(self):
+        with tempfile.TemporaryDirectory() as repertoire, self.settings(PROFILAGE_REPERTOIRE=repertoire):
+            resultats = []
+            for echelle, facteur in (
+                (benchmark.Echelle(4, 2, 8, 2, 3, 10, 60), 1),
+                (benchmark.Echelle(12, 2, 30, 3, 9, 40, 400), 3),
+            ):
+                with transaction.atomic():
+                    resultats.append(self._mesurer(echelle, facteur))
+                    transaction.set_rollback(True)
+
+        petit, grand = resultats
+        self.assertGreater(len(petit), 60)
+        for nom, (statut, requetes, _) in petit.items():
+            statut_grand, requetes_grand, journal = grand[nom]
+            with self.subTest(vue=nom):
+                self.assertLess(statut, 500)
+                self.assertNotEqual(statut, 404)
+                doublons = "\n".join(f"  x{nombre} {sql[:300]}" for sql, nombre in journal.doublons())
+                self.assertEqual(
+                    requetes, requetes_grand, f"{nom} : {requetes} -> {requetes_grand} requetes SQL\n{doublons}"
+                )
+
+
+@override_settings(
+    PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"],
+    EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+)
+class GenerateurChargeTests(LiveServerTestCase):
+    def test_parcours_complets_sans_surreservation(self):
+        # La cle etrangere de reservations_paiement n'est pas differee : sans ce
+        # nettoyage, le flush de fin de test echoue selon l'ordre des tables.
+        self.addCleanup(lambda: Paiement.objects.all().delete())
+        depart = creer_depart()
+        jour = timezone.localdate() + timedelta(days=2)
+        charge.preparer_voyageurs(1)
+        cibles = charge.choisir_cibles(jour, 1)
+        self.assertEqual([cible.depart_id for cible in cibles], [depart.pk])
+
+        # Un seul voyageur : la base SQLite en memoire des tests n'attend pas les verrous.
+        resultats = asyncio.run(charge.lancer(self.live_server_url, cibles, jour, nombre=1, iterations=3, graine=3))
+
+        self.assertEqual(resultats.issues["parcours_complet"], 3, resultats.exemples_erreurs)
+        self.assertEqual(len(resultats.latences["billet"]), 3)
+        self.assertIsNotNone(resultats.percentile("reservation", 99))
+        self.assertEqual(Reservation.objects.filter(depart=depart, statut="CONFIRMEE").count(), 3)
+        self.assertEqual(charge.surreservations(cibles, jour), [])
+
+        # Une nouvelle campagne repart de voyageurs sans reservation active (quota par client).
+        charge.preparer_voyageurs(1)
+        self.assertFalse(Reservation.objects.filter(statut="CONFIRMEE").exists())
+
+    def test_referer_suit_le_schema_de_la_cible(self):
+        async def renvoyer_les_entetes(lecteur, ecrivain):
+            entetes = await lecteur.readuntil(b"\r\n\r\n")
+            ecrivain.write(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\nConnection: close\r\n\r\n%s" % (len(entetes), entetes))
+            await ecrivain.drain()
+            ecrivain.close()
+
+        async def referer(base):
+            serveur = await asyncio.start_server(renvoyer_les_entetes, "127.0.0.1", 0)
+            async with serveur:
+                client = charge.ClientHTTP(f"{base}:{serveur.sockets[0].getsockname()[1]}", delai=5)
+                # TLS hors sujet ici : seul l'en-tete compte.
+                client.ssl = None
+                _, _, entetes = await client.requete("POST", "/reservations/", {"places": 1})
+            return next(ligne for ligne in entetes.split("\r\n") if ligne.startswith("Referer:"))
+
+        self.assertRegex(asyncio.run(referer("https://127.0.0.1")), r"^Referer: https://127\.0\.0\.1:\d+/reservations/$")
+        self.assertRegex(asyncio.run(referer("http://127.0.0.1")), r"^Referer: http://127\.0\.0\.1:\d+/reservations/$")
@@ -9,6 +9,10 @@ from .views import (
     BusDeleteView,
     BusListView,
     BusUpdateView,
+    CalendrierCreateView,
+    CalendrierDeleteView,
+    CalendrierListView,
+    CalendrierUpdateView,
     CategoryCreateView,
     CategoryDeleteView,
     CategoryListView,
@@ -23,7 +27,6 @@ from .views import (
     MessageReplyView,
     ReservationAdminConfirmView,
     ReservationAdminDeleteView,
-    ReservationAdminListView,
     ReservationAdminUpdateView,
     SegmentCreateView,
     SegmentDeleteView,
@@ -37,12 +40,22 @@ from .views import (
     VilleDeleteView,
     VilleListView,
     VilleUpdateView,
+    depart_conducteurs,
     depart_create,
     depart_delete,
     depart_edit,
+    depart_generer,
     depart_list,
+    profil_detail,
+    profil_list,
+    profil_telecharger,
+    export_reservations,
     reservation_list,
+    reservation_list_jour,
     admin_voir_billet,
+    analytique_repartition,
+    analytique_serie,
+    analytique_top_trajets,
 )
 
 app_name = "dashboard"
@@ -78,15 +91,28 @@ urlpatterns = [
     path("trips/<int:pk>/delete/", TripDeleteView.as_view(), name="trip_delete"),
     path("departs/", depart_list, name="depart_list"),
     path("departs/nouveau/", depart_create, name="depart_create"),
+    path("departs/generer/", depart_generer, name="depart_generer"),
+    path("departs/<int:pk>/conducteurs/", depart_conducteurs, name="depart_conducteurs"),
+    path("calendriers/", CalendrierListView.as_view(), name="calendrier_list"),
+    path("calendriers/add/", CalendrierCreateView.as_view(), name="calendrier_add"),
+    path("calendriers/<int:pk>/edit/", CalendrierUpdateView.as_view(), name="calendrier_edit"),
+    path("calendriers/<int:pk>/delete/", CalendrierDeleteView.as_view(), name="calendrier_delete"),
     path("departs/<int:pk>/modifier/", depart_edit, name="depart_edit"),
     path("departs/<int:pk>/supprimer/", depart_delete, name="depart_delete"),
     path("messages/", MessageListView.as_view(), name="message_list"),
     path("messages/<int:pk>/reply/", MessageReplyView.as_view(), name="message_reply"),
     path("messages/<int:pk>/delete/", MessageDeleteView.as_view(), name="message_delete"),
-    path("reservations/", ReservationAdminListView.as_view(), name="reservation_list"),
     path("reservations/<int:pk>/edit/", ReservationAdminUpdateView.as_view(), name="reservation_edit"),
     path("reservations/<int:pk>/delete/", ReservationAdminDeleteView.as_view(), name="reservation_delete"),
     path("reservations/<int:pk>/confirm/", ReservationAdminConfirmView.as_view(), name="reservation_confirm"),
     path('reservations/', reservation_list, name='reservation_list'),
+    path('reservations/jour/<str:date_str>/', reservation_list_jour, name='reservation_list_jour'),
+    path('reservations/export/', export_reservations, name='export_reservations'),
     path('reservations/<int:reservation_id>/billet/', admin_voir_billet, name='admin_voir_billet'),
+    path('profils/', profil_list, name='profil_list'),
+    path('profils/<str:identifiant>/', profil_detail, name='profil_detail'),
+    path('profils/<str:identifiant>/telecharger/', profil_telecharger, name='profil_telecharger'),
+    path('api/analytique/serie/', analytique_serie, name='analytique_serie'),
+    path('api/analytique/top-trajets/', analytique_top_trajets, name='analytique_top_trajets'),
+    path('api/analytique/repartition/', analytique_repartition, name='analytique_repartition'),
 ]
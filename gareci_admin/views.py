@@ -1,17 +1,44 @@
-﻿from django.urls import reverse_lazy
+﻿from datetime import datetime
+from collections import defaultdict
+from decimal import Decimal
+
+from django.urls import reverse_lazy
+from django.core.paginator import Paginator
+from django.db.models import Count, Q, Sum, Value
+from django.db.models.functions import Coalesce
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView, TemplateView
 from django.shortcuts import redirect, get_object_or_404, render
 from django.utils import timezone
-from django.core.mail import send_mail
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import ValidationError
+from reservations.exports import FORMATS, filtrer_reservations
 from reservations.models import ContactMessage, Reservation, ReservationStatus
-from django.http import HttpResponse
-from .models import Conducteur
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from gareci_project import profilage
+from gareci_project.repliques import lecture_replique
+from .models import AffectationConducteur, AlerteDepart, Conducteur, DashboardStats, StatistiqueJournaliere
 from gareci_admin.utils import StaffRequiredMixin, ActiveTabMixin, BreadcrumbMixin 
-from .forms import ArretForm, ContactReplyForm, DepartForm, EtapeTrajetFormSet, SegmentForm, TripAdminForm, VilleForm
-from django.contrib.auth import get_user_model
-from trips.models import Bus, Category, Ville, Arret, Segment, Trip, Depart
+from . import analytique
+from .services import AffectationService
+from .forms import (
+    AnalytiqueForm,
+    ArretForm,
+    CalendrierForm,
+    ContactReplyForm,
+    DepartForm,
+    EtapeTrajetFormSet,
+    ExceptionCalendrierFormSet,
+    ExportReservationsForm,
+    GenerationDepartsForm,
+    SegmentForm,
+    TripAdminForm,
+    VilleForm,
+)
+from trips.models import Bus, Calendrier, Category, Ville, Arret, Segment, Trip, Depart
+from trips.maintenance import bus_exploitable
+from trips.services import GenerateurDeparts, horaires_cadences
 
 
 class CreateSuccessMessageMixin:
@@ -160,6 +187,9 @@ class ArretListView(StaffRequiredMixin, ActiveTabMixin, BreadcrumbMixin, ListVie
     active_tab_value = "arrets"
     breadcrumb_title = "Arrets"
 
+    def get_queryset(self):
+        return Arret.objects.select_related("ville")
+
 
 class ArretCreateView(StaffRequiredMixin, ActiveTabMixin, BreadcrumbMixin, CreateSuccessMessageMixin, CreateView):
     model = Arret
@@ -194,6 +224,9 @@ class SegmentListView(StaffRequiredMixin, ActiveTabMixin, BreadcrumbMixin, ListV
     active_tab_value = "segments"
     breadcrumb_title = "Segments"
 
+    def get_queryset(self):
+        return Segment.objects.select_related("arret_depart__ville", "arret_arrivee__ville")
+
 
 class SegmentCreateView(StaffRequiredMixin, ActiveTabMixin, BreadcrumbMixin, CreateSuccessMessageMixin, CreateView):
     model = Segment
@@ -263,8 +296,10 @@ class TripListView(StaffRequiredMixin,ActiveTabMixin, BreadcrumbMixin , ListView
 
     def get_queryset(self):
         return (
-            Trip.objects.select_related("ville_depart", "ville_arrivee", "arret_depart", "arret_arrivee")
-            .prefetch_related("etapetrajet_set__segment__arret_depart", "etapetrajet_set__segment__arret_arrivee")
+            Trip.objects.select_related("ville_depart", "ville_arrivee", "arret_depart__ville", "arret_arrivee__ville")
+            .prefetch_related(
+                "etapetrajet_set__segment__arret_depart__ville", "etapetrajet_set__segment__arret_arrivee__ville"
+            )
             .order_by("nom")
         )
 
@@ -342,6 +377,67 @@ class TripDeleteView(StaffRequiredMixin,ActiveTabMixin, BreadcrumbMixin, DeleteS
     breadcrumb_title = 'Trajets > Suppression Trajets'
     success_url = reverse_lazy('dashboard:trip_list')
 
+# Gestion des Calendriers de service
+class CalendrierFormsetMixin:
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        if self.request.POST:
+            context["exception_formset"] = ExceptionCalendrierFormSet(
+                self.request.POST,
+                instance=self.object,
+                prefix="exceptions",
+            )
+        else:
+            context["exception_formset"] = ExceptionCalendrierFormSet(instance=self.object, prefix="exceptions")
+        return context
+
+    def form_valid(self, form):
+        exception_formset = self.get_context_data()["exception_formset"]
+        if not exception_formset.is_valid():
+            return self.form_invalid(form)
+        self.object = form.save()
+        exception_formset.instance = self.object
+        exception_formset.save()
+        messages.success(self.request, "Calendrier enregistre avec succes.")
+        return redirect(self.success_url)
+
+
+class CalendrierListView(StaffRequiredMixin, ActiveTabMixin, BreadcrumbMixin, ListView):
+    model = Calendrier
+    template_name = "dashboard/calendrier_list.html"
+    active_tab_value = "calendriers"
+    breadcrumb_title = "Calendriers"
+
+    def get_queryset(self):
+        return Calendrier.objects.annotate(nb_departs=Count("departs", distinct=True), nb_exceptions=Count("exceptions", distinct=True))
+
+
+class CalendrierCreateView(StaffRequiredMixin, ActiveTabMixin, BreadcrumbMixin, CalendrierFormsetMixin, CreateView):
+    model = Calendrier
+    form_class = CalendrierForm
+    template_name = "dashboard/calendrier_form.html"
+    active_tab_value = "calendriers"
+    breadcrumb_title = "Calendriers > Ajouter Calendrier"
+    success_url = reverse_lazy("dashboard:calendrier_list")
+
+
+class CalendrierUpdateView(StaffRequiredMixin, ActiveTabMixin, BreadcrumbMixin, CalendrierFormsetMixin, UpdateView):
+    model = Calendrier
+    form_class = CalendrierForm
+    template_name = "dashboard/calendrier_form.html"
+    active_tab_value = "calendriers"
+    breadcrumb_title = "Calendriers > Modifier Calendrier"
+    success_url = reverse_lazy("dashboard:calendrier_list")
+
+
+class CalendrierDeleteView(StaffRequiredMixin, ActiveTabMixin, BreadcrumbMixin, DeleteSuccessMessageMixin, DeleteView):
+    model = Calendrier
+    template_name = "dashboard/calendrier_confirm_delete.html"
+    active_tab_value = "calendriers"
+    breadcrumb_title = "Calendriers > Suppression Calendrier"
+    success_url = reverse_lazy("dashboard:calendrier_list")
+
+
 @staff_member_required(login_url="accounts:login")
 def depart_list(request):
     today = timezone.localdate()
@@ -349,12 +445,19 @@ def depart_list(request):
         Depart.objects.select_related(
             "trip__arret_depart__ville",
             "trip__arret_arrivee__ville",
-            "bus",
+            "bus__categorie",
         )
+        .avec_places_pour(today)
         .order_by("trip", "heure_depart")
     )
+    bus_bloques = set(Bus.objects.exclude(bus_exploitable(today)).values_list("pk", flat=True))
+    alertes = defaultdict(list)
+    for depart_id, message in AlerteDepart.objects.filter(resolue_le__isnull=True).values_list("depart_id", "message"):
+        alertes[depart_id].append(message)
     for depart in departs:
-        depart.places_du_jour = depart.places_disponibles_pour(today)
+        depart.places_du_jour = depart.places_disponibles
+        depart.bus_bloque = depart.bus_id in bus_bloques
+        depart.alertes_ouvertes = alertes.get(depart.pk, [])
     return render(
         request,
         "dashboard/depart_list.html",
@@ -389,6 +492,49 @@ def depart_create(request):
     )
 
 
+@staff_member_required(login_url="accounts:login")
+def depart_generer(request):
+    """Cree ou met a jour en masse les departs cadences d'un trajet."""
+    if request.method == "POST":
+        form = GenerationDepartsForm(request.POST)
+        if form.is_valid():
+            donnees = form.cleaned_data
+            try:
+                horaires = horaires_cadences(
+                    donnees["premier_depart"],
+                    donnees["dernier_depart"],
+                    donnees["frequence_minutes"],
+                    donnees["duree_minutes"],
+                )
+                crees, modifies = GenerateurDeparts.generer(
+                    donnees["trip"],
+                    horaires,
+                    donnees["bus"],
+                    calendrier=donnees["calendrier"],
+                    desactiver_absents=donnees["desactiver_absents"],
+                )
+            except ValidationError as e:
+                form.add_error(None, e)
+            else:
+                messages.success(
+                    request,
+                    f"{len(crees)} depart(s) cree(s), {len(modifies)} depart(s) mis a jour.",
+                )
+                return redirect("dashboard:depart_list")
+    else:
+        form = GenerationDepartsForm()
+
+    return render(
+        request,
+        "dashboard/depart_generer.html",
+        {
+            "form": form,
+            "active_tab": "departures",
+            "breadcrumb_title": "Departs > Generer une grille",
+        },
+    )
+
+
 @staff_member_required(login_url="accounts:login")
 def depart_edit(request, pk):
     depart = get_object_or_404(Depart, pk=pk)
@@ -433,6 +579,83 @@ def depart_delete(request, pk):
         },
     )
 
+
+@staff_member_required(login_url="accounts:login")
+def depart_conducteurs(request, pk):
+    """Affectations d'un depart et conducteurs disponibles pour le prendre."""
+    depart = get_object_or_404(Depart.objects.select_related("trip", "bus", "calendrier"), pk=pk)
+
+    if request.method == "POST":
+        conducteur = get_object_or_404(Conducteur, pk=request.POST.get("conducteur"))
+        role = request.POST.get("role")
+        if role not in dict(AffectationConducteur.ROLE):
+            role = "PRINCIPAL"
+        try:
+            AffectationService.affecter(conducteur, depart, role=role)
+        except ValidationError as e:
+            messages.error(request, " ".join(e.messages))
+        else:
+            messages.success(request, f"{conducteur} affecte au depart.")
+        return redirect("dashboard:depart_conducteurs", pk=depart.pk)
+
+    return render(
+        request,
+        "dashboard/depart_conducteurs.html",
+        {
+            "depart": depart,
+            "affectations": depart.affectations_conducteurs.select_related("conducteur"),
+            "suggestions": AffectationService.suggerer(depart),
+            "roles": AffectationConducteur.ROLE,
+            "active_tab": "departures",
+            "breadcrumb_title": "Departs > Conducteurs",
+        },
+    )
+
+@staff_member_required(login_url="accounts:login")
+def profil_list(request):
+    """Profils conserves dans le tampon circulaire (cf. gareci_project/profilage.py)."""
+    return render(
+        request,
+        "dashboard/profil_list.html",
+        {
+            "profils": profilage.profils(),
+            "capacite": getattr(settings, "PROFILAGE_MAX", 50),
+            "active_tab": "profils",
+            "breadcrumb_title": "Profils",
+        },
+    )
+
+
+@staff_member_required(login_url="accounts:login")
+def profil_detail(request, identifiant):
+    metadonnees = profilage.lire(identifiant)
+    if metadonnees is None:
+        raise Http404("Profil introuvable ou elague.")
+    tri = request.GET.get("tri", "cumulative")
+    if tri not in profilage.TRIS:
+        tri = "cumulative"
+    return render(
+        request,
+        "dashboard/profil_detail.html",
+        {
+            "profil": metadonnees,
+            "fonctions": profilage.fonctions_principales(identifiant, tri=tri),
+            "tri": tri,
+            "tris": profilage.TRIS,
+            "active_tab": "profils",
+            "breadcrumb_title": "Profils > Detail",
+        },
+    )
+
+
+@staff_member_required(login_url="accounts:login")
+def profil_telecharger(request, identifiant):
+    chemin = profilage.chemin_profil(identifiant)
+    if chemin is None:
+        raise Http404("Profil introuvable ou elague.")
+    return FileResponse(open(chemin, "rb"), as_attachment=True, filename=chemin.name)
+
+
 # Consultation des Messages clients
 class MessageListView(StaffRequiredMixin,ActiveTabMixin, BreadcrumbMixin , ListView):
     model = ContactMessage
@@ -456,29 +679,12 @@ class MessageReplyView(StaffRequiredMixin,ActiveTabMixin, BreadcrumbMixin , Upda
         # Verification de la reponse
         if not response.reply:
             return self.form_invalid(form)
-        
-        response.save()
-        
-        # Envoi de l'email au client
-        try:
-            send_mail(
-                subject='Reponse a votre message de contact - Gareci',
-                message=f"""Bonjour {response.name},
-
-Voici notre reponse a votre message du {response.submitted_at}:
 
-{response.reply}
-
-Cordialement,
-L'equipe Gareci""",
-                from_email=None,  # Utilise DEFAULT_FROM_EMAIL
-                recipient_list=[response.email],
-                fail_silently=False,
-            )
-        except Exception as e:
-            print(f"Erreur d'envoi d'email: {e}")  # Pour debug
+        # L'email part en arriere-plan (manage.py envoyer_reponses).
+        response.mettre_en_file()
+        response.save()
 
-        messages.success(self.request, "Reponse envoyee avec succes.")
+        messages.success(self.request, "Reponse enregistree, l'email est en cours d'envoi.")
         return super().form_valid(form)
 
 class MessageDeleteView(StaffRequiredMixin,ActiveTabMixin, BreadcrumbMixin, DeleteSuccessMessageMixin, DeleteView):
@@ -488,22 +694,19 @@ class MessageDeleteView(StaffRequiredMixin,ActiveTabMixin, BreadcrumbMixin, Dele
     breadcrumb_title = 'Messages > Suppression Messages'
     success_url = reverse_lazy('dashboard:message_list')
 
-# Consultation des Reservations clients
-class ReservationAdminListView(StaffRequiredMixin,ActiveTabMixin, BreadcrumbMixin , ListView):
-    model = Reservation
-    template_name = 'dashboard/reservation_list.html'
-    active_tab_value ='reservations'
-    breadcrumb_title = 'Reservations '
-    context_object_name = 'reservations'
-    ordering = ['-created_at']
-
+# Modification des Reservations clients
 class ReservationAdminUpdateView(StaffRequiredMixin,ActiveTabMixin, BreadcrumbMixin, UpdateSuccessMessageMixin, UpdateView):
     model = Reservation
-    fields = ['statut', 'utilisateur', 'date_voyage', 'depart', 'nombre_places', 'prix_total', 'paiement']
+    fields = ['statut', 'utilisateur', 'date_voyage', 'depart', 'nombre_places', 'prix_total']
     template_name = 'dashboard/reservation_form.html'
     active_tab_value ='reservations'
     breadcrumb_title = 'Reservations > Modifier Reservations'
 
+    def get_form(self, form_class=None):
+        form = super().get_form(form_class)
+        form.fields['depart'].queryset = Depart.objects.select_related('trip')
+        return form
+
     def get_success_url(self):
         return reverse_lazy('dashboard:reservation_list')
 
@@ -516,6 +719,8 @@ class ReservationAdminDeleteView(StaffRequiredMixin,ActiveTabMixin, BreadcrumbMi
 
 class ReservationAdminConfirmView(StaffRequiredMixin,ActiveTabMixin, BreadcrumbMixin , TemplateView):
     active_tab_value ='departures'
+    http_method_names = ['post']
+
     def post(self, request, pk, *args, **kwargs):
         reservation = get_object_or_404(Reservation, pk=pk)
         reservation.statut = ReservationStatus.CONFIRMEE
@@ -529,26 +734,17 @@ class DashboardView(StaffRequiredMixin,ActiveTabMixin, BreadcrumbMixin , Templat
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        today = timezone.now().date()
-        CustomUser = get_user_model()
         context['empty'] = []  # Liste vide pour le filtre default_if_none
-        # Statistiques rapides
-        context['total_reservations'] = Reservation.objects.count()
-        context['total_users'] = CustomUser.objects.count()
-        
-        # Departs a venir (sans limite de 7 jours) avec statistiques
-        upcoming_departures = Depart.objects.select_related(
-            'trip', 'bus'
-        ).prefetch_related(
-            'reservations'
-        ).filter(
-            actif=True,
-        ).order_by('heure_depart')
-
-        context['upcoming_trips'] = upcoming_departures.count()
-        
-        # Liste complete des departs pour le tableau principal
-        context['object_list'] = Depart.objects.select_related('trip', 'bus').all().order_by('heure_depart')
+        # Statistiques rapides : lues depuis l'instantane maintenu par les signaux
+        stats = DashboardStats.get_courant()
+        context['stats'] = stats
+        context['total_reservations'] = stats.total_reservations
+        context['total_users'] = stats.total_utilisateurs
+        context['upcoming_trips'] = stats.departs_actifs
+        context['stats_jours'] = StatistiqueJournaliere.objects.all()[:7]
+
+        # Premiers departs de la journee ; la liste complete est paginee sur depart_list
+        context['object_list'] = Depart.objects.select_related('trip', 'bus').order_by('heure_depart', 'pk')[:10]
         # Reservations recentes (10 dernieres)
         recent_reservations = Reservation.objects.select_related(
             'utilisateur',
@@ -569,49 +765,141 @@ def user_list(request):
     # Logique pour afficher la liste des utilisateurs
     return render(request, 'gareci_admin/user_list.html')
 
+STATUTS_RESERVATION_ACTIFS = [ReservationStatus.EN_ATTENTE, ReservationStatus.CONFIRMEE]
+
+
 @staff_member_required
 def reservation_list(request):
+    # Compteurs et recettes par date calcules en base (GROUP BY date_voyage) ;
+    # les reservations de chaque date sont chargees a l'ouverture du panneau.
+    confirmee = Q(statut=ReservationStatus.CONFIRMEE)
+    dates = (
+        Reservation.objects.filter(statut__in=STATUTS_RESERVATION_ACTIFS)
+        .values('date_voyage')
+        .annotate(
+            nb_reservations=Count('id'),
+            nb_confirmees=Count('id', filter=confirmee),
+            nb_en_attente=Count('id', filter=Q(statut=ReservationStatus.EN_ATTENTE)),
+            recettes=Coalesce(Sum('prix_total', filter=confirmee), Value(Decimal('0'))),
+        )
+        .order_by('date_voyage')
+    )
+    page_obj = Paginator(dates, 31).get_page(request.GET.get('page'))
+
+    return render(request, 'dashboard/reservation_list.html', {
+        'dates': page_obj,
+        'page_obj': page_obj,
+        'active_tab': 'reservations',
+        'breadcrumb_title': 'Reservations',
+    })
+
+
+@staff_member_required
+def reservation_list_jour(request, date_str):
+    """Fragment HTML (lignes de tableau) des reservations d'une date, pagine."""
+    try:
+        date_voyage = datetime.strptime(date_str, '%Y-%m-%d').date()
+    except ValueError:
+        raise Http404("Date invalide.")
+
     reservations = Reservation.objects.filter(
-        statut__in=[
-            ReservationStatus.EN_ATTENTE,
-            ReservationStatus.CONFIRMEE,
-        ]
+        date_voyage=date_voyage,
+        statut__in=STATUTS_RESERVATION_ACTIFS,
     ).select_related(
         'depart__trip__arret_depart__ville',
         'depart__trip__arret_arrivee__ville',
-        'depart__bus__categorie',
         'utilisateur',
-    ).order_by('date_voyage', 'depart__heure_depart')
-
-    reservations_par_date = {}
-    for resa in reservations:
-        date = resa.date_voyage
-        if date not in reservations_par_date:
-            reservations_par_date[date] = []
-        reservations_par_date[date].append(resa)
-
-    contexte_dates = []
-    for date in sorted(reservations_par_date.keys()):
-        resas = reservations_par_date[date]
-        contexte_dates.append({
-            'date':          date,
-            'reservations':  resas,
-            'nb_confirmees': sum(
-                1 for r in resas
-                if r.statut == ReservationStatus.CONFIRMEE
-            ),
-            'nb_en_attente': sum(
-                1 for r in resas
-                if r.statut == ReservationStatus.EN_ATTENTE
-            ),
-            'recettes':      sum(
-                r.prix_total for r in resas
-                if r.statut == ReservationStatus.CONFIRMEE
-            ),
-        })
+        'paiement',
+    ).order_by('depart__heure_depart', 'id')
+    page_obj = Paginator(reservations, 50).get_page(request.GET.get('page'))
 
-    return render(request, 'dashboard/reservation_list.html', {
-        'dates': contexte_dates,
+    return render(request, 'dashboard/reservation_rows.html', {
+        'page_obj': page_obj,
+        'date': date_voyage,
+    })
+
+@lecture_replique
+@staff_member_required
+def export_reservations(request):
+    """Export CSV/JSONL en flux des reservations filtrees (dates, trajet, statut)."""
+    form = ExportReservationsForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest(form.errors.as_text())
+
+    filtres = form.cleaned_data
+    format_export = filtres["format"] or "csv"
+    generateur, content_type = FORMATS[format_export]
+    reservations = filtrer_reservations(
+        du=filtres["du"],
+        au=filtres["au"],
+        trajet=filtres["trajet"],
+        statut=filtres["statut"],
+    )
+    # Le flux est lu apres la sortie des middlewares : la base (replique) est fixee maintenant.
+    reservations = reservations.using(reservations.db)
+    response = StreamingHttpResponse(generateur(reservations), content_type=content_type)
+    response['Content-Disposition'] = (
+        f'attachment; filename="reservations_{timezone.localdate():%Y%m%d}.{format_export}"'
+    )
+    return response
+
+def _analytique_filtres(request):
+    form = AnalytiqueForm(request.GET)
+    if not form.is_valid():
+        return None, JsonResponse({"erreurs": form.errors}, status=400)
+    filtres = form.cleaned_data
+    occupations = analytique.filtrer_occupations(
+        filtres["du"], filtres["au"], trajet=filtres["trajet"], categorie=filtres["categorie"]
+    )
+    return (filtres, occupations), None
+
+
+@lecture_replique
+@staff_member_required
+def analytique_serie(request):
+    """Serie temporelle de remplissage / recettes, sous-echantillonnee cote serveur."""
+    resultat, erreur = _analytique_filtres(request)
+    if erreur:
+        return erreur
+    filtres, occupations = resultat
+    try:
+        granularite, points = analytique.serie_temporelle(
+            occupations, filtres["du"], filtres["au"], filtres["max_points"]
+        )
+    except ValueError as erreur:
+        return JsonResponse({"erreurs": {"max_points": [str(erreur)]}}, status=400)
+    return JsonResponse({
+        "du": filtres["du"],
+        "au": filtres["au"],
+        "granularite": granularite,
+        "points": points,
+    })
+
+
+@lecture_replique
+@staff_member_required
+def analytique_top_trajets(request):
+    resultat, erreur = _analytique_filtres(request)
+    if erreur:
+        return erreur
+    filtres, occupations = resultat
+    return JsonResponse({
+        "critere": filtres["critere"],
+        "trajets": analytique.top_trajets(occupations, filtres["n"], filtres["critere"]),
+    })
+
+
+@lecture_replique
+@staff_member_required
+def analytique_repartition(request):
+    """Remplissage par trajet, par heure de depart ou par categorie."""
+    resultat, erreur = _analytique_filtres(request)
+    if erreur:
+        return erreur
+    filtres, occupations = resultat
+    return JsonResponse({
+        "axe": filtres["axe"],
+        "lignes": analytique.repartition(occupations, filtres["axe"]),
     })
 
 @staff_member_required
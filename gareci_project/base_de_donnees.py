@@ -0,0 +1,138 @@
+"""Configuration de la base de donnees lue dans l'environnement.
+
+SQLite (db.sqlite3) reste le defaut pour le developpement et les petites
+gares sur un seul poste. Chaque connexion y passe en WAL (les lecteurs ne
+sont plus bloques par l'ecrivain ; BASE_SQLITE_WAL=0 pour un disque reseau),
+synchronous=NORMAL (sur en WAL), mmap (BASE_SQLITE_MMAP octets) et attend
+le verrou d'ecriture BASE_SQLITE_ATTENTE secondes ; les reservations
+passent par `gareci_project.transactions.transaction_ecriture`. En production,
+BASE_MOTEUR=postgresql active PostgreSQL (psycopg 3) :
+
+- connexions persistantes (BASE_DUREE_CONNEXION secondes, 60 par defaut)
+  verifiees avant reutilisation (CONN_HEALTH_CHECKS) ;
+- ou, avec BASE_POOL=1, le pool psycopg_pool de Django (BASE_POOL_MIN,
+  BASE_POOL_MAX), incompatible avec les connexions persistantes ;
+- statement_timeout (BASE_DELAI_REQUETE_MS) et lock_timeout
+  (BASE_DELAI_VERROU_MS, attente des `select_for_update`) poses a la
+  connexion ; 0 desactive la limite.
+
+Les autres variables (BASE_NOM, BASE_UTILISATEUR, BASE_MOT_DE_PASSE,
+BASE_HOTE, BASE_PORT, BASE_SSL) correspondent aux parametres libpq.
+
+BASE_REPLIQUES ajoute des repliques en lecture (gareci_project/repliques.py).
+En local, deux fichiers SQLite suffisent :
+
+    BASE_REPLIQUES=replique.sqlite3 python manage.py simuler_replication --delai 2
+    BASE_REPLIQUES=replique.sqlite3 python manage.py runserver
+"""
+import os
+from pathlib import Path
+
+from django.core.exceptions import ImproperlyConfigured
+
+MOTEURS = {
+    "sqlite": "django.db.backends.sqlite3",
+    "postgresql": "django.db.backends.postgresql",
+}
+
+
+def _entier(environ, nom, defaut):
+    valeur = environ.get(nom, "")
+    if valeur == "":
+        return defaut
+    try:
+        return int(valeur)
+    except ValueError:
+        raise ImproperlyConfigured(f"{nom} doit etre un entier (recu {valeur!r}).")
+
+
+def _actif(environ, nom):
+    return environ.get(nom, "").lower() in ("1", "true", "oui", "on")
+
+
+def configuration(base_dir, environ=os.environ):
+    """Entree `default` de DATABASES."""
+    moteur = environ.get("BASE_MOTEUR", "sqlite")
+    if moteur not in MOTEURS:
+        raise ImproperlyConfigured(f"BASE_MOTEUR inconnu : {moteur!r} (attendu : {', '.join(MOTEURS)}).")
+
+    if moteur == "sqlite":
+        pragmas = [f"PRAGMA mmap_size={_entier(environ, 'BASE_SQLITE_MMAP', 256 * 1024 * 1024)}"]
+        if environ.get("BASE_SQLITE_WAL", "1") != "0":
+            pragmas[:0] = ["PRAGMA journal_mode=WAL", "PRAGMA synchronous=NORMAL"]
+        return {
+            "ENGINE": MOTEURS[moteur],
+            "NAME": environ.get("BASE_NOM") or Path(base_dir) / "db.sqlite3",
+            "OPTIONS": {
+                # busy_timeout : attente du verrou d'ecriture avant "database is locked".
+                "timeout": _entier(environ, "BASE_SQLITE_ATTENTE", 20),
+                "init_command": "; ".join(pragmas),
+            },
+        }
+
+    options = {}
+    parametres = []
+    for nom, parametre, defaut in (
+        ("BASE_DELAI_REQUETE_MS", "statement_timeout", 30_000),
+        ("BASE_DELAI_VERROU_MS", "lock_timeout", 5_000),
+    ):
+        delai = _entier(environ, nom, defaut)
+        if delai:
+            parametres.append(f"-c {parametre}={delai}")
+    if parametres:
+        options["options"] = " ".join(parametres)
+    if environ.get("BASE_SSL"):
+        options["sslmode"] = environ["BASE_SSL"]
+
+    duree_connexion = _entier(environ, "BASE_DUREE_CONNEXION", 60)
+    if _actif(environ, "BASE_POOL"):
+        options["pool"] = {
+            "min_size": _entier(environ, "BASE_POOL_MIN", 2),
+            "max_size": _entier(environ, "BASE_POOL_MAX", 10),
+            "timeout": _entier(environ, "BASE_POOL_ATTENTE", 10),
+        }
+        # Le pool gere lui-meme la duree de vie des connexions.
+        duree_connexion = 0
+
+    return {
+        "ENGINE": MOTEURS[moteur],
+        "NAME": environ.get("BASE_NOM", "gareci"),
+        "USER": environ.get("BASE_UTILISATEUR", "gareci"),
+        "PASSWORD": environ.get("BASE_MOT_DE_PASSE", ""),
+        "HOST": environ.get("BASE_HOTE", "localhost"),
+        "PORT": environ.get("BASE_PORT", "5432"),
+        "CONN_MAX_AGE": duree_connexion,
+        "CONN_HEALTH_CHECKS": duree_connexion > 0,
+        "OPTIONS": options,
+    }
+
+
+def configuration_repliques(base_dir, environ=os.environ):
+    """Alias `replique_N` des repliques en lecture listees dans BASE_REPLIQUES.
+
+    Chaque replique reprend la configuration du primaire ; BASE_REPLIQUES
+    donne, separes par des virgules, des hotes (`hote` ou `hote:port`) sous
+    PostgreSQL ou des chemins de fichiers sous SQLite. Les tests lisent les
+    repliques sur la base de test du primaire (MIRROR).
+    """
+    primaire = configuration(base_dir, environ)
+    alias = {}
+    for rang, cible in enumerate(filter(None, map(str.strip, environ.get("BASE_REPLIQUES", "").split(","))), start=1):
+        replique = {**primaire, "TEST": {"MIRROR": "default"}}
+        if primaire["ENGINE"] == MOTEURS["sqlite"]:
+            replique["NAME"] = cible
+        else:
+            hote, _, port = cible.partition(":")
+            replique.update(HOST=hote, PORT=port or primaire["PORT"])
+        alias[f"replique_{rang}"] = replique
+    return alias
+
+
+def description(connexion):
+    """Moteur et mode de connexion, pour les rapports de benchmark."""
+    reglages = connexion.settings_dict
+    return {
+        "moteur": connexion.vendor,
+        "duree_connexion": reglages.get("CONN_MAX_AGE", 0),
+        "pool": bool(reglages.get("OPTIONS", {}).get("pool")),
+    }
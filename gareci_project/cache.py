@@ -0,0 +1,109 @@
+"""Cache des gabarits et des pages publiques.
+
+CACHE_MOTEUR choisit le backend : `locmem` (defaut, propre a chaque worker),
+`fichier` (CACHE_REPERTOIRE, partage entre workers d'une meme machine) ou
+`redis` (CACHE_URL, partage entre machines). Des qu'il y a plusieurs workers,
+`locmem` est a proscrire : la version du referentiel vit dans le cache, et une
+invalidation ne toucherait que le worker qui l'a faite.
+
+Les fragments ({% cache %}) et les pages anonymes (`@cache_anonyme`)
+dependant du referentiel (villes, trajets) portent sa version dans leur
+cle : `invalider()` a chaque enregistrement d'une Ville ou d'un Trip
+(trips/signals.py) change la version, et les anciennes entrees ne sont plus
+jamais relues. Elles expirent d'elles-memes, aucun balayage n'est
+necessaire.
+"""
+import hashlib
+import os
+import time
+from functools import wraps
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+
+MOTEURS = {
+    "locmem": "django.core.cache.backends.locmem.LocMemCache",
+    "fichier": "django.core.cache.backends.filebased.FileBasedCache",
+    "redis": "django.core.cache.backends.redis.RedisCache",
+}
+REFERENTIEL = "referentiel"
+
+
+def configuration(base_dir, environ=os.environ):
+    """Entree `default` de CACHES."""
+    moteur = environ.get("CACHE_MOTEUR", "locmem")
+    if moteur not in MOTEURS:
+        raise ImproperlyConfigured(f"CACHE_MOTEUR inconnu : {moteur!r} (attendu : {', '.join(MOTEURS)}).")
+    emplacement = {
+        "locmem": "gareci",
+        "fichier": environ.get("CACHE_REPERTOIRE") or Path(base_dir) / "cache",
+        "redis": environ.get("CACHE_URL", "redis://localhost:6379/1"),
+    }[moteur]
+    return {"BACKEND": MOTEURS[moteur], "LOCATION": emplacement, "KEY_PREFIX": "gareci"}
+
+
+def _cle_version(nom):
+    return f"version:{nom}"
+
+
+def version(nom=REFERENTIEL):
+    # Une version evincee repart d'une valeur neuve : jamais d'anciennes entrees relues.
+    return cache.get_or_set(_cle_version(nom), time.time_ns, timeout=None)
+
+
+def invalider(nom=REFERENTIEL):
+    cache.set(_cle_version(nom), time.time_ns(), timeout=None)
+
+
+class Versions:
+    """`versions_cache.referentiel` dans les gabarits, lu seulement si utilise."""
+
+    def __getitem__(self, nom):
+        return version(nom)
+
+
+def versions(request):
+    """Processeur de contexte : duree et cle de version des fragments.
+
+    {% cache duree_fragments nom versions_cache.referentiel %}
+    """
+    return {
+        "versions_cache": Versions(),
+        "duree_fragments": getattr(settings, "CACHE_FRAGMENTS_SECONDES", 3600),
+    }
+
+
+def cache_anonyme(vue):
+    """Decorateur de vue : reponse complete mise en cache pour les visiteurs anonymes.
+
+    Seuls les GET/HEAD reussis sans cookie ni jeton CSRF sont conserves, le temps de
+    CACHE_PAGES_SECONDES, sous une cle portant l'URL et la version du
+    referentiel. Les utilisateurs connectes (menu personnalise, jeton CSRF)
+    passent toujours par la vue.
+    """
+
+    @wraps(vue)
+    def enveloppe(request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD") or request.user.is_authenticated:
+            return vue(request, *args, **kwargs)
+        url = hashlib.md5(request.build_absolute_uri().encode(), usedforsecurity=False).hexdigest()
+        # La date du jour dans la cle : champs date, annee du pied de page.
+        cle = f"page:{version()}:{timezone.localdate().isoformat()}:{url}"
+        response = cache.get(cle)
+        if response is not None:
+            return response
+        response = vue(request, *args, **kwargs)
+        if (
+            response.status_code == 200
+            and not response.streaming
+            and not response.cookies
+            # Jeton CSRF emis par le gabarit : propre a ce visiteur.
+            and not request.META.get("CSRF_COOKIE_NEEDS_UPDATE")
+        ):
+            cache.set(cle, response, getattr(settings, "CACHE_PAGES_SECONDES", 300))
+        return response
+
+    return enveloppe
@@ -0,0 +1,129 @@
+"""Instrumentation SQL par requete HTTP.
+
+`InstrumentationSQLMiddleware` enregistre, pour chaque requete, le nombre
+de requetes SQL, leur duree totale, les empreintes repetees (signature d'un
+N+1) et les plus lentes. Au-dela du budget (SQL_BUDGET_REQUETES,
+SQL_BUDGET_MS, ou `@budget_sql` sur la vue), un avertissement est journalise
+sur le logger "gareci.sql" ; avec SQL_BUDGET_STRICT (tests), la requete
+echoue avec BudgetSQLDepasse. Les membres du staff recoivent un en-tete
+Server-Timing lisible dans les outils de developpement du navigateur.
+"""
+import logging
+import re
+from collections import Counter
+from contextlib import ExitStack
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger("gareci.sql")
+
+_LISTE_IN = re.compile(r"\bIN \((?:%s, )*%s\)", re.IGNORECASE)
+_LITTERAUX = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_ESPACES = re.compile(r"\s+")
+
+
+class BudgetSQLDepasse(AssertionError):
+    pass
+
+
+def empreinte(sql):
+    """SQL normalise : listes IN repliees, litteraux remplaces, espaces compactes."""
+    sql = _LISTE_IN.sub("IN (...)", sql)
+    sql = _LITTERAUX.sub("?", sql)
+    return _ESPACES.sub(" ", sql).strip()
+
+
+def budget_sql(requetes=None, ms=None):
+    """Decorateur de vue : budget specifique, prioritaire sur les reglages globaux."""
+
+    def decorer(vue):
+        vue.budget_sql = (requetes, ms)
+        return vue
+
+    return decorer
+
+
+class JournalSQL:
+    """Collecteur branche sur toutes les connexions via `execute_wrapper`."""
+
+    def __init__(self):
+        self.requetes = []
+
+    def __call__(self, execute, sql, params, many, context):
+        debut = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.requetes.append((sql, (perf_counter() - debut) * 1000))
+
+    def __len__(self):
+        return len(self.requetes)
+
+    def capturer(self):
+        pile = ExitStack()
+        for alias in connections:
+            pile.enter_context(connections[alias].execute_wrapper(self))
+        return pile
+
+    @property
+    def duree_ms(self):
+        return sum(duree for _, duree in self.requetes)
+
+    def doublons(self, seuil=2):
+        """[(empreinte, occurrences)] des requetes executees au moins `seuil` fois."""
+        compteur = Counter(empreinte(sql) for sql, _ in self.requetes)
+        return [(sql, nombre) for sql, nombre in compteur.most_common() if nombre >= seuil]
+
+    def plus_lentes(self, nombre=5):
+        return sorted(self.requetes, key=lambda requete: -requete[1])[:nombre]
+
+    def resume(self):
+        lignes = [f"{len(self)} requete(s) SQL, {self.duree_ms:.1f} ms"]
+        lignes += [f"  x{nombre} {sql[:300]}" for sql, nombre in self.doublons()[:5]]
+        lignes += [f"  {duree:.1f} ms {sql[:300]}" for sql, duree in self.plus_lentes(3)]
+        return "\n".join(lignes)
+
+
+class InstrumentationSQLMiddleware:
+    """A placer apres AuthenticationMiddleware (l'en-tete Server-Timing est reserve au staff)."""
+
+    def __init__(self, get_response):
+        if not getattr(settings, "SQL_INSTRUMENTATION", True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        journal = JournalSQL()
+        request.journal_sql = journal
+        debut = perf_counter()
+        with journal.capturer():
+            response = self.get_response(request)
+        total_ms = (perf_counter() - debut) * 1000
+
+        budget_requetes, budget_ms = getattr(request, "_budget_sql", (None, None))
+        budget_requetes = budget_requetes or getattr(settings, "SQL_BUDGET_REQUETES", 50)
+        budget_ms = budget_ms or getattr(settings, "SQL_BUDGET_MS", 500)
+        if len(journal) > budget_requetes or journal.duree_ms > budget_ms:
+            message = (
+                f"{request.method} {request.path} hors budget "
+                f"({budget_requetes} requetes, {budget_ms} ms) : {journal.resume()}"
+            )
+            if getattr(settings, "SQL_BUDGET_STRICT", False):
+                raise BudgetSQLDepasse(message)
+            logger.warning(message)
+
+        utilisateur = getattr(request, "user", None)
+        if utilisateur is not None and utilisateur.is_authenticated and utilisateur.is_staff:
+            mesures = (
+                f'db;dur={journal.duree_ms:.1f};desc="{len(journal)} requetes", '
+                f"app;dur={total_ms:.1f}"
+            )
+            existant = response.get("Server-Timing")
+            response["Server-Timing"] = f"{existant}, {mesures}" if existant else mesures
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._budget_sql = getattr(view_func, "budget_sql", (None, None))
@@ -0,0 +1,213 @@
+"""Metriques applicatives au format d'exposition Prometheus (texte).
+
+Chaque processus cumule ses compteurs et histogrammes en memoire et les
+recopie au plus toutes les METRIQUES_FLUSH_SECONDES dans un fichier
+`<pid>.json` de METRIQUES_REPERTOIRE (ecriture atomique par renommage).
+La vue `/metrics` additionne les fichiers de tous les workers ; sans
+repertoire configure, seules les valeurs du processus courant sont
+exposees. Vider le repertoire au deploiement remet les compteurs a zero.
+"""
+import atexit
+import hmac
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from time import monotonic, perf_counter
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+SEUILS_SECONDES = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Registre:
+    def __init__(self):
+        self.metriques = {}
+        self._valeurs = {}
+        self._verrou = threading.Lock()
+        self._dernier_flush = 0.0
+
+    def enregistrer(self, metrique):
+        self.metriques[metrique.nom] = metrique
+        return metrique
+
+    def _cle(self, metrique, etiquettes):
+        return metrique.nom, tuple(str(etiquettes.get(nom, "")) for nom in metrique.etiquettes)
+
+    def incrementer(self, metrique, valeur, etiquettes):
+        cle = self._cle(metrique, etiquettes)
+        with self._verrou:
+            self._valeurs[cle] = self._valeurs.get(cle, 0) + valeur
+        self._flush_si_du()
+
+    def observer(self, metrique, valeur, etiquettes):
+        cle = self._cle(metrique, etiquettes)
+        with self._verrou:
+            # [compte par seuil..., compte +Inf, somme]
+            cases = self._valeurs.setdefault(cle, [0] * (len(metrique.seuils) + 1) + [0.0])
+            for rang, seuil in enumerate(metrique.seuils):
+                if valeur <= seuil:
+                    cases[rang] += 1
+                    break
+            else:
+                cases[len(metrique.seuils)] += 1
+            cases[-1] += valeur
+        self._flush_si_du()
+
+    def reinitialiser(self):
+        with self._verrou:
+            self._valeurs.clear()
+
+    def _instantane(self):
+        with self._verrou:
+            return [[nom, list(etiquettes), valeur] for (nom, etiquettes), valeur in self._valeurs.items()]
+
+    def _repertoire(self):
+        repertoire = getattr(settings, "METRIQUES_REPERTOIRE", None)
+        return Path(repertoire) if repertoire else None
+
+    def _flush_si_du(self):
+        if monotonic() - self._dernier_flush >= getattr(settings, "METRIQUES_FLUSH_SECONDES", 1.0):
+            self.ecrire()
+
+    def ecrire(self):
+        """Recopie les valeurs du processus dans son fichier (si un repertoire est configure)."""
+        self._dernier_flush = monotonic()
+        repertoire = self._repertoire()
+        if repertoire is None:
+            return
+        repertoire.mkdir(parents=True, exist_ok=True)
+        descripteur, temporaire = tempfile.mkstemp(dir=repertoire, suffix=".tmp")
+        with os.fdopen(descripteur, "w") as fichier:
+            json.dump(self._instantane(), fichier)
+        os.replace(temporaire, repertoire / f"{os.getpid()}.json")
+
+    def collecter(self):
+        """{(nom, etiquettes): valeur} additionnees sur tous les processus."""
+        repertoire = self._repertoire()
+        if repertoire is None:
+            sources = [self._instantane()]
+        else:
+            self.ecrire()
+            sources = []
+            for chemin in repertoire.glob("*.json"):
+                try:
+                    sources.append(json.loads(chemin.read_text()))
+                except (OSError, ValueError):
+                    continue  # Fichier d'un worker en cours de remplacement.
+        total = {}
+        for source in sources:
+            for nom, etiquettes, valeur in source:
+                cle = (nom, tuple(etiquettes))
+                if isinstance(valeur, list):
+                    cumul = total.setdefault(cle, [0] * len(valeur))
+                    total[cle] = [a + b for a, b in zip(cumul, valeur)]
+                else:
+                    total[cle] = total.get(cle, 0) + valeur
+        return total
+
+    def exposition(self):
+        valeurs = self.collecter()
+        lignes = []
+        for metrique in self.metriques.values():
+            lignes.append(f"# HELP {metrique.nom} {metrique.aide}")
+            lignes.append(f"# TYPE {metrique.nom} {metrique.type}")
+            for (nom, etiquettes), valeur in sorted(valeurs.items()):
+                if nom == metrique.nom:
+                    lignes.extend(metrique.lignes(dict(zip(metrique.etiquettes, etiquettes)), valeur))
+        return "\n".join(lignes) + "\n"
+
+
+registre = Registre()
+atexit.register(lambda: registre.ecrire() if registre._valeurs else None)
+
+
+def _etiquettes(valeurs):
+    if not valeurs:
+        return ""
+    contenu = ",".join(
+        '{}="{}"'.format(nom, str(valeur).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for nom, valeur in valeurs.items()
+    )
+    return "{" + contenu + "}"
+
+
+class Compteur:
+    type = "counter"
+
+    def __init__(self, nom, aide, etiquettes=()):
+        self.nom, self.aide, self.etiquettes = nom, aide, tuple(etiquettes)
+        registre.enregistrer(self)
+
+    def inc(self, valeur=1, **etiquettes):
+        registre.incrementer(self, valeur, etiquettes)
+
+    def lignes(self, etiquettes, valeur):
+        return [f"{self.nom}{_etiquettes(etiquettes)} {valeur}"]
+
+
+class Histogramme:
+    type = "histogram"
+
+    def __init__(self, nom, aide, etiquettes=(), seuils=SEUILS_SECONDES):
+        self.nom, self.aide, self.etiquettes, self.seuils = nom, aide, tuple(etiquettes), tuple(seuils)
+        registre.enregistrer(self)
+
+    def observer(self, valeur, **etiquettes):
+        registre.observer(self, valeur, etiquettes)
+
+    @contextmanager
+    def chronometrer(self, **etiquettes):
+        debut = perf_counter()
+        try:
+            yield
+        finally:
+            self.observer(perf_counter() - debut, **etiquettes)
+
+    def lignes(self, etiquettes, cases):
+        resultat, cumul = [], 0
+        for seuil, nombre in zip([*self.seuils, "+Inf"], cases[:-1]):
+            cumul += nombre
+            resultat.append(f"{self.nom}_bucket{_etiquettes({**etiquettes, 'le': seuil})} {cumul}")
+        resultat.append(f"{self.nom}_sum{_etiquettes(etiquettes)} {cases[-1]}")
+        resultat.append(f"{self.nom}_count{_etiquettes(etiquettes)} {cumul}")
+        return resultat
+
+
+RESERVATIONS_CREEES = Compteur("gareci_reservations_creees_total", "Reservations creees.")
+RESERVATIONS_REFUSEES = Compteur(
+    "gareci_reservations_refusees_total", "Reservations refusees, par motif de ValidationError.", ("motif",)
+)
+RESERVATION_DUREE = Histogramme("gareci_reservation_creer_secondes", "Duree de ReservationService.creer.")
+VERROU_ATTENTE = Histogramme(
+    "gareci_reservation_verrou_secondes", "Attente du verrou select_for_update sur le depart."
+)
+FILE_ECRITURE_ATTENTE = Histogramme(
+    "gareci_file_ecriture_secondes", "Attente de la file d'ecriture et du verrou SQLite (BEGIN IMMEDIATE)."
+)
+PAIEMENTS = Compteur("gareci_paiements_total", "Paiements traites, par issue.", ("statut",))
+RECHERCHE_DUREE = Histogramme("gareci_recherche_secondes", "Duree de la recherche de departs.")
+QR_RENDU = Histogramme("gareci_qr_rendu_secondes", "Generation du QR code d'un billet.")
+
+
+def exposer(request):
+    """
+    Vue /metrics. Avec METRIQUES_JETON, exige "Authorization: Bearer <jeton>" ;
+    sinon, reservee au staff connecte. La boucle locale n'est acceptee qu'en
+    DEBUG : derriere un proxy inverse sur la meme machine, toute requete
+    exterieure arrive de 127.0.0.1.
+    """
+    jeton = getattr(settings, "METRIQUES_JETON", None)
+    if jeton:
+        autorise = hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {jeton}")
+    else:
+        utilisateur = getattr(request, "user", None)
+        autorise = bool(utilisateur and utilisateur.is_staff) or (
+            settings.DEBUG and request.META.get("REMOTE_ADDR") in ("127.0.0.1", "::1")
+        )
+    if not autorise:
+        return HttpResponseForbidden()
+    return HttpResponse(registre.exposition(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,163 @@
+"""Profilage a la demande des requetes HTTP.
+
+Un membre du staff profile une requete avec `?profiler=1` ou l'en-tete
+`X-Profiler: 1` ; PROFILAGE_ECHANTILLON (0 par defaut) profile en plus une
+fraction aleatoire de toutes les requetes. Chaque profil (cProfile, fichier
+`.prof` lisible par pstats/snakeviz) est range dans PROFILAGE_REPERTOIRE avec
+ses metadonnees et le journal SQL de la requete (`.json`). Le repertoire est
+un tampon circulaire : au-dela de PROFILAGE_MAX profils, les plus anciens
+sont supprimes. Consultation : tableau de bord, rubrique Profils.
+"""
+import cProfile
+import json
+import os
+import pstats
+import random
+import re
+import tempfile
+import uuid
+from pathlib import Path
+from time import perf_counter
+
+from django.conf import settings
+from django.utils import timezone
+
+from .instrumentation import JournalSQL
+
+PARAMETRE = "profiler"
+EN_TETE = "X-Profiler"
+SQL_MAX = 500
+
+_IDENTIFIANT = re.compile(r"^\d{8}-\d{12}-[0-9a-f]{8}$")
+
+
+def repertoire():
+    return Path(getattr(settings, "PROFILAGE_REPERTOIRE", Path(settings.BASE_DIR) / "profils"))
+
+
+def demande_staff(request):
+    if request.GET.get(PARAMETRE) != "1" and request.headers.get(EN_TETE) != "1":
+        return False
+    utilisateur = getattr(request, "user", None)
+    return bool(utilisateur and utilisateur.is_authenticated and utilisateur.is_staff)
+
+
+def doit_profiler(request):
+    taux = getattr(settings, "PROFILAGE_ECHANTILLON", 0)
+    return demande_staff(request) or (taux > 0 and random.random() < taux)
+
+
+def enregistrer(request, profil, requetes, duree_ms, statut):
+    """Range le profil et ses metadonnees ; retourne l'identifiant attribue."""
+    dossier = repertoire()
+    dossier.mkdir(parents=True, exist_ok=True)
+    identifiant = f"{timezone.now():%Y%m%d-%H%M%S%f}-{uuid.uuid4().hex[:8]}"
+    profil.dump_stats(dossier / f"{identifiant}.prof")
+
+    utilisateur = getattr(request, "user", None)
+    metadonnees = {
+        "identifiant": identifiant,
+        "date": timezone.now().isoformat(),
+        "methode": request.method,
+        "chemin": request.get_full_path(),
+        "utilisateur": utilisateur.get_username() if utilisateur and utilisateur.is_authenticated else "",
+        "statut": statut,
+        "duree_ms": round(duree_ms, 1),
+        "nb_sql": len(requetes),
+        "duree_sql_ms": round(sum(duree for _, duree in requetes), 1),
+        "sql": [[sql, round(duree, 2)] for sql, duree in requetes[:SQL_MAX]],
+    }
+    # Le .json est ecrit en dernier (et atomiquement) : il rend le profil visible.
+    descripteur, temporaire = tempfile.mkstemp(dir=dossier, suffix=".tmp")
+    with os.fdopen(descripteur, "w") as fichier:
+        json.dump(metadonnees, fichier)
+    os.replace(temporaire, dossier / f"{identifiant}.json")
+    _elaguer(dossier)
+    return identifiant
+
+
+def _elaguer(dossier):
+    capacite = getattr(settings, "PROFILAGE_MAX", 50)
+    anciens = sorted(dossier.glob("*.json"), reverse=True)[capacite:]
+    for chemin in anciens:
+        chemin.with_suffix(".prof").unlink(missing_ok=True)
+        chemin.unlink(missing_ok=True)
+
+
+def profils():
+    """Metadonnees (sans le SQL) des profils conserves, du plus recent au plus ancien."""
+    resultat = []
+    for chemin in sorted(repertoire().glob("*.json"), reverse=True):
+        try:
+            metadonnees = json.loads(chemin.read_text())
+        except (OSError, ValueError):
+            continue
+        metadonnees.pop("sql", None)
+        resultat.append(metadonnees)
+    return resultat
+
+
+def chemin_profil(identifiant):
+    """Chemin du .prof, ou None si l'identifiant est invalide ou elague."""
+    if not _IDENTIFIANT.match(identifiant):
+        return None
+    chemin = repertoire() / f"{identifiant}.prof"
+    return chemin if chemin.exists() else None
+
+
+def lire(identifiant):
+    chemin = chemin_profil(identifiant)
+    if chemin is None:
+        return None
+    try:
+        return json.loads(chemin.with_suffix(".json").read_text())
+    except (OSError, ValueError):
+        return None
+
+
+TRIS = {"cumulative": 3, "tottime": 2, "ncalls": 1}
+
+
+def fonctions_principales(identifiant, tri="cumulative", nombre=40):
+    """[{fonction, appels, total_ms, cumule_ms}] triees par `tri` (cf. TRIS)."""
+    statistiques = pstats.Stats(str(chemin_profil(identifiant))).stats
+    lignes = sorted(statistiques.items(), key=lambda item: -item[1][TRIS.get(tri, 3)])[:nombre]
+    return [
+        {
+            "fonction": pstats.func_std_string(fonction),
+            "appels": f"{nc}/{cc}" if nc != cc else str(nc),
+            "total_ms": tt * 1000,
+            "cumule_ms": ct * 1000,
+        }
+        for fonction, (cc, nc, tt, ct, _) in lignes
+    ]
+
+
+class ProfilageMiddleware:
+    """A placer apres InstrumentationSQLMiddleware, dont il reprend le journal SQL."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not doit_profiler(request):
+            return self.get_response(request)
+
+        journal = getattr(request, "journal_sql", None)
+        propre = journal is None
+        if propre:
+            journal = JournalSQL()
+        premier = len(journal)
+        profil = cProfile.Profile()
+        debut = perf_counter()
+        if propre:
+            with journal.capturer():
+                response = profil.runcall(self.get_response, request)
+        else:
+            response = profil.runcall(self.get_response, request)
+        duree_ms = (perf_counter() - debut) * 1000
+
+        identifiant = enregistrer(request, profil, journal.requetes[premier:], duree_ms, response.status_code)
+        if demande_staff(request):
+            response["X-Profil"] = identifiant
+        return response
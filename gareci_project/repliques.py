@@ -0,0 +1,89 @@
+"""Lectures sur les repliques de la base.
+
+Les vues decorees par `@lecture_replique` (recherche, accueil, analytique,
+exports) lisent sur une replique tiree au hasard parmi REPLIQUES_LECTURE ;
+toutes les autres, et toutes les ecritures, restent sur `default`. Pour
+qu'un client relise ce qu'il vient d'ecrire malgre le retard de
+replication :
+
+- une ecriture bascule la suite de la requete sur le primaire ;
+- apres une requete POST/PUT/PATCH/DELETE ou une ecriture, la session lit
+  sur le primaire pendant REPLIQUES_COLLAGE_SECONDES ;
+- les sessions elles-memes sont toujours lues sur le primaire.
+
+Sans replique configuree (BASE_REPLIQUES, cf. base_de_donnees), le
+middleware se desactive et tout passe par `default`.
+"""
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+CLE_SESSION = "_primaire_jusqu_a"
+METHODES_SURES = ("GET", "HEAD", "OPTIONS", "TRACE")
+APPLIS_PRIMAIRE = {"sessions"}
+
+_alias_lecture = ContextVar("alias_lecture", default=None)
+_ecriture = ContextVar("ecriture", default=False)
+
+
+def lecture_replique(vue):
+    """Decorateur de vue : lectures autorisees sur une replique."""
+    vue.lecture_replique = True
+    return vue
+
+
+def repliques():
+    return list(getattr(settings, "REPLIQUES_LECTURE", []))
+
+
+class RouteurRepliques:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in APPLIS_PRIMAIRE:
+            return None
+        return _alias_lecture.get()
+
+    def db_for_write(self, model, **hints):
+        # Les lectures suivant une ecriture doivent la voir.
+        _alias_lecture.set(None)
+        _ecriture.set(True)
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Le schema des repliques vient de la replication.
+        return db not in repliques()
+
+
+class RepliquesMiddleware:
+    """A placer apres SessionMiddleware."""
+
+    def __init__(self, get_response):
+        if not repliques():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        alias = _alias_lecture.set(None)
+        ecriture = _ecriture.set(False)
+        try:
+            response = self.get_response(request)
+            a_ecrit = _ecriture.get()
+        finally:
+            _alias_lecture.reset(alias)
+            _ecriture.reset(ecriture)
+        if request.method not in METHODES_SURES or a_ecrit:
+            request.session[CLE_SESSION] = time.time() + getattr(settings, "REPLIQUES_COLLAGE_SECONDES", 10)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (
+            getattr(view_func, "lecture_replique", False)
+            and request.method in METHODES_SURES
+            and request.session.get(CLE_SESSION, 0) < time.time()
+        ):
+            _alias_lecture.set(random.choice(repliques()))
@@ -1,6 +1,9 @@
 import os
 from pathlib import Path
 
+from gareci_project import cache
+from gareci_project.base_de_donnees import configuration, configuration_repliques
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -39,6 +42,9 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'gareci_project.repliques.RepliquesMiddleware',
+    'gareci_project.instrumentation.InstrumentationSQLMiddleware',
+    'gareci_project.profilage.ProfilageMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -56,6 +62,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'gareci_project.cache.versions',
             ],
         },
     },
@@ -66,13 +73,33 @@ WSGI_APPLICATION = 'gareci_project.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+# SQLite par defaut ; BASE_MOTEUR=postgresql et variables BASE_* pour la
+# production (gareci_project/base_de_donnees.py).
 
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': configuration(BASE_DIR),
+    **configuration_repliques(BASE_DIR),
+}
+
+# Lectures des vues @lecture_replique sur les repliques (gareci_project/repliques.py),
+# puis primaire pendant REPLIQUES_COLLAGE_SECONDES apres une ecriture de la session.
+DATABASE_ROUTERS = ['gareci_project.repliques.RouteurRepliques']
+REPLIQUES_LECTURE = [alias for alias in DATABASES if alias != 'default']
+REPLIQUES_COLLAGE_SECONDES = int(env("REPLIQUES_COLLAGE_SECONDES", "10"))
+
+# Cache (gareci_project/cache.py). Fragments du referentiel et pages anonymes
+# sont invalides a chaque enregistrement d'une Ville ou d'un Trip.
+# ATTENTION : le defaut locmem ne convient qu'a un seul processus (runserver,
+# tests). Avec plusieurs workers (gunicorn, uwsgi), chacun garde sa propre
+# version du referentiel et `invalider()` n'atteint que le worker qui a
+# enregistre : les autres servent des pages perimees jusqu'a expiration.
+# En production multi-worker, definir CACHE_MOTEUR=fichier (une machine) ou
+# CACHE_MOTEUR=redis (plusieurs machines).
+CACHES = {
+    'default': cache.configuration(BASE_DIR),
 }
+CACHE_FRAGMENTS_SECONDES = int(env("CACHE_FRAGMENTS_SECONDES", "3600"))
+CACHE_PAGES_SECONDES = int(env("CACHE_PAGES_SECONDES", "300"))
 
 
 # Password validation
@@ -121,6 +148,23 @@ AUTH_USER_MODEL = 'accounts.CustomUser'
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
 
+# Instrumentation SQL par requete (gareci_project/instrumentation.py) :
+# au-dela, un avertissement est journalise sur le logger "gareci.sql".
+SQL_BUDGET_REQUETES = 50
+SQL_BUDGET_MS = 500
+
+# Metriques Prometheus (gareci_project/metriques.py), exposees sur /metrics.
+# Avec plusieurs workers, METRIQUES_REPERTOIRE doit etre partage par tous.
+# Hors DEBUG, /metrics exige METRIQUES_JETON (collecteur) ou un compte staff.
+METRIQUES_REPERTOIRE = env("METRIQUES_REPERTOIRE")
+METRIQUES_JETON = env("METRIQUES_JETON")
+
+# Profilage a la demande (gareci_project/profilage.py) : ?profiler=1 pour le
+# staff, plus une fraction PROFILAGE_ECHANTILLON de toutes les requetes.
+PROFILAGE_REPERTOIRE = BASE_DIR / "profils"
+PROFILAGE_MAX = 50
+PROFILAGE_ECHANTILLON = float(env("PROFILAGE_ECHANTILLON", "0"))
+
 # Email configuration pour développement
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'
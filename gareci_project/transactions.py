@@ -0,0 +1,42 @@
+"""Transactions d'ecriture contendues (creation de reservation).
+
+Sous SQLite, une transaction ouverte par un simple BEGIN ne prend le verrou
+d'ecriture qu'a son premier INSERT/UPDATE : deux reservations simultanees
+peuvent alors echouer en "database is locked" sans que busy_timeout n'aide.
+`transaction_ecriture()` ouvre la transaction en BEGIN IMMEDIATE, qui attend
+le verrou (busy_timeout) des le debut, et fait passer une a une les
+ecritures d'un meme processus (file d'attente sur un verrou). Les lecteurs
+ne sont pas concernes : en WAL ils ne sont jamais bloques par l'ecrivain.
+Sur les autres moteurs, c'est `transaction.atomic()`.
+"""
+import threading
+from contextlib import contextmanager
+from time import perf_counter
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from . import metriques
+
+_file_ecriture = threading.Lock()
+
+
+@contextmanager
+def transaction_ecriture(using=DEFAULT_DB_ALIAS):
+    connexion = connections[using]
+    if connexion.vendor != "sqlite" or connexion.in_atomic_block:
+        # Deja dans une transaction : BEGIN est passe, seul un savepoint est possible.
+        with transaction.atomic(using=using):
+            yield
+        return
+
+    debut = perf_counter()
+    with _file_ecriture:
+        connexion.ensure_connection()
+        mode = connexion.transaction_mode
+        connexion.transaction_mode = "IMMEDIATE"
+        try:
+            with transaction.atomic(using=using):
+                metriques.FILE_ECRITURE_ATTENTE.observer(perf_counter() - debut)
+                yield
+        finally:
+            connexion.transaction_mode = mode
@@ -17,10 +17,13 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from .metriques import exposer
+
 urlpatterns = [
     path('', include('trips.urls')),           # Accueil et recherche de trajets
     path('accounts/', include('accounts.urls')),
     path('reservations/', include('reservations.urls')),
     path('dashboard/', include('gareci_admin.urls')),  # Tableau de bord admin personnalisé
     path('admin/', admin.site.urls),  # Admin Django par défaut (superuser)
+    path('metrics', exposer, name='metrics'),  # Metriques Prometheus (METRIQUES_JETON)
 ]
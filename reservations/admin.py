@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import ContactMessage, Reservation, Ticket
+from .models import ArchivedReservation, ContactMessage, Reservation, Ticket
 
 @admin.register(ContactMessage)
 class ContactMessageAdmin(admin.ModelAdmin):
@@ -16,6 +16,14 @@ class ReservationAdmin(admin.ModelAdmin):
     readonly_fields = ('created_at',)
 
 
+@admin.register(ArchivedReservation)
+class ArchivedReservationAdmin(admin.ModelAdmin):
+    list_display = ("id", "reference", "utilisateur", "trajet", "date_voyage", "statut", "archived_at")
+    search_fields = ("reference", "utilisateur__username", "trajet")
+    list_filter = ("statut", "date_voyage")
+    list_select_related = ("utilisateur",)
+
+
 @admin.register(Ticket)
 class TicketAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'bus', 'num_seiges', 'prix', 'created_at')
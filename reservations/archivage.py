@@ -0,0 +1,76 @@
+"""Archivage des reservations anciennes dans ArchivedReservation.
+
+Chaque lot copie les reservations (avec paiement, trajet et horaires) puis
+les supprime de la table chaude dans la meme transaction : une reservation
+est toujours dans l'une des deux tables, jamais dans les deux. Les compteurs
+du tableau de bord ne changent pas, les lignes archivees restent comptees.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from gareci_admin.signals import conserver_compteurs
+
+from .models import ArchivedReservation, Reservation
+
+TAILLE_LOT = 1000
+
+CHAMPS = {
+    "id": "pk",
+    "utilisateur_id": "utilisateur_id",
+    "depart_id": "depart_id",
+    "reference": "reference",
+    "trajet": "depart__trip__nom",
+    "ville_depart": "depart__trip__arret_depart__ville__nom",
+    "ville_arrivee": "depart__trip__arret_arrivee__ville__nom",
+    "heure_depart": "depart__heure_depart",
+    "heure_arrivee": "depart__heure_arrivee",
+    "date_voyage": "date_voyage",
+    "nombre_places": "nombre_places",
+    "prix_total": "prix_total",
+    "statut": "statut",
+    "created_at": "created_at",
+    "paiement_statut": "paiement__statut",
+    "paiement_montant": "paiement__montant",
+    "paiement_reference": "paiement__reference_paiement",
+}
+
+
+def date_limite(jours=None):
+    """Les voyages anterieurs a cette date sont archives (defaut : ARCHIVE_RESERVATIONS_JOURS)."""
+    if jours is None:
+        jours = getattr(settings, "ARCHIVE_RESERVATIONS_JOURS", 180)
+    return timezone.localdate() - timedelta(days=jours)
+
+
+def _archive(ligne):
+    valeurs = {champ: ligne[source] for champ, source in CHAMPS.items()}
+    valeurs["paiement_statut"] = valeurs["paiement_statut"] or ""
+    valeurs["paiement_reference"] = valeurs["paiement_reference"] or ""
+    return ArchivedReservation(**valeurs)
+
+
+def archiver(avant=None, taille_lot=TAILLE_LOT, pause=0, simulation=False):
+    """Deplace les reservations voyageant avant `avant` ; retourne le nombre deplace."""
+    a_archiver = Reservation.objects.filter(date_voyage__lt=avant or date_limite())
+    if simulation:
+        return a_archiver.count()
+
+    total = 0
+    while True:
+        with transaction.atomic():
+            lignes = list(a_archiver.order_by("pk").values(*CHAMPS.values())[:taille_lot])
+            if not lignes:
+                break
+            ArchivedReservation.objects.bulk_create([_archive(ligne) for ligne in lignes])
+            with conserver_compteurs():
+                Reservation.objects.filter(pk__in=[ligne["pk"] for ligne in lignes]).delete()
+        total += len(lignes)
+        if len(lignes) < taille_lot:
+            break
+        if pause:
+            time.sleep(pause)
+    return total
@@ -0,0 +1,129 @@
+"""Boite d'envoi des reponses aux messages de contact.
+
+La vue de reponse ne fait que programmer l'envoi ; `manage.py
+envoyer_reponses` vide la file par lots, sur une seule connexion SMTP par
+lot. Un echec reporte l'envoi avec un delai exponentiel, jusqu'a
+`REPONSES_TENTATIVES_MAX` tentatives ; le message passe alors en ECHEC.
+"""
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ContactMessage, StatutEnvoi
+
+TAILLE_LOT = 100
+
+
+def tentatives_max():
+    return getattr(settings, "REPONSES_TENTATIVES_MAX", 5)
+
+
+def delai_relance(tentative):
+    """Delai avant la tentative suivante : base * 2^(tentative - 1), plafonne."""
+    base = getattr(settings, "REPONSES_DELAI_BASE_SECONDES", 60)
+    plafond = getattr(settings, "REPONSES_DELAI_MAX_SECONDES", 6 * 3600)
+    return timedelta(seconds=min(base * 2 ** (tentative - 1), plafond))
+
+
+def _bail():
+    # Un message reserve par un worker n'est repris par un autre qu'apres ce delai.
+    return timedelta(seconds=getattr(settings, "REPONSES_BAIL_SECONDES", 300))
+
+
+def email_reponse(contact):
+    return EmailMessage(
+        subject="Reponse a votre message de contact - Gareci",
+        body=f"""Bonjour {contact.name},
+
+Voici notre reponse a votre message du {contact.submitted_at:%d/%m/%Y %H:%M}:
+
+{contact.reply}
+
+Cordialement,
+L'equipe Gareci""",
+        to=[contact.email],
+    )
+
+
+@dataclass
+class RapportEnvoi:
+    envoyes: int = 0
+    reportes: int = 0
+    abandonnes: int = 0
+
+    @property
+    def traites(self):
+        return self.envoyes + self.reportes + self.abandonnes
+
+
+def reserver(limite=TAILLE_LOT):
+    """
+    Reserve jusqu'a `limite` reponses dues en repoussant leur prochain envoi
+    de la duree du bail : deux workers ne prennent pas le meme message.
+    """
+    maintenant = timezone.now()
+    with transaction.atomic():
+        pks = list(
+            ContactMessage.objects.select_for_update(skip_locked=True)
+            .filter(statut_envoi=StatutEnvoi.EN_ATTENTE, prochain_envoi__lte=maintenant)
+            .order_by("prochain_envoi")
+            .values_list("pk", flat=True)[:limite]
+        )
+        ContactMessage.objects.filter(pk__in=pks).update(prochain_envoi=maintenant + _bail())
+    return list(ContactMessage.objects.filter(pk__in=pks).order_by("pk"))
+
+
+def _echec(contact, erreur, maintenant, rapport):
+    contact.tentatives_envoi += 1
+    contact.erreur_envoi = f"{type(erreur).__name__}: {erreur}"[:1000]
+    if contact.tentatives_envoi >= tentatives_max():
+        contact.statut_envoi = StatutEnvoi.ECHEC
+        contact.prochain_envoi = None
+        rapport.abandonnes += 1
+    else:
+        contact.prochain_envoi = maintenant + delai_relance(contact.tentatives_envoi)
+        rapport.reportes += 1
+
+
+def envoyer(limite=TAILLE_LOT, connection=None):
+    """Envoie un lot de reponses dues sur une connexion ; retourne un RapportEnvoi."""
+    rapport = RapportEnvoi()
+    contacts = reserver(limite)
+    if not contacts:
+        return rapport
+
+    connection = connection or get_connection()
+    maintenant = timezone.now()
+    try:
+        connection.open()
+    except Exception as erreur:
+        for contact in contacts:
+            _echec(contact, erreur, maintenant, rapport)
+    else:
+        try:
+            for contact in contacts:
+                email = email_reponse(contact)
+                email.connection = connection
+                try:
+                    email.send()
+                except Exception as erreur:
+                    _echec(contact, erreur, maintenant, rapport)
+                else:
+                    contact.statut_envoi = StatutEnvoi.ENVOYE
+                    contact.tentatives_envoi += 1
+                    contact.envoye_at = timezone.now()
+                    contact.prochain_envoi = None
+                    contact.erreur_envoi = ""
+                    rapport.envoyes += 1
+        finally:
+            connection.close()
+
+    ContactMessage.objects.bulk_update(
+        contacts,
+        ["statut_envoi", "tentatives_envoi", "prochain_envoi", "envoye_at", "erreur_envoi"],
+    )
+    return rapport
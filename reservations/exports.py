@@ -0,0 +1,81 @@
+"""Export en flux (CSV / JSONL) des reservations jointes au paiement, depart et trajet.
+
+Les lignes sont lues par `values_list().iterator(chunk_size=...)` (curseur
+serveur sous PostgreSQL) puis formatees une a une : la memoire reste
+constante quel que soit le volume et l'en-tete part avant la premiere requete.
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Reservation
+
+TAILLE_LOT = 2000
+
+# (nom de colonne exportee, chemin ORM)
+COLONNES = [
+    ("reference", "reference"),
+    ("date_voyage", "date_voyage"),
+    ("statut", "statut"),
+    ("nombre_places", "nombre_places"),
+    ("prix_total", "prix_total"),
+    ("cree_le", "created_at"),
+    ("client", "utilisateur__username"),
+    ("email", "utilisateur__email"),
+    ("trajet", "depart__trip__nom"),
+    ("ville_depart", "depart__trip__arret_depart__ville__nom"),
+    ("ville_arrivee", "depart__trip__arret_arrivee__ville__nom"),
+    ("depart_id", "depart_id"),
+    ("heure_depart", "depart__heure_depart"),
+    ("heure_arrivee", "depart__heure_arrivee"),
+    ("bus", "depart__bus__immatriculation"),
+    ("paiement_reference", "paiement__reference_paiement"),
+    ("paiement_statut", "paiement__statut"),
+    ("paiement_montant", "paiement__montant"),
+    ("paiement_maj_le", "paiement__updated_at"),
+]
+ENTETES = [nom for nom, _ in COLONNES]
+
+
+def filtrer_reservations(du=None, au=None, trajet=None, statut=None):
+    """Reservations a exporter, triees par cle primaire (ordre stable pour le curseur)."""
+    reservations = Reservation.objects.all()
+    if du:
+        reservations = reservations.filter(date_voyage__gte=du)
+    if au:
+        reservations = reservations.filter(date_voyage__lte=au)
+    if trajet:
+        reservations = reservations.filter(depart__trip=trajet)
+    if statut:
+        reservations = reservations.filter(statut=statut)
+    return reservations.order_by("pk")
+
+
+def _lignes(reservations, taille_lot):
+    return reservations.values_list(*[chemin for _, chemin in COLONNES]).iterator(chunk_size=taille_lot)
+
+
+class _Tampon:
+    """Pseudo-fichier : csv.writer renvoie la ligne formatee au lieu de la stocker."""
+
+    def write(self, valeur):
+        return valeur
+
+
+def lignes_csv(reservations, taille_lot=TAILLE_LOT):
+    writer = csv.writer(_Tampon())
+    yield writer.writerow(ENTETES)
+    for ligne in _lignes(reservations, taille_lot):
+        yield writer.writerow(ligne)
+
+
+def lignes_jsonl(reservations, taille_lot=TAILLE_LOT):
+    for ligne in _lignes(reservations, taille_lot):
+        yield json.dumps(dict(zip(ENTETES, ligne)), cls=DjangoJSONEncoder, ensure_ascii=False) + "\n"
+
+
+FORMATS = {
+    "csv": (lignes_csv, "text/csv; charset=utf-8"),
+    "jsonl": (lignes_jsonl, "application/x-ndjson; charset=utf-8"),
+}
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from reservations import archivage
+
+
+class Command(BaseCommand):
+    help = (
+        "Deplace par lots les reservations dont le voyage est ancien (et leur paiement) "
+        "vers la table d'archive ArchivedReservation."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--jours",
+            type=int,
+            help="Archive les voyages de plus de N jours (defaut : ARCHIVE_RESERVATIONS_JOURS).",
+        )
+        parser.add_argument("--taille-lot", type=int, default=archivage.TAILLE_LOT)
+        parser.add_argument("--pause", type=float, default=0.1, help="Secondes d'attente entre deux lots.")
+        parser.add_argument("--dry-run", action="store_true", help="Compte sans rien deplacer.")
+
+    def handle(self, *args, **options):
+        avant = archivage.date_limite(options["jours"])
+        total = archivage.archiver(
+            avant=avant,
+            taille_lot=options["taille_lot"],
+            pause=options["pause"],
+            simulation=options["dry_run"],
+        )
+        verbe = "a archiver" if options["dry_run"] else "archivee(s)"
+        self.stdout.write(self.style.SUCCESS(f"{total} reservation(s) {verbe} (voyages avant le {avant:%d/%m/%Y})."))
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from reservations import boite_envoi
+
+
+class Command(BaseCommand):
+    help = (
+        "Envoie les reponses aux messages de contact en attente. Avec --boucle, "
+        "tourne en continu comme worker (a superviser par systemd ou equivalent)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limite", type=int, default=boite_envoi.TAILLE_LOT, help="Messages par lot.")
+        parser.add_argument("--boucle", action="store_true", help="Ne s'arrete pas une fois la file videe.")
+        parser.add_argument("--intervalle", type=float, default=5, help="Secondes d'attente quand la file est vide.")
+
+    def handle(self, *args, **options):
+        while True:
+            rapport = boite_envoi.envoyer(limite=options["limite"])
+            if rapport.traites:
+                self.stdout.write(
+                    f"{rapport.envoyes} envoye(s), {rapport.reportes} reporte(s), {rapport.abandonnes} abandonne(s)."
+                )
+            if rapport.traites >= options["limite"]:
+                continue
+            if not options["boucle"]:
+                break
+            time.sleep(options["intervalle"])
@@ -0,0 +1,39 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from reservations.exports import FORMATS, TAILLE_LOT, filtrer_reservations
+from reservations.models import ReservationStatus
+
+
+class Command(BaseCommand):
+    help = "Exporte en flux les reservations (avec paiement, depart et trajet) en CSV ou JSONL."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=sorted(FORMATS), default="csv")
+        parser.add_argument("--du", type=date.fromisoformat, help="Date de voyage minimale (AAAA-MM-JJ).")
+        parser.add_argument("--au", type=date.fromisoformat, help="Date de voyage maximale (AAAA-MM-JJ).")
+        parser.add_argument("--trajet", type=int, help="Identifiant du trajet (Trip).")
+        parser.add_argument("--statut", choices=ReservationStatus.values)
+        parser.add_argument("--sortie", help="Fichier de sortie (defaut : sortie standard).")
+        parser.add_argument("--taille-lot", type=int, default=TAILLE_LOT)
+
+    def handle(self, *args, **options):
+        if options["du"] and options["au"] and options["du"] > options["au"]:
+            raise CommandError("--du doit preceder --au.")
+
+        reservations = filtrer_reservations(
+            du=options["du"],
+            au=options["au"],
+            trajet=options["trajet"],
+            statut=options["statut"],
+        )
+        generateur, _ = FORMATS[options["format"]]
+
+        morceaux = generateur(reservations, taille_lot=options["taille_lot"])
+        if options["sortie"]:
+            with open(options["sortie"], "w", encoding="utf-8", newline="") as fichier:
+                fichier.writelines(morceaux)
+        else:
+            for morceau in morceaux:
+                self.stdout.write(morceau, ending="")
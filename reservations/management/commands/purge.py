@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from reservations import retention
+
+
+class Command(BaseCommand):
+    help = (
+        "Applique les politiques de retention (messages repondus, reservations annulees, "
+        "paiements echoues) par lots de cles primaires, puis supprime les medias orphelins."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--politique",
+            action="append",
+            choices=[*retention.RETENTION_JOURS, "medias"],
+            help="Politique a appliquer (repetable ; defaut : toutes).",
+        )
+        parser.add_argument("--taille-lot", type=int, default=retention.TAILLE_LOT)
+        parser.add_argument("--pause", type=float, default=0.1, help="Secondes d'attente entre deux lots.")
+        parser.add_argument("--dry-run", action="store_true", help="Compte sans rien supprimer.")
+
+    def handle(self, *args, **options):
+        choisies = set(options["politique"] or [*retention.RETENTION_JOURS, "medias"])
+        simulation = options["dry_run"]
+        verbe = "a supprimer" if simulation else "supprime(s)"
+
+        for politique in retention.politiques():
+            if politique.nom not in choisies:
+                continue
+            total = retention.purger(
+                politique.lignes,
+                taille_lot=options["taille_lot"],
+                pause=options["pause"],
+                simulation=simulation,
+            )
+            self.stdout.write(f"{politique.description} : {total} {verbe}.")
+
+        if "medias" in choisies:
+            nombre, octets = retention.purger_medias(simulation=simulation, pause=options["pause"])
+            self.stdout.write(f"Medias orphelins : {nombre} {verbe} ({filesizeformat(octets)}).")
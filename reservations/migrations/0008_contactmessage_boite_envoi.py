@@ -0,0 +1,42 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0007_rename_booked_at_reservation_created_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contactmessage',
+            name='envoye_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='contactmessage',
+            name='erreur_envoi',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='contactmessage',
+            name='prochain_envoi',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='contactmessage',
+            name='statut_envoi',
+            field=models.CharField(blank=True, choices=[('EN_ATTENTE', "En attente d'envoi"), ('ENVOYE', 'Envoye'), ('ECHEC', 'Echec definitif')], default='', max_length=12),
+        ),
+        migrations.AddField(
+            model_name='contactmessage',
+            name='tentatives_envoi',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='contactmessage',
+            index=models.Index(fields=['statut_envoi', 'prochain_envoi'], name='contact_envoi_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:34
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0008_contactmessage_boite_envoi'),
+        ('trips', '0013_bus_echeance_revision'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedReservation',
+            fields=[
+                ('id', models.BigIntegerField(help_text="Identifiant de la reservation d'origine", primary_key=True, serialize=False)),
+                ('reference', models.CharField(max_length=12, unique=True)),
+                ('trajet', models.CharField(blank=True, max_length=100)),
+                ('ville_depart', models.CharField(blank=True, max_length=100)),
+                ('ville_arrivee', models.CharField(blank=True, max_length=100)),
+                ('heure_depart', models.TimeField(blank=True, null=True)),
+                ('heure_arrivee', models.TimeField(blank=True, null=True)),
+                ('date_voyage', models.DateField()),
+                ('nombre_places', models.PositiveSmallIntegerField(default=1)),
+                ('prix_total', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('statut', models.CharField(choices=[('EN_ATTENTE', 'En attente'), ('CONFIRMEE', 'Confirmee'), ('ANNULEE', 'Annulee')], max_length=20)),
+                ('created_at', models.DateTimeField()),
+                ('paiement_statut', models.CharField(blank=True, choices=[('EN_ATTENTE', 'En attente'), ('REUSSI', 'Reussi'), ('ECHOUE', 'Echoue'), ('ANNULE', 'Annule')], max_length=20)),
+                ('paiement_montant', models.DecimalField(blank=True, decimal_places=2, max_digits=8, null=True)),
+                ('paiement_reference', models.CharField(blank=True, max_length=20)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('depart', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reservations_archivees', to='trips.depart')),
+                ('utilisateur', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations_archivees', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Reservation archivee',
+                'verbose_name_plural': 'Reservations archivees',
+                'indexes': [models.Index(fields=['utilisateur', '-created_at'], name='archive_utilisateur_idx')],
+            },
+        ),
+    ]
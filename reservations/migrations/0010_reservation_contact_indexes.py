@@ -0,0 +1,36 @@
+# Generated by Django 5.2.4 on 2026-10-19 18:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0009_archived_reservation'),
+        ('trips', '0013_bus_echeance_revision'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='contactmessage',
+            index=models.Index(fields=['email', '-submitted_at'], name='contact_email_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contactmessage',
+            index=models.Index(fields=['-submitted_at'], name='contact_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['depart', 'date_voyage', 'statut', 'nombre_places'], name='reservation_dispo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['utilisateur', 'statut'], name='reservation_utilisateur_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['date_voyage', 'statut'], name='reservation_jour_idx'),
+        ),
+    ]
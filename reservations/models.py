@@ -19,6 +19,12 @@ class ReservationStatus(models.TextChoices):
     ANNULEE = "ANNULEE", "Annulee"
 
 
+class StatutEnvoi(models.TextChoices):
+    EN_ATTENTE = "EN_ATTENTE", "En attente d'envoi"
+    ENVOYE = "ENVOYE", "Envoye"
+    ECHEC = "ECHEC", "Echec definitif"
+
+
 class ContactMessage(models.Model):
     name = models.CharField(max_length=100)
     email = models.EmailField()
@@ -26,6 +32,27 @@ class ContactMessage(models.Model):
     submitted_at = models.DateTimeField(auto_now_add=True)
     reply = models.TextField(blank=True, null=True)
     replied_at = models.DateTimeField(blank=True, null=True)
+    # Boite d'envoi de la reponse, videe par `manage.py envoyer_reponses`.
+    statut_envoi = models.CharField(max_length=12, choices=StatutEnvoi.choices, blank=True, default="")
+    tentatives_envoi = models.PositiveSmallIntegerField(default=0)
+    prochain_envoi = models.DateTimeField(blank=True, null=True)
+    envoye_at = models.DateTimeField(blank=True, null=True)
+    erreur_envoi = models.TextField(blank=True, default="")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["statut_envoi", "prochain_envoi"], name="contact_envoi_idx"),
+            # Messages d'un client (espace client) et liste du tableau de bord, du plus recent au plus ancien.
+            models.Index(fields=["email", "-submitted_at"], name="contact_email_idx"),
+            models.Index(fields=["-submitted_at"], name="contact_date_idx"),
+        ]
+
+    def mettre_en_file(self):
+        """Programme l'envoi immediat de la reponse (a enregistrer ensuite)."""
+        self.statut_envoi = StatutEnvoi.EN_ATTENTE
+        self.tentatives_envoi = 0
+        self.prochain_envoi = timezone.now()
+        self.erreur_envoi = ""
 
 
 class Reservation(models.Model):
@@ -46,6 +73,16 @@ class Reservation(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Places reservees d'un depart a une date (SUM couvert par l'index, sans lire la table).
+            models.Index(fields=["depart", "date_voyage", "statut", "nombre_places"], name="reservation_dispo_idx"),
+            # Quota de reservations actives et statistiques du profil.
+            models.Index(fields=["utilisateur", "statut"], name="reservation_utilisateur_idx"),
+            # Reservations du jour et occupation du tableau de bord.
+            models.Index(fields=["date_voyage", "statut"], name="reservation_jour_idx"),
+        ]
+
     def __str__(self):
         return f"Reservation #{self.id} - {self.depart}"
 
@@ -127,3 +164,46 @@ class Paiement(models.Model):
         if not self.reference_paiement:
             self.reference_paiement = "PAY-" + "".join(random.choices(string.ascii_uppercase + string.digits, k=10))
         super().save(*args, **kwargs)
+
+
+class ArchivedReservation(models.Model):
+    """Reservation (et son paiement) d'un voyage ancien, deplacee par `manage.py archiver_reservations`.
+
+    Copie figee : le trajet et les horaires sont recopies pour survivre a la
+    modification ou a la suppression du depart.
+    """
+
+    archivee = True
+
+    id = models.BigIntegerField(primary_key=True, help_text="Identifiant de la reservation d'origine")
+    utilisateur = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="reservations_archivees"
+    )
+    depart = models.ForeignKey(
+        Depart, on_delete=models.SET_NULL, null=True, blank=True, related_name="reservations_archivees"
+    )
+    reference = models.CharField(max_length=12, unique=True)
+    trajet = models.CharField(max_length=100, blank=True)
+    ville_depart = models.CharField(max_length=100, blank=True)
+    ville_arrivee = models.CharField(max_length=100, blank=True)
+    heure_depart = models.TimeField(null=True, blank=True)
+    heure_arrivee = models.TimeField(null=True, blank=True)
+    date_voyage = models.DateField()
+    nombre_places = models.PositiveSmallIntegerField(default=1)
+    prix_total = models.DecimalField(max_digits=10, decimal_places=2)
+    statut = models.CharField(max_length=20, choices=ReservationStatus.choices)
+    created_at = models.DateTimeField()
+    paiement_statut = models.CharField(max_length=20, choices=Paiement.Statut.choices, blank=True)
+    paiement_montant = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True)
+    paiement_reference = models.CharField(max_length=20, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Reservation archivee"
+        verbose_name_plural = "Reservations archivees"
+        indexes = [
+            models.Index(fields=["utilisateur", "-created_at"], name="archive_utilisateur_idx"),
+        ]
+
+    def __str__(self):
+        return f"Reservation archivee #{self.id} - {self.trajet}"
@@ -0,0 +1,139 @@
+"""Politiques de retention appliquees par `manage.py purge`.
+
+Les lignes sont supprimees par lots de `taille_lot` cles primaires lus par
+pagination sur la cle (pk > derniere cle traitee) : un lot ne coute qu'un
+SELECT et un DELETE, quelle que soit la dispersion des cles, et chaque lot
+est une transaction courte, ce qui borne la memoire des suppressions en cascade et
+laisse passer les ecritures concurrentes entre deux lots. Les signaux
+post_delete restent emis, les compteurs du tableau de bord suivent donc.
+"""
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import models, transaction
+from django.utils import timezone
+
+from .models import ContactMessage, Paiement, Reservation, ReservationStatus, StatutEnvoi
+
+RETENTION_JOURS = {
+    "messages": 180,
+    "reservations_annulees": 365,
+    "paiements_echoues": 90,
+}
+TAILLE_LOT = 1000
+
+
+def retention(nom):
+    """Jours de conservation de la politique `nom` (surchargeables par PURGE_RETENTION_JOURS)."""
+    return timedelta(days=getattr(settings, "PURGE_RETENTION_JOURS", {}).get(nom, RETENTION_JOURS[nom]))
+
+
+@dataclass
+class Politique:
+    nom: str
+    description: str
+    lignes: models.QuerySet
+
+
+def politiques():
+    maintenant = timezone.now()
+    return [
+        Politique(
+            "messages",
+            "Messages de contact repondus",
+            ContactMessage.objects.filter(replied_at__lt=maintenant - retention("messages")).exclude(
+                statut_envoi=StatutEnvoi.EN_ATTENTE
+            ),
+        ),
+        Politique(
+            "reservations_annulees",
+            "Reservations annulees (date de voyage passee)",
+            Reservation.objects.filter(
+                statut=ReservationStatus.ANNULEE,
+                date_voyage__lt=timezone.localdate() - retention("reservations_annulees"),
+            ),
+        ),
+        Politique(
+            "paiements_echoues",
+            "Paiements echoues ou annules",
+            Paiement.objects.filter(
+                statut__in=[Paiement.Statut.ECHOUE, Paiement.Statut.ANNULE],
+                updated_at__lt=maintenant - retention("paiements_echoues"),
+            ),
+        ),
+    ]
+
+
+def purger(lignes, taille_lot=TAILLE_LOT, pause=0, simulation=False):
+    """Supprime `lignes` par lots de `taille_lot` cles ; retourne le nombre de lignes du modele."""
+    if simulation:
+        return lignes.count()
+
+    label = lignes.model._meta.label
+    total = 0
+    restantes = lignes
+    while True:
+        with transaction.atomic():
+            cles = list(restantes.order_by("pk").values_list("pk", flat=True)[:taille_lot])
+            if not cles:
+                break
+            # Le filtre de `lignes` est reapplique : une ligne modifiee entre-temps est epargnee.
+            _, detail = lignes.filter(pk__in=cles).delete()
+        total += detail.get(label, 0)
+        if len(cles) < taille_lot:
+            break
+        restantes = lignes.filter(pk__gt=cles[-1])
+        if pause:
+            time.sleep(pause)
+    return total
+
+
+def _dossiers_medias():
+    """{dossier d'upload: [(modele, champ)]} pour tous les FileField a upload_to fixe."""
+    dossiers = {}
+    for modele in apps.get_models():
+        for champ in modele._meta.get_fields():
+            if isinstance(champ, models.FileField) and isinstance(champ.upload_to, str) and champ.upload_to:
+                dossiers.setdefault(champ.upload_to.strip("/"), []).append((modele, champ.name))
+    return dossiers
+
+
+def medias_orphelins(delai_grace=None):
+    """
+    (chemin, taille) des fichiers des dossiers d'upload (qrcodes/, buses/...)
+    qu'aucune ligne ne reference. Les fichiers recents sont ignores : ils
+    peuvent avoir ete ecrits juste avant l'enregistrement de leur ligne.
+    """
+    delai_grace = delai_grace or timedelta(hours=getattr(settings, "PURGE_MEDIAS_GRACE_HEURES", 24))
+    limite = timezone.now() - delai_grace
+    for dossier, champs in sorted(_dossiers_medias().items()):
+        if not default_storage.exists(dossier):
+            continue
+        references = set()
+        for modele, nom in champs:
+            references.update(
+                modele._default_manager.exclude(**{nom: ""}).exclude(**{f"{nom}__isnull": True})
+                .values_list(nom, flat=True).iterator()
+            )
+        for fichier in default_storage.listdir(dossier)[1]:
+            chemin = f"{dossier}/{fichier}"
+            if chemin in references or default_storage.get_modified_time(chemin) > limite:
+                continue
+            yield chemin, default_storage.size(chemin)
+
+
+def purger_medias(simulation=False, pause=0, taille_lot=TAILLE_LOT):
+    """Supprime les medias orphelins ; retourne (nombre de fichiers, octets liberes)."""
+    nombre = octets = 0
+    for chemin, taille in medias_orphelins():
+        if not simulation:
+            default_storage.delete(chemin)
+        nombre += 1
+        octets += taille
+        if pause and not simulation and nombre % taille_lot == 0:
+            time.sleep(pause)
+    return nombre, octets
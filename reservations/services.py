@@ -1,14 +1,16 @@
 from datetime import datetime, timedelta
 from decimal import Decimal
+from time import perf_counter
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 from django.core.mail import send_mail
-from django.db import transaction
 from django.utils import timezone
 
 from gareci_admin.models import PolitiqueReservation
+from gareci_project import metriques
+from gareci_project.transactions import transaction_ecriture
 from trips.models import Depart
 
 from .models import Reservation, ReservationStatus, Ticket
@@ -16,33 +18,57 @@ from .models import Reservation, ReservationStatus, Ticket
 
 class ReservationService:
     @staticmethod
-    @transaction.atomic
     def creer(depart_id, date_voyage, utilisateur, nombre_places):
+        with metriques.RESERVATION_DUREE.chronometrer():
+            try:
+                reservation = ReservationService._creer(depart_id, date_voyage, utilisateur, nombre_places)
+            except ValidationError as erreur:
+                # Une ValidationError par champ (dict) n'a pas de code.
+                metriques.RESERVATIONS_REFUSEES.inc(motif=getattr(erreur, "code", None) or "autre")
+                raise
+        metriques.RESERVATIONS_CREEES.inc()
+        return reservation
+
+    @staticmethod
+    @transaction_ecriture()
+    def _creer(depart_id, date_voyage, utilisateur, nombre_places):
         politique = PolitiqueReservation.get_active()
+        debut = perf_counter()
         depart = Depart.objects.select_for_update().get(id=depart_id)
+        metriques.VERROU_ATTENTE.observer(perf_counter() - debut)
         maintenant = timezone.now()
         datetime_depart = timezone.make_aware(datetime.combine(date_voyage, depart.heure_depart))
 
         if not depart.actif:
-            raise ValidationError("Ce depart n'est plus disponible.")
+            raise ValidationError("Ce depart n'est plus disponible.", code="inactif")
+        if not Depart.objects.circulant_le(date_voyage).filter(pk=depart.pk).exists():
+            raise ValidationError("Ce depart ne circule pas a la date choisie.", code="ne_circule_pas")
+        if not Depart.objects.exploitables(date_voyage).filter(pk=depart.pk).exists():
+            raise ValidationError(
+                "Le bus de ce depart est indisponible (hors service ou revision en retard).", code="bus_indisponible"
+            )
         if datetime_depart <= maintenant:
-            raise ValidationError("Impossible de reserver un depart passe.")
+            raise ValidationError("Impossible de reserver un depart passe.", code="passe")
 
         jours_avant = (date_voyage - maintenant.date()).days
         if jours_avant > politique.delai_max_avant_depart:
             date_ouverture = date_voyage - timedelta(days=politique.delai_max_avant_depart)
             raise ValidationError(
-                f"Les reservations pour ce depart ouvrent le {date_ouverture.strftime('%d/%m/%Y')}."
+                f"Les reservations pour ce depart ouvrent le {date_ouverture.strftime('%d/%m/%Y')}.",
+                code="trop_tot",
             )
 
         heures_avant = (datetime_depart - maintenant).total_seconds() / 3600
         if heures_avant < politique.delai_min_avant_depart:
             raise ValidationError(
-                f"Les reservations sont fermees {politique.delai_min_avant_depart}h avant le depart."
+                f"Les reservations sont fermees {politique.delai_min_avant_depart}h avant le depart.",
+                code="trop_tard",
             )
 
         if nombre_places > politique.places_max_par_reservation:
-            raise ValidationError(f"Maximum {politique.places_max_par_reservation} places par reservation.")
+            raise ValidationError(
+                f"Maximum {politique.places_max_par_reservation} places par reservation.", code="places_max"
+            )
 
         active_statuses = [
             ReservationStatus.EN_ATTENTE,
@@ -55,13 +81,15 @@ class ReservationService:
         ).count()
         if reservations_actives >= politique.reservations_max_par_client:
             raise ValidationError(
-                f"Vous avez deja {politique.reservations_max_par_client} reservations actives."
+                f"Vous avez deja {politique.reservations_max_par_client} reservations actives.",
+                code="quota",
             )
 
         places_dispo = depart.places_disponibles_pour(date_voyage)
         if places_dispo < nombre_places:
             raise ValidationError(
-                f"Seulement {places_dispo} place(s) disponible(s) pour ce depart ce jour-la."
+                f"Seulement {places_dispo} place(s) disponible(s) pour ce depart ce jour-la.",
+                code="complet",
             )
 
         prix_total = (Decimal(depart.prix) * Decimal(nombre_places)).quantize(Decimal("0.01"))
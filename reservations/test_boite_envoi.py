@@ -0,0 +1,131 @@
+import socketserver
+import threading
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.mail import get_connection
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from reservations import boite_envoi
+from reservations.models import ContactMessage, StatutEnvoi
+
+
+class _SessionSMTP(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.server.connexions += 1
+        self.wfile.write(b"220 localhost\r\n")
+        for ligne in self.rfile:
+            commande = ligne.decode().strip()
+            if commande.upper().startswith("RCPT") and "refuse" in commande:
+                self.wfile.write(b"550 Boite inconnue\r\n")
+            elif commande.upper() == "DATA":
+                self.wfile.write(b"354 Fin par <CRLF>.<CRLF>\r\n")
+                contenu = b"".join(iter(self.rfile.readline, b".\r\n"))
+                self.server.recus.append(contenu)
+                self.wfile.write(b"250 OK\r\n")
+            elif commande.upper() == "QUIT":
+                self.wfile.write(b"221 Au revoir\r\n")
+                return
+            else:
+                self.wfile.write(b"250 OK\r\n")
+
+
+class ServeurSMTPLocal(socketserver.ThreadingTCPServer):
+    """Serveur SMTP minimal (boucle locale) qui accepte tout sauf les destinataires "refuse"."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _SessionSMTP)
+        self.connexions = 0
+        self.recus = []
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+    def connexion(self):
+        return get_connection(
+            "django.core.mail.backends.smtp.EmailBackend",
+            host="127.0.0.1", port=self.server_address[1], username="", password="", use_tls=False, timeout=5,
+        )
+
+
+@override_settings(REPONSES_DELAI_BASE_SECONDES=60, REPONSES_TENTATIVES_MAX=2)
+class BoiteEnvoiReponsesTests(TestCase):
+    def _en_file(self, *emails):
+        maintenant = timezone.now()
+        return ContactMessage.objects.bulk_create(
+            ContactMessage(
+                name="Client", email=email, message="Horaires ?", reply="Tous les jours a 6h.",
+                statut_envoi=StatutEnvoi.EN_ATTENTE, prochain_envoi=maintenant,
+            )
+            for email in emails
+        )
+
+    def test_la_vue_met_en_file_sans_envoyer(self):
+        get_user_model().objects.create_user(username="admin", password="adminpass123", is_staff=True)
+        self.client.login(username="admin", password="adminpass123")
+        contact = ContactMessage.objects.create(name="Awa", email="awa@gareci.test", message="Bagages ?")
+
+        response = self.client.post(reverse("dashboard:message_reply", args=[contact.pk]), {"reply": "20 kg inclus."})
+        self.assertRedirects(response, reverse("dashboard:message_list"))
+        contact.refresh_from_db()
+        self.assertEqual(contact.statut_envoi, StatutEnvoi.EN_ATTENTE)
+        self.assertEqual(mail.outbox, [])
+
+        call_command("envoyer_reponses", stdout=StringIO())
+        contact.refresh_from_db()
+        self.assertEqual((contact.statut_envoi, contact.tentatives_envoi), (StatutEnvoi.ENVOYE, 1))
+        self.assertIn("20 kg inclus.", mail.outbox[0].body)
+
+    def test_lot_sur_une_seule_connexion_smtp(self):
+        self._en_file(*(f"client{i}@gareci.test" for i in range(200)))
+
+        with ServeurSMTPLocal() as serveur:
+            debut = timezone.now()
+            rapport = boite_envoi.envoyer(limite=500, connection=serveur.connexion())
+            duree = (timezone.now() - debut).total_seconds()
+
+        self.assertEqual((rapport.envoyes, len(serveur.recus), serveur.connexions), (200, 200, 1))
+        self.assertLess(duree, 10)
+        self.assertFalse(ContactMessage.objects.exclude(statut_envoi=StatutEnvoi.ENVOYE).exists())
+
+    def test_relance_exponentielle_puis_echec_definitif(self):
+        refuse, accepte = self._en_file("refuse@gareci.test", "ok@gareci.test")
+
+        with ServeurSMTPLocal() as serveur:
+            rapport = boite_envoi.envoyer(connection=serveur.connexion())
+            self.assertEqual((rapport.envoyes, rapport.reportes), (1, 1))
+            refuse.refresh_from_db()
+            self.assertEqual(refuse.tentatives_envoi, 1)
+            self.assertAlmostEqual(
+                (refuse.prochain_envoi - timezone.now()).total_seconds(), 60, delta=5,
+            )
+            self.assertIn("SMTPRecipientsRefused", refuse.erreur_envoi)
+            # Pas encore du : rien n'est repris.
+            self.assertEqual(boite_envoi.envoyer(connection=serveur.connexion()).traites, 0)
+
+            ContactMessage.objects.filter(pk=refuse.pk).update(prochain_envoi=timezone.now())
+            rapport = boite_envoi.envoyer(connection=serveur.connexion())
+        self.assertEqual(rapport.abandonnes, 1)
+        refuse.refresh_from_db()
+        self.assertEqual((refuse.statut_envoi, refuse.prochain_envoi), (StatutEnvoi.ECHEC, None))
+        self.assertEqual(boite_envoi.delai_relance(3), timedelta(minutes=4))
+
+    def test_serveur_injoignable_reporte_le_lot(self):
+        self._en_file("a@gareci.test", "b@gareci.test")
+        with ServeurSMTPLocal() as serveur:
+            connexion = serveur.connexion()
+        rapport = boite_envoi.envoyer(connection=connexion)
+        self.assertEqual(rapport.reportes, 2)
+        self.assertFalse(ContactMessage.objects.filter(statut_envoi=StatutEnvoi.ENVOYE).exists())
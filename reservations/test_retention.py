@@ -0,0 +1,152 @@
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from gareci_admin.models import DashboardStats, StatistiqueJournaliere
+from gareci_admin.tests import creer_depart
+from reservations import archivage, retention
+from reservations.models import ArchivedReservation, ContactMessage, Paiement, Reservation, StatutEnvoi, Ticket
+
+
+class ReservationsPasseesTestCase(TestCase):
+    """Un client et un depart ; `_reservation()` cree ses reservations a une date donnee."""
+
+    def setUp(self):
+        self.utilisateur = get_user_model().objects.create_user(username="client", password="x")
+        self.depart = creer_depart()
+
+    def _reservation(self, statut, date_voyage):
+        return Reservation.objects.create(
+            utilisateur=self.utilisateur, depart=self.depart, date_voyage=date_voyage, prix_total=1000, statut=statut,
+        )
+
+
+class PurgeTests(ReservationsPasseesTestCase):
+    def setUp(self):
+        super().setUp()
+        aujourd_hui = timezone.localdate()
+        self.anciennes = [self._reservation("ANNULEE", aujourd_hui - timedelta(days=400)) for _ in range(3)]
+        self.recente = self._reservation("ANNULEE", aujourd_hui - timedelta(days=10))
+        confirmee = self._reservation("CONFIRMEE", aujourd_hui - timedelta(days=400))
+        paiement = Paiement.objects.create(reservation=confirmee, montant=1000, statut=Paiement.Statut.ECHOUE)
+        Paiement.objects.filter(pk=paiement.pk).update(updated_at=timezone.now() - timedelta(days=100))
+
+        il_y_a_un_an = timezone.now() - timedelta(days=365)
+        ContactMessage.objects.create(name="A", email="a@gareci.test", message="?", reply="!", replied_at=il_y_a_un_an, statut_envoi=StatutEnvoi.ENVOYE)
+        ContactMessage.objects.create(name="B", email="b@gareci.test", message="?", reply="!", replied_at=il_y_a_un_an, statut_envoi=StatutEnvoi.EN_ATTENTE)
+        ContactMessage.objects.create(name="C", email="c@gareci.test", message="?")
+
+    def test_simulation_puis_purge_par_lots(self):
+        sortie = StringIO()
+        call_command("purge", "--dry-run", "--politique", "messages", "--politique", "reservations_annulees", "--politique", "paiements_echoues", stdout=sortie)
+        self.assertIn("Messages de contact repondus : 1 a supprimer.", sortie.getvalue())
+        self.assertIn("Reservations annulees (date de voyage passee) : 3 a supprimer.", sortie.getvalue())
+        self.assertIn("Paiements echoues ou annules : 1 a supprimer.", sortie.getvalue())
+        self.assertEqual(Reservation.objects.count(), 5)
+        annulees = DashboardStats.get_courant().reservations_annulees
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command(
+                "purge", "--politique", "messages", "--politique", "reservations_annulees",
+                "--politique", "paiements_echoues", "--taille-lot", "2", "--pause", "0", stdout=StringIO(),
+            )
+        self.assertFalse(Reservation.objects.filter(pk__in=[r.pk for r in self.anciennes]).exists())
+        self.assertEqual(Reservation.objects.count(), 2)
+        self.assertFalse(Paiement.objects.exists())
+        self.assertEqual(sorted(ContactMessage.objects.values_list("name", flat=True)), ["B", "C"])
+        self.assertEqual(DashboardStats.get_courant().reservations_annulees, annulees - 3)
+
+    def test_cles_dispersees_un_lot_par_taille(self):
+        il_y_a_un_an = timezone.now() - timedelta(days=365)
+        for pk in (5_000_000, 9_000_000):
+            ContactMessage.objects.create(
+                pk=pk, name="D", email="d@gareci.test", message="?", reply="!",
+                replied_at=il_y_a_un_an, statut_envoi=StatutEnvoi.ENVOYE,
+            )
+        messages = next(politique for politique in retention.politiques() if politique.nom == "messages").lignes
+
+        with CaptureQueriesContext(connection) as requetes:
+            self.assertEqual(retention.purger(messages, taille_lot=2, pause=60), 3)
+        # Deux lots (2 + 1 lignes), sans parcourir les millions de cles vides ni attendre apres le dernier.
+        self.assertEqual(len([requete for requete in requetes if requete["sql"].startswith("DELETE")]), 2)
+
+    def test_medias_orphelins(self):
+        with tempfile.TemporaryDirectory() as racine, self.settings(MEDIA_ROOT=racine):
+            ticket = Ticket.objects.create(bus=self.depart.bus, user=self.utilisateur, prix=1000)
+            ancien = timezone.now().timestamp() - 3 * 86400
+            os.utime(os.path.join(racine, ticket.code_qr.name), (ancien, ancien))
+            for nom, date_fichier in (("orphelin.png", ancien), ("en_cours.png", None)):
+                chemin = os.path.join(racine, "qrcodes", nom)
+                with open(chemin, "wb") as fichier:
+                    fichier.write(b"x" * 2048)
+                if date_fichier:
+                    os.utime(chemin, (date_fichier, date_fichier))
+
+            sortie = StringIO()
+            call_command("purge", "--politique", "medias", "--dry-run", stdout=sortie)
+            self.assertIn("Medias orphelins : 1 a supprimer (", sortie.getvalue())
+            self.assertTrue(os.path.exists(os.path.join(racine, "qrcodes", "orphelin.png")))
+
+            call_command("purge", "--politique", "medias", stdout=StringIO())
+            self.assertEqual(
+                sorted(os.listdir(os.path.join(racine, "qrcodes"))),
+                sorted(["en_cours.png", os.path.basename(ticket.code_qr.name)]),
+            )
+
+
+@override_settings(ARCHIVE_RESERVATIONS_JOURS=180)
+class ArchivageReservationsTests(ReservationsPasseesTestCase):
+    def setUp(self):
+        aujourd_hui = timezone.localdate()
+        with self.captureOnCommitCallbacks(execute=True):
+            super().setUp()
+            self.anciennes = [self._reservation("CONFIRMEE", aujourd_hui - timedelta(days=365 + i)) for i in range(5)]
+            Paiement.objects.create(reservation=self.anciennes[0], montant=1000, statut=Paiement.Statut.REUSSI)
+            self.future = self._reservation("EN_ATTENTE", aujourd_hui + timedelta(days=3))
+
+    def test_deplacement_par_lots_sans_toucher_aux_compteurs(self):
+        avant = DashboardStats.get_courant()
+        sortie = StringIO()
+        call_command("archiver_reservations", "--dry-run", stdout=sortie)
+        self.assertIn("5 reservation(s) a archiver", sortie.getvalue())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("archiver_reservations", "--taille-lot", "2", "--pause", "0", stdout=StringIO())
+
+        self.assertEqual(list(Reservation.objects.values_list("pk", flat=True)), [self.future.pk])
+        self.assertFalse(Paiement.objects.exists())
+        archive = ArchivedReservation.objects.get(pk=self.anciennes[0].pk)
+        self.assertEqual(
+            (archive.reference, archive.trajet, archive.ville_depart, archive.paiement_statut),
+            (self.anciennes[0].reference, "Abidjan intra", "Abidjan", "REUSSI"),
+        )
+        self.assertEqual(ArchivedReservation.objects.count(), 5)
+
+        apres = DashboardStats.get_courant()
+        self.assertEqual(
+            (apres.total_reservations, apres.reservations_confirmees, apres.paiements_reussis),
+            (avant.total_reservations, avant.reservations_confirmees, avant.paiements_reussis),
+        )
+        recalcule = DashboardStats.recalculer()
+        self.assertEqual((recalcule.total_reservations, recalcule.paiements_reussis), (6, 1))
+        self.assertEqual(sum(StatistiqueJournaliere.objects.values_list("nb_reservations", flat=True)), 6)
+
+    def test_historique_fusionne_sur_demande(self):
+        archivage.archiver()
+        self.client.force_login(self.utilisateur)
+
+        response = self.client.get(reverse("reservations:list"))
+        self.assertEqual([r.pk for r in response.context["reservations"]], [self.future.pk])
+
+        response = self.client.get(reverse("reservations:list"), {"historique": "1", "statut": "CONFIRMEE"})
+        self.assertEqual(len(response.context["reservations"]), 5)
+        self.assertContains(response, "Voyage archive", count=5)
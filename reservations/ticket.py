@@ -3,8 +3,15 @@ import base64
 
 import qrcode
 
+from gareci_project import metriques
+
 
 def _build_qr_base64(payload: str) -> str:
+    with metriques.QR_RENDU.chronometrer():
+        return _encoder_qr(payload)
+
+
+def _encoder_qr(payload: str) -> str:
     qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=8, border=2)
     qr.add_data(payload)
     qr.make(fit=True)
@@ -21,7 +28,7 @@ def get_ticket_context(reservation):
     bus = depart.bus
     utilisateur = reservation.utilisateur
 
-    etapes = list(trip.etapetrajet_set.all())
+    etapes = list(trip.etapetrajet_set.select_related("segment__arret_arrivee__ville"))
     if len(etapes) <= 1:
         type_trajet = "Direct"
         escales_villes = ""
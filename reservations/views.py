@@ -10,10 +10,11 @@ from django.http import Http404, HttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.views.decorators.http import require_POST
 
+from gareci_project import metriques
 from trips.models import Depart
 
 from .forms import ReservationForm
-from .models import ContactMessage, Paiement, Reservation, ReservationStatus
+from .models import ArchivedReservation, ContactMessage, Paiement, Reservation, ReservationStatus
 from .services import ReservationService
 
 
@@ -21,8 +22,8 @@ from .services import ReservationService
 def reservation_list(request):
     statut = request.GET.get("statut", "").strip().upper()
     reservations = Reservation.objects.filter(utilisateur=request.user).select_related(
-        "depart",
-        "depart__trip",
+        "depart__trip__arret_depart__ville",
+        "depart__trip__arret_arrivee__ville",
         "depart__bus",
     )
     allowed_filters = {
@@ -30,16 +31,29 @@ def reservation_list(request):
         ReservationStatus.EN_ATTENTE,
         ReservationStatus.ANNULEE,
     }
+    historique = request.GET.get("historique") == "1"
+    archives = ArchivedReservation.objects.filter(utilisateur=request.user)
     if statut in allowed_filters:
         reservations = reservations.filter(statut=statut)
+        archives = archives.filter(statut=statut)
+
+    reservations = reservations.order_by("-created_at")
+    if historique:
+        # Les voyages anciens ne sont lus dans l'archive que sur demande.
+        reservations = sorted(
+            [*reservations, *archives.order_by("-created_at")],
+            key=lambda reservation: reservation.created_at,
+            reverse=True,
+        )
 
     return render(
         request,
         "reservations/reservation_list.html",
         {
-            "reservations": reservations.order_by("-created_at"),
+            "reservations": reservations,
             "active_tab": "reservation",
             "current_statut": statut,
+            "historique": historique,
         },
     )
 
@@ -216,10 +230,12 @@ def traiter_paiement(request, reservation_id):
         paiement_obj.statut = Paiement.Statut.REUSSI
         paiement_obj.save(update_fields=["statut"])
         reservation.confirmer()
+        metriques.PAIEMENTS.inc(statut=Paiement.Statut.REUSSI)
         return redirect("reservations:paiement_succes", reservation_id=reservation.id)
     elif action == "echouer":
         paiement_obj.statut = Paiement.Statut.ECHOUE
         paiement_obj.save(update_fields=["statut"])
+        metriques.PAIEMENTS.inc(statut=Paiement.Statut.ECHOUE)
         messages.error(request, "Paiement échoué. Veuillez réessayer.")
         return redirect("reservations:paiement", reservation_id=reservation.id)
     return redirect("reservations:list")
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Trip, Bus, Category, Depart, Ville, Arret, Segment, EtapeTrajet
+from .models import Trip, Bus, Calendrier, Category, Depart, ExceptionCalendrier, Ville, Arret, Segment, EtapeTrajet
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -43,6 +43,16 @@ class TripAdmin(admin.ModelAdmin):
 
 @admin.register(Depart)
 class DepartAdmin(admin.ModelAdmin):
-    list_display = ("trip", "bus", "heure_depart", "heure_arrivee", "prix", "actif")
+    list_display = ("trip", "bus", "heure_depart", "heure_arrivee", "prix", "calendrier", "actif")
     search_fields = ("trip__nom", "bus__immatriculation")
-    list_filter = ("actif",)
+    list_filter = ("actif", "calendrier")
+
+class ExceptionCalendrierInline(admin.TabularInline):
+    model = ExceptionCalendrier
+    extra = 1
+
+@admin.register(Calendrier)
+class CalendrierAdmin(admin.ModelAdmin):
+    list_display = ("nom", "date_debut", "date_fin")
+    search_fields = ("nom",)
+    inlines = [ExceptionCalendrierInline]
@@ -0,0 +1,703 @@
+"""Import / export GTFS du reseau (stops, routes, trips, stop_times, calendar).
+
+Correspondances :
+- stops.txt : stations (location_type=1) <-> Ville, arrets <-> Arret
+  (parent_station, sinon zone_id = code de la ville) ;
+- routes.txt <-> Trip, un Trip par sens (route_id, ou route_id#direction_id) ;
+- trips.txt <-> Depart (service_id -> Calendrier, QUOTIDIEN = sans calendrier) ;
+- stop_times.txt <-> horaires du Depart, et Segment/EtapeTrajet d'apres le
+  premier voyage rencontre pour chaque Trip ;
+- calendar.txt, calendar_dates.txt <-> Calendrier, ExceptionCalendrier ;
+- fare_attributes.txt, fare_rules.txt <-> Trip.price.
+
+Les identifiants GTFS sont conserves dans `code_gtfs` ; a l'export, un objet
+jamais publie recoit un code derive de son pk (`arret-12`), calcule sans
+ecriture en base. A l'import, un tel code designe l'objet de ce pk s'il n'a
+pas encore de code_gtfs : il l'adopte, et un aller-retour export -> import
+sur la meme base ne duplique rien. Les fichiers sont lus
+et ecrits en flux : la memoire depend du nombre de voyages et d'arrets, pas
+du nombre de lignes de stop_times.txt (qui doit etre groupe par trip_id).
+"""
+import csv
+import io
+import os
+import zipfile
+from collections import Counter, defaultdict
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from gareci_project import cache
+
+from .models import (
+    JOURS_SEMAINE,
+    Arret,
+    Bus,
+    Calendrier,
+    Depart,
+    EtapeTrajet,
+    ExceptionCalendrier,
+    Segment,
+    Trip,
+    Ville,
+    get_default_category_pk,
+)
+from .services import verifier_grille
+from .signals import departs_modifies_en_masse
+
+TAILLE_LOT = 2000
+SERVICE_QUOTIDIEN = "QUOTIDIEN"
+PREFIXE_STATION = "VILLE-"
+# Bornes ecrites pour un calendrier sans date de debut / fin.
+BORNE_DEBUT = date(2000, 1, 1)
+BORNE_FIN = date(2099, 12, 31)
+JOURS_GTFS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+ENTETES = {
+    "agency.txt": ["agency_id", "agency_name", "agency_url", "agency_timezone"],
+    "stops.txt": [
+        "stop_id", "stop_code", "stop_name", "stop_desc", "stop_lat", "stop_lon",
+        "zone_id", "location_type", "parent_station",
+    ],
+    "routes.txt": ["route_id", "agency_id", "route_short_name", "route_long_name", "route_type"],
+    "trips.txt": ["route_id", "service_id", "trip_id", "direction_id"],
+    "stop_times.txt": [
+        "trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence", "shape_dist_traveled",
+    ],
+    "calendar.txt": ["service_id", *JOURS_GTFS, "start_date", "end_date"],
+    "calendar_dates.txt": ["service_id", "date", "exception_type"],
+    "fare_attributes.txt": ["fare_id", "price", "currency_type", "payment_method", "transfers"],
+    "fare_rules.txt": ["fare_id", "route_id"],
+}
+
+
+def _lots(iterable, taille):
+    iterateur = iter(iterable)
+    while lot := list(islice(iterateur, taille)):
+        yield lot
+
+
+def _secondes(valeur):
+    heures, minutes, secondes = (int(partie) for partie in valeur.split(":"))
+    return heures * 3600 + minutes * 60 + secondes
+
+
+def _heure(secondes):
+    """Heure du jour ; les horaires GTFS apres minuit (25:10:00) reviennent sur 24 h."""
+    return datetime.min.replace(
+        hour=secondes // 3600 % 24, minute=secondes % 3600 // 60, second=secondes % 60
+    ).time()
+
+
+def _format_heure(secondes):
+    return f"{secondes // 3600:02d}:{secondes % 3600 // 60:02d}:{secondes % 60:02d}"
+
+
+def _secondes_du_jour(heure):
+    return heure.hour * 3600 + heure.minute * 60 + heure.second
+
+
+def _decimal(valeur):
+    try:
+        return Decimal(valeur) if valeur else None
+    except InvalidOperation:
+        raise ValidationError(f"Valeur numerique invalide : {valeur!r}.")
+
+
+def _date_gtfs(valeur):
+    return datetime.strptime(valeur, "%Y%m%d").date()
+
+
+def _code(code, pk, prefixe):
+    """code_gtfs, ou code stable derive du pk pour un objet jamais publie."""
+    if pk is None:
+        return None
+    return code or f"{prefixe}{pk}"
+
+
+def _cle_trajet(route_id, direction_id):
+    return route_id if direction_id in ("", "0") else f"{route_id}#{direction_id}"
+
+
+class SourceGTFS:
+    """Flux GTFS lu depuis un repertoire ou une archive zip."""
+
+    def __init__(self, chemin):
+        self.chemin = chemin
+        self._zip = zipfile.ZipFile(chemin) if zipfile.is_zipfile(chemin) else None
+
+    def existe(self, nom):
+        if self._zip is not None:
+            return nom in self._zip.namelist()
+        return os.path.exists(os.path.join(self.chemin, nom))
+
+    def lignes(self, nom):
+        if not self.existe(nom):
+            raise ValidationError(f"Fichier {nom} absent du flux GTFS.")
+        if self._zip is not None:
+            fichier = io.TextIOWrapper(self._zip.open(nom), encoding="utf-8-sig", newline="")
+        else:
+            fichier = open(os.path.join(self.chemin, nom), encoding="utf-8-sig", newline="")
+        with fichier:
+            for ligne in csv.DictReader(fichier):
+                yield {cle.strip(): (valeur or "").strip() for cle, valeur in ligne.items() if cle}
+
+    def fermer(self):
+        if self._zip is not None:
+            self._zip.close()
+
+
+class RapportImport:
+    """Compteurs nouveaux / modifies / inchanges / absents par modele."""
+
+    ETATS = ("nouveaux", "modifies", "inchanges", "absents")
+
+    def __init__(self):
+        self.compteurs = defaultdict(Counter)
+        self.avertissements = []
+
+    def noter(self, modele, etat, nombre=1):
+        self.compteurs[modele._meta.verbose_name_plural][etat] += nombre
+
+    def lignes(self):
+        for nom, compteur in self.compteurs.items():
+            yield f"{nom} : " + ", ".join(f"{compteur[etat]} {etat}" for etat in self.ETATS)
+        yield from self.avertissements
+
+
+class ImportGTFS:
+    """Insere ou met a jour le reseau a partir d'un flux GTFS, par lots."""
+
+    def __init__(self, source, bus=None, taille_lot=TAILLE_LOT):
+        self.source = source
+        self.bus = bus
+        self.taille_lot = taille_lot
+        self.rapport = RapportImport()
+
+    @transaction.atomic
+    def executer(self, dry_run=False):
+        """Importe le flux ; avec `dry_run`, tout est annule et seul le rapport reste."""
+        self._importer_villes()
+        arrets = self._importer_arrets()
+        calendriers = self._importer_calendriers()
+        tarifs = self._lire_tarifs()
+        voyages = {
+            ligne["trip_id"]: (_cle_trajet(ligne["route_id"], ligne.get("direction_id", "")), ligne["service_id"])
+            for ligne in self.source.lignes("trips.txt")
+        }
+        horaires, motifs = self._parcourir_horaires(voyages)
+        trajets = self._importer_trajets(motifs, arrets, tarifs)
+        self._importer_etapes(motifs, trajets, arrets)
+        self._importer_departs(voyages, horaires, trajets, calendriers)
+
+        if dry_run:
+            transaction.set_rollback(True)
+        else:
+            transaction.on_commit(
+                lambda: departs_modifies_en_masse.send(sender=Depart, crees=[], modifies=[])
+            )
+            # Villes et trajets ecrits par bulk_create, sans post_save.
+            transaction.on_commit(cache.invalider)
+        return self.rapport
+
+    def _upsert(self, modele, objets, champs, cle="code_gtfs", prefixe=None):
+        """bulk_create(update_conflicts) par lots ; retourne {cle: pk} et alimente le rapport."""
+        attributs = [modele._meta.get_field(champ).attname for champ in champs]
+        ids = {}
+        for lot in _lots(objets, self.taille_lot):
+            cles = [getattr(objet, cle) for objet in lot]
+            if prefixe:
+                self._adopter_codes(modele, cles, prefixe)
+            existants = {
+                ligne[0]: ligne[1:]
+                for ligne in modele.objects.filter(**{f"{cle}__in": cles}).values_list(cle, *attributs)
+            }
+            for objet in lot:
+                actuel = existants.get(getattr(objet, cle))
+                if actuel is None:
+                    self.rapport.noter(modele, "nouveaux")
+                elif actuel == tuple(getattr(objet, attribut) for attribut in attributs):
+                    self.rapport.noter(modele, "inchanges")
+                else:
+                    self.rapport.noter(modele, "modifies")
+            modele.objects.bulk_create(lot, update_conflicts=True, unique_fields=[cle], update_fields=champs)
+            ids.update(modele.objects.filter(**{f"{cle}__in": cles}).values_list(cle, "pk"))
+        return ids
+
+    def _adopter_codes(self, modele, codes, prefixe):
+        """Enregistre les codes derives du pk (`arret-12`, cf. `_code`) sur les objets sans code_gtfs."""
+        derives = {}
+        for code in codes:
+            pk = code.removeprefix(prefixe)
+            if code.startswith(prefixe) and pk.isdecimal() and f"{prefixe}{int(pk)}" == code:
+                derives[int(pk)] = code
+        if not derives:
+            return
+        pris = set(modele.objects.filter(code_gtfs__in=derives.values()).values_list("code_gtfs", flat=True))
+        adoptes = []
+        for objet in modele.objects.filter(pk__in=derives, code_gtfs__isnull=True).only("pk"):
+            if derives[objet.pk] not in pris:
+                objet.code_gtfs = derives[objet.pk]
+                adoptes.append(objet)
+        modele.objects.bulk_update(adoptes, ["code_gtfs"])
+
+    def _noter_absents(self, modele, vus):
+        """Objets portant un code_gtfs qui ne figurent pas parmi les `vus` codes du flux."""
+        self.rapport.noter(modele, "absents", modele.objects.filter(code_gtfs__isnull=False).count() - vus)
+
+    def _importer_villes(self):
+        """Les stations deviennent des villes ; garde stop_id de station -> code de ville."""
+        self._stations, villes = {}, []
+        for ligne in self.source.lignes("stops.txt"):
+            if ligne.get("location_type") == "1":
+                code = (ligne.get("stop_code") or ligne["stop_id"].removeprefix(PREFIXE_STATION))[:10]
+                self._stations[ligne["stop_id"]] = code
+                villes.append(Ville(code=code, nom=ligne["stop_name"][:100]))
+        self._upsert(Ville, villes, ["nom"], cle="code")
+
+    def _importer_arrets(self):
+        villes = dict(Ville.objects.values_list("code", "pk"))
+
+        def ville_de(ligne):
+            code = self._stations.get(ligne.get("parent_station")) or ligne.get("zone_id", "")[:10]
+            if not code:
+                raise ValidationError(f"Arret {ligne['stop_id']} sans parent_station ni zone_id.")
+            if code not in villes:
+                # Zone sans station : la ville est creee avec son code pour nom.
+                villes[code] = Ville.objects.get_or_create(code=code, defaults={"nom": code})[0].pk
+            return villes[code]
+
+        def arrets():
+            for ligne in self.source.lignes("stops.txt"):
+                if ligne.get("location_type", "") not in ("", "0"):
+                    continue
+                yield Arret(
+                    code_gtfs=ligne["stop_id"],
+                    ville_id=ville_de(ligne),
+                    nom=ligne["stop_name"][:100],
+                    adresse=ligne.get("stop_desc", "")[:200],
+                    latitude=_decimal(ligne.get("stop_lat")),
+                    longitude=_decimal(ligne.get("stop_lon")),
+                )
+
+        ids = self._upsert(Arret, arrets(), ["ville", "nom", "adresse", "latitude", "longitude"], prefixe="arret-")
+        self._noter_absents(Arret, len(ids))
+        return {
+            code: (pk, ville_id)
+            for code, pk, ville_id in Arret.objects.filter(code_gtfs__isnull=False).values_list(
+                "code_gtfs", "pk", "ville_id"
+            )
+        }
+
+    def _importer_calendriers(self):
+        calendriers = {}
+        if self.source.existe("calendar.txt"):
+            def services():
+                for ligne in self.source.lignes("calendar.txt"):
+                    if ligne["service_id"] == SERVICE_QUOTIDIEN:
+                        # Ecrit par l'export pour les departs sans calendrier.
+                        continue
+                    debut, fin = _date_gtfs(ligne["start_date"]), _date_gtfs(ligne["end_date"])
+                    yield Calendrier(
+                        code_gtfs=ligne["service_id"],
+                        nom=ligne["service_id"][:100],
+                        date_debut=None if debut <= BORNE_DEBUT else debut,
+                        date_fin=None if fin >= BORNE_FIN else fin,
+                        **{jour: ligne[gtfs] == "1" for jour, gtfs in zip(JOURS_SEMAINE, JOURS_GTFS)},
+                    )
+
+            calendriers.update(
+                self._upsert(Calendrier, services(), [*JOURS_SEMAINE, "date_debut", "date_fin"], prefixe="service-")
+            )
+
+        if self.source.existe("calendar_dates.txt"):
+            def exceptions():
+                for ligne in self.source.lignes("calendar_dates.txt"):
+                    service_id = ligne["service_id"]
+                    if service_id not in calendriers:
+                        # Service defini uniquement par des dates : aucun jour regulier.
+                        calendriers[service_id] = Calendrier.objects.update_or_create(
+                            code_gtfs=service_id,
+                            defaults={"nom": service_id[:100], **{jour: False for jour in JOURS_SEMAINE}},
+                        )[0].pk
+                    yield ExceptionCalendrier(
+                        calendrier_id=calendriers[service_id],
+                        date=_date_gtfs(ligne["date"]),
+                        type=(
+                            ExceptionCalendrier.Type.AJOUT
+                            if ligne["exception_type"] == "1"
+                            else ExceptionCalendrier.Type.SUPPRESSION
+                        ),
+                    )
+
+            for lot in _lots(exceptions(), self.taille_lot):
+                existants = {
+                    (calendrier, jour): type_
+                    for calendrier, jour, type_ in ExceptionCalendrier.objects.filter(
+                        calendrier_id__in={exception.calendrier_id for exception in lot},
+                        date__in={exception.date for exception in lot},
+                    ).values_list("calendrier_id", "date", "type")
+                }
+                for exception in lot:
+                    actuel = existants.get((exception.calendrier_id, exception.date))
+                    etat = "nouveaux" if actuel is None else "inchanges" if actuel == exception.type else "modifies"
+                    self.rapport.noter(ExceptionCalendrier, etat)
+                ExceptionCalendrier.objects.bulk_create(
+                    lot,
+                    update_conflicts=True,
+                    unique_fields=["calendrier", "date"],
+                    update_fields=["type"],
+                )
+        return calendriers
+
+    def _lire_tarifs(self):
+        if not (self.source.existe("fare_attributes.txt") and self.source.existe("fare_rules.txt")):
+            return {}
+        prix = {ligne["fare_id"]: _decimal(ligne["price"]) for ligne in self.source.lignes("fare_attributes.txt")}
+        return {
+            ligne["route_id"]: prix[ligne["fare_id"]]
+            for ligne in self.source.lignes("fare_rules.txt")
+            if ligne.get("route_id") and ligne["fare_id"] in prix
+        }
+
+    def _voyages_groupes(self):
+        """(trip_id, arrets tries par stop_sequence) ; stop_times doit etre groupe par trip_id."""
+        termines = set()
+        courant, arrets = None, []
+        for ligne in self.source.lignes("stop_times.txt"):
+            if ligne["trip_id"] != courant:
+                if courant is not None:
+                    termines.add(courant)
+                    yield courant, sorted(arrets, key=lambda arret: arret[0])
+                courant, arrets = ligne["trip_id"], []
+                if courant in termines:
+                    raise ValidationError("stop_times.txt doit etre groupe par trip_id.")
+            arrivee = ligne.get("arrival_time") or ligne.get("departure_time")
+            depart = ligne.get("departure_time") or arrivee
+            arrets.append((
+                int(ligne["stop_sequence"]),
+                ligne["stop_id"],
+                _secondes(arrivee) if arrivee else None,
+                _secondes(depart) if depart else None,
+                _decimal(ligne.get("shape_dist_traveled")),
+            ))
+        if courant is not None:
+            yield courant, sorted(arrets, key=lambda arret: arret[0])
+
+    def _parcourir_horaires(self, voyages):
+        """Horaires de chaque voyage et motif d'arrets de chaque trajet, en un passage."""
+        horaires, motifs = {}, {}
+        for trip_id, arrets in self._voyages_groupes():
+            if trip_id not in voyages or len(arrets) < 2:
+                self.rapport.avertissements.append(f"Voyage {trip_id} ignore (inconnu ou moins de deux arrets).")
+                continue
+            temps = [arret[3] if arret[3] is not None else arret[2] for arret in arrets]
+            if temps[0] is None or arrets[-1][2] is None:
+                self.rapport.avertissements.append(f"Voyage {trip_id} ignore (horaires terminus manquants).")
+                continue
+            horaires[trip_id] = (temps[0], arrets[-1][2])
+            cle = voyages[trip_id][0]
+            if cle not in motifs:
+                motifs[cle] = [arret[1:] for arret in arrets]
+        return horaires, motifs
+
+    def _importer_trajets(self, motifs, arrets, tarifs):
+        lignes = {ligne["route_id"]: ligne for ligne in self.source.lignes("routes.txt")}
+        inconnus = {stop_id for motif in motifs.values() for stop_id, *_ in motif if stop_id not in arrets}
+        if inconnus:
+            raise ValidationError(f"stop_times.txt reference des arrets inconnus : {sorted(inconnus)[:5]}.")
+
+        categorie = get_default_category_pk()
+        avec_prix, sans_prix = [], []
+        for cle, motif in motifs.items():
+            route_id, _, direction = cle.partition("#")
+            ligne = lignes.get(route_id)
+            if ligne is None:
+                raise ValidationError(f"Ligne {route_id} absente de routes.txt.")
+            nom = ligne.get("route_long_name") or ligne.get("route_short_name") or route_id
+            (arret_depart, ville_depart), (arret_arrivee, ville_arrivee) = arrets[motif[0][0]], arrets[motif[-1][0]]
+            trajet = Trip(
+                code_gtfs=cle,
+                category_id=categorie,
+                nom=(f"{nom} (retour)" if direction else nom)[:100],
+                ville_depart_id=ville_depart,
+                ville_arrivee_id=ville_arrivee,
+                arret_depart_id=arret_depart,
+                arret_arrivee_id=arret_arrivee,
+            )
+            if route_id in tarifs:
+                trajet.price = tarifs[route_id]
+                avec_prix.append(trajet)
+            else:
+                sans_prix.append(trajet)
+
+        champs = ["nom", "ville_depart", "ville_arrivee", "arret_depart", "arret_arrivee"]
+        self._upsert(Trip, avec_prix, [*champs, "price"], prefixe="trajet-")
+        self._upsert(Trip, sans_prix, champs, prefixe="trajet-")
+        if sans_prix:
+            self.rapport.avertissements.append(
+                f"{len(sans_prix)} trajet(s) sans tarif : prix existant conserve (0 pour les nouveaux)."
+            )
+        self._noter_absents(Trip, len(motifs))
+        return {
+            code: (pk, prix)
+            for code, pk, prix in Trip.objects.filter(code_gtfs__in=list(motifs)).values_list("code_gtfs", "pk", "price")
+        }
+
+    def _importer_etapes(self, motifs, trajets, arrets):
+        """Segments entre arrets consecutifs puis EtapeTrajet de chaque trajet."""
+        paires = {}
+        for motif in motifs.values():
+            for (depart, _, sortie, distance_a), (arrivee, entree, _, distance_b) in zip(motif, motif[1:]):
+                duree = max((entree if entree is not None else sortie or 0) - (sortie or 0), 0) // 60
+                distance = distance_b - distance_a if distance_a is not None and distance_b is not None else None
+                paires.setdefault((arrets[depart][0], arrets[arrivee][0]), (duree, distance))
+
+        segments = {}
+        self._charger_segments(paires, segments)
+
+        nouveaux, modifies = [], []
+        for paire, (duree, distance) in paires.items():
+            segment = segments.get(paire)
+            if segment is None:
+                nouveaux.append(Segment(
+                    arret_depart_id=paire[0], arret_arrivee_id=paire[1], duree_minutes=duree, distance_km=distance or 0,
+                ))
+            elif segment.duree_minutes != duree or (distance is not None and segment.distance_km != distance):
+                segment.duree_minutes = duree
+                if distance is not None:
+                    segment.distance_km = distance
+                modifies.append(segment)
+        Segment.objects.bulk_create(nouveaux, batch_size=self.taille_lot)
+        Segment.objects.bulk_update(modifies, ["duree_minutes", "distance_km"], batch_size=self.taille_lot)
+        self.rapport.noter(Segment, "nouveaux", len(nouveaux))
+        self.rapport.noter(Segment, "modifies", len(modifies))
+        self.rapport.noter(Segment, "inchanges", len(paires) - len(nouveaux) - len(modifies))
+        if nouveaux:
+            self._charger_segments([(segment.arret_depart_id, segment.arret_arrivee_id) for segment in nouveaux], segments)
+
+        for lot in _lots(motifs.items(), self.taille_lot):
+            etapes, par_longueur = [], defaultdict(list)
+            for cle, motif in lot:
+                trip_id = trajets[cle][0]
+                for ordre, (a, b) in enumerate(zip(motif, motif[1:]), start=1):
+                    segment = segments[(arrets[a[0]][0], arrets[b[0]][0])]
+                    etapes.append(EtapeTrajet(trip_id=trip_id, ordre=ordre, segment_id=segment.pk))
+                par_longueur[len(motif)].append(trip_id)
+            EtapeTrajet.objects.bulk_create(
+                etapes, update_conflicts=True, unique_fields=["trip", "ordre"], update_fields=["segment"]
+            )
+            # Une requete par nombre d'arrets (quelques-uns) plutot qu'un OR par trajet.
+            for longueur, trip_ids in par_longueur.items():
+                EtapeTrajet.objects.filter(trip_id__in=trip_ids, ordre__gte=longueur).delete()
+
+    def _charger_segments(self, paires, segments):
+        """Complete `segments` {(depart, arrivee): Segment} pour les `paires` d'arrets.
+
+        Lecture par arret de depart (IN) puis tri des paires en Python : un OR
+        d'une condition par paire depasse la profondeur d'expression de SQLite
+        (1000) sur un gros flux.
+        """
+        voulues = set(paires)
+        for lot in _lots({depart for depart, _ in voulues}, self.taille_lot):
+            for segment in Segment.objects.filter(arret_depart_id__in=lot).order_by("pk"):
+                paire = (segment.arret_depart_id, segment.arret_arrivee_id)
+                if paire in voulues:
+                    segments.setdefault(paire, segment)
+
+    def _importer_departs(self, voyages, horaires, trajets, calendriers):
+        # Le bus n'est jamais ecrase ; il ne sert qu'aux nouveaux departs.
+        existants = {}
+        for lot in _lots(horaires, self.taille_lot):
+            self._adopter_codes(Depart, lot, "depart-")
+            existants.update(
+                (code, (pk, bus_id))
+                for code, pk, bus_id in Depart.objects.filter(code_gtfs__in=lot).values_list("code_gtfs", "pk", "bus_id")
+            )
+        if self.bus is None and len(existants) < len(horaires):
+            raise ValidationError("Un bus (--bus) est requis pour creer de nouveaux departs.")
+
+        departs = []
+        for trip_id, (depart, arrivee) in horaires.items():
+            cle, service_id = voyages[trip_id]
+            trip_pk, prix = trajets[cle]
+            if service_id != SERVICE_QUOTIDIEN and service_id not in calendriers:
+                calendriers[service_id] = Calendrier.objects.filter(code_gtfs=service_id).values_list(
+                    "pk", flat=True
+                ).first()
+            departs.append(Depart(
+                code_gtfs=trip_id,
+                trip_id=trip_pk,
+                bus_id=existants[trip_id][1] if trip_id in existants else self.bus.pk,
+                heure_depart=_heure(depart),
+                heure_arrivee=_heure(arrivee),
+                prix=prix,
+                calendrier_id=calendriers.get(service_id),
+                actif=True,
+            ))
+
+        self._verifier_bus(departs, existants.values())
+        self._upsert(Depart, departs, ["trip", "heure_depart", "heure_arrivee", "prix", "calendrier", "actif"])
+        self._noter_absents(Depart, len(horaires))
+
+    def _verifier_bus(self, departs, existants):
+        """Meme refus que GenerateurDeparts : un bus engage sur deux creneaux qui se chevauchent.
+
+        `existants` : (pk, bus_id) des departs enregistres que le flux remplace.
+        """
+        trajets = Trip.objects.only("nom").in_bulk({depart.trip_id for depart in departs})
+        calendriers = Calendrier.objects.in_bulk({depart.calendrier_id for depart in departs} - {None})
+        par_bus = defaultdict(list)
+        for depart in departs:
+            # Relations deja chargees : conflits_grille les lit sans requete par depart.
+            depart.trip = trajets[depart.trip_id]
+            depart.calendrier = calendriers.get(depart.calendrier_id)
+            par_bus[depart.bus_id].append(depart)
+        remplaces = defaultdict(list)
+        for pk, bus_id in existants:
+            remplaces[bus_id].append(pk)
+        for bus_id, bus in sorted(Bus.objects.in_bulk(par_bus).items()):
+            verifier_grille(bus, par_bus[bus_id], exclus=remplaces[bus_id])
+
+
+class ExportGTFS:
+    """Ecrit le reseau actif en GTFS, fichier par fichier, depuis des generateurs de lignes."""
+
+    def __init__(self, taille_lot=TAILLE_LOT, agence="Gare CI", url="", fuseau="Africa/Abidjan"):
+        self.taille_lot = taille_lot
+        self.agence = agence
+        self.url = url
+        self.fuseau = fuseau
+
+    def ecrire(self, destination):
+        """Ecrit dans une archive si `destination` finit par .zip, sinon dans un repertoire."""
+        if destination.endswith(".zip"):
+            with zipfile.ZipFile(destination, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+                for nom, lignes in self.fichiers():
+                    with archive.open(nom, "w") as brut, io.TextIOWrapper(brut, encoding="utf-8", newline="") as fichier:
+                        self._ecrire_csv(fichier, nom, lignes)
+        else:
+            os.makedirs(destination, exist_ok=True)
+            for nom, lignes in self.fichiers():
+                with open(os.path.join(destination, nom), "w", encoding="utf-8", newline="") as fichier:
+                    self._ecrire_csv(fichier, nom, lignes)
+
+    def _ecrire_csv(self, fichier, nom, lignes):
+        writer = csv.writer(fichier)
+        writer.writerow(ENTETES[nom])
+        writer.writerows(lignes)
+
+    def fichiers(self):
+        return [
+            ("agency.txt", [["GARECI", self.agence, self.url, self.fuseau]]),
+            ("stops.txt", self.arrets()),
+            ("routes.txt", self.lignes()),
+            ("trips.txt", self.voyages()),
+            ("stop_times.txt", self.horaires()),
+            ("calendar.txt", self.calendriers()),
+            ("calendar_dates.txt", self.dates_calendrier()),
+            ("fare_attributes.txt", self.tarifs()),
+            ("fare_rules.txt", ([route_id, route_id] for route_id, *_ in self._routes())),
+        ]
+
+    def _departs(self):
+        return Depart.objects.filter(actif=True, trip__actif=True).order_by("trip_id", "heure_depart")
+
+    def arrets(self):
+        for code, nom in Ville.objects.order_by("code").values_list("code", "nom").iterator(self.taille_lot):
+            yield [PREFIXE_STATION + code, code, nom, "", "", "", code, 1, ""]
+        colonnes = ("code_gtfs", "pk", "nom", "adresse", "latitude", "longitude", "ville__code")
+        for code, pk, nom, adresse, latitude, longitude, ville in (
+            Arret.objects.order_by("pk").values_list(*colonnes).iterator(self.taille_lot)
+        ):
+            yield [_code(code, pk, "arret-"), "", nom, adresse, latitude or "", longitude or "", ville, 0, PREFIXE_STATION + ville]
+
+    def _routes(self):
+        """(route_id, nom, prix) des trajets actifs, une ligne pour les deux sens."""
+        vus = set()
+        trajets = sorted(
+            (_code(code, pk, "trajet-"), nom, prix)
+            for code, pk, nom, prix in Trip.objects.filter(actif=True).values_list("code_gtfs", "pk", "nom", "price")
+        )
+        for code, nom, prix in trajets:
+            route_id = code.partition("#")[0]
+            if route_id not in vus:
+                vus.add(route_id)
+                yield route_id, nom, prix
+
+    def lignes(self):
+        for route_id, nom, _ in self._routes():
+            yield [route_id, "GARECI", "", nom, 3]
+
+    def tarifs(self):
+        for route_id, _, prix in self._routes():
+            yield [route_id, prix, "XOF", 1, ""]
+
+    def voyages(self):
+        colonnes = ("code_gtfs", "pk", "trip__code_gtfs", "trip_id", "calendrier__code_gtfs", "calendrier_id")
+        for code, pk, trajet, trip_id, service, calendrier_id in (
+            self._departs().values_list(*colonnes).iterator(self.taille_lot)
+        ):
+            route_id, _, direction = _code(trajet, trip_id, "trajet-").partition("#")
+            service = _code(service, calendrier_id, "service-")
+            yield [route_id, service or SERVICE_QUOTIDIEN, _code(code, pk, "depart-"), direction or 0]
+
+    def horaires(self):
+        etapes = defaultdict(list)
+        for trip_id, depart, depart_id, arrivee, arrivee_id, duree, distance in (
+            EtapeTrajet.objects.filter(trip__actif=True)
+            .order_by("trip_id", "ordre")
+            .values_list(
+                "trip_id",
+                "segment__arret_depart__code_gtfs",
+                "segment__arret_depart_id",
+                "segment__arret_arrivee__code_gtfs",
+                "segment__arret_arrivee_id",
+                "segment__duree_minutes",
+                "segment__distance_km",
+            )
+        ):
+            etapes[trip_id].append((
+                _code(depart, depart_id, "arret-"), _code(arrivee, arrivee_id, "arret-"), duree, distance
+            ))
+        terminus = {
+            pk: (_code(depart, depart_id, "arret-"), _code(arrivee, arrivee_id, "arret-"))
+            for pk, depart, depart_id, arrivee, arrivee_id in Trip.objects.filter(actif=True).values_list(
+                "pk", "arret_depart__code_gtfs", "arret_depart_id", "arret_arrivee__code_gtfs", "arret_arrivee_id"
+            )
+        }
+
+        colonnes = ("code_gtfs", "pk", "trip_id", "heure_depart", "heure_arrivee")
+        for code, pk, trip_id, heure_depart, heure_arrivee in (
+            self._departs().values_list(*colonnes).iterator(self.taille_lot)
+        ):
+            code = _code(code, pk, "depart-")
+            debut = _secondes_du_jour(heure_depart)
+            fin = _secondes_du_jour(heure_arrivee)
+            if fin < debut:
+                fin += 24 * 3600
+            troncons = etapes.get(trip_id) or [(*terminus[trip_id], (fin - debut) // 60, None)]
+
+            instant, distance = debut, Decimal(0)
+            yield [code, _format_heure(debut), _format_heure(debut), troncons[0][0], 1, 0]
+            for sequence, (_, arrivee, duree, longueur) in enumerate(troncons, start=2):
+                instant += duree * 60
+                distance += longueur or 0
+                heure = _format_heure(fin if sequence == len(troncons) + 1 else min(instant, fin))
+                yield [code, heure, heure, arrivee, sequence, distance]
+
+    def calendriers(self):
+        yield [SERVICE_QUOTIDIEN, *[1] * 7, f"{BORNE_DEBUT:%Y%m%d}", f"{BORNE_FIN:%Y%m%d}"]
+        colonnes = ("code_gtfs", "pk", *JOURS_SEMAINE, "date_debut", "date_fin")
+        for code, pk, *jours, debut, fin in Calendrier.objects.order_by("pk").values_list(*colonnes):
+            yield [_code(code, pk, "service-"), *(int(jour) for jour in jours), f"{debut or BORNE_DEBUT:%Y%m%d}", f"{fin or BORNE_FIN:%Y%m%d}"]
+
+    def dates_calendrier(self):
+        colonnes = ("calendrier__code_gtfs", "calendrier_id", "date", "type")
+        for service, calendrier_id, jour, type_ in (
+            ExceptionCalendrier.objects.order_by("calendrier_id", "date").values_list(*colonnes)
+        ):
+            yield [_code(service, calendrier_id, "service-"), f"{jour:%Y%m%d}", 1 if type_ == ExceptionCalendrier.Type.AJOUT else 2]
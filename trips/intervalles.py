@@ -0,0 +1,138 @@
+"""Creneaux hebdomadaires des departs et index d'intervalles.
+
+Un Depart n'a pas de date : il se repete chaque jour de son calendrier. Ses
+occurrences sont donc representees en minutes depuis lundi 0 h, sur une
+semaine type ; un depart de nuit deborde sur le jour suivant et celui du
+dimanche soir est replie sur le lundi matin. Les periodes de validite des
+calendriers sont conservees pour ne pas opposer deux services qui ne
+circulent jamais en meme temps ; les exceptions ponctuelles sont ignorees.
+"""
+import heapq
+from bisect import bisect_left, insort
+from collections import namedtuple
+
+from .models import JOURS_SEMAINE
+
+MINUTES_JOUR = 24 * 60
+MINUTES_SEMAINE = 7 * MINUTES_JOUR
+
+# Champs a lire (relatifs au depart) pour construire ses creneaux sans charger d'objet.
+CHAMPS_DEPART = [
+    "heure_depart",
+    "heure_arrivee",
+    "calendrier_id",
+    *(f"calendrier__{jour}" for jour in JOURS_SEMAINE),
+    "calendrier__date_debut",
+    "calendrier__date_fin",
+]
+
+Creneau = namedtuple("Creneau", "debut fin jour periode valeur")
+
+
+def minutes(heure):
+    return heure.hour * 60 + heure.minute
+
+
+def duree_minutes(heure_depart, heure_arrivee):
+    duree = minutes(heure_arrivee) - minutes(heure_depart)
+    return duree if duree > 0 else duree + MINUTES_JOUR
+
+
+def creneaux(ligne, prefixe="", valeur=None):
+    """
+    Creneaux hebdomadaires d'un depart lu avec `values(*CHAMPS_DEPART)`
+    (eventuellement prefixes, ex. "departure__").
+    """
+    if ligne[f"{prefixe}calendrier_id"] is None:
+        jours, periode = range(7), (None, None)
+    else:
+        jours = [i for i, jour in enumerate(JOURS_SEMAINE) if ligne[f"{prefixe}calendrier__{jour}"]]
+        periode = (ligne[f"{prefixe}calendrier__date_debut"], ligne[f"{prefixe}calendrier__date_fin"])
+    debut = minutes(ligne[f"{prefixe}heure_depart"])
+    duree = duree_minutes(ligne[f"{prefixe}heure_depart"], ligne[f"{prefixe}heure_arrivee"])
+    resultat = []
+    for jour in jours:
+        origine = jour * MINUTES_JOUR + debut
+        resultat.append(Creneau(origine, origine + duree, jour, periode, valeur))
+        if origine + duree > MINUTES_SEMAINE:
+            resultat.append(Creneau(origine - MINUTES_SEMAINE, origine + duree - MINUTES_SEMAINE, None, periode, valeur))
+    return resultat
+
+
+def creneaux_depart(depart, valeur=None):
+    """Creneaux d'une instance de Depart (non necessairement enregistree)."""
+    calendrier = depart.calendrier
+    ligne = {
+        "heure_depart": depart.heure_depart,
+        "heure_arrivee": depart.heure_arrivee,
+        "calendrier_id": calendrier.pk if calendrier else None,
+        "calendrier__date_debut": calendrier.date_debut if calendrier else None,
+        "calendrier__date_fin": calendrier.date_fin if calendrier else None,
+        **{f"calendrier__{jour}": getattr(calendrier, jour, True) for jour in JOURS_SEMAINE},
+    }
+    return creneaux(ligne, valeur=depart.pk if valeur is None else valeur)
+
+
+def periodes_chevauchent(a, b):
+    (debut_a, fin_a), (debut_b, fin_b) = a, b
+    return (fin_a is None or debut_b is None or debut_b <= fin_a) and (
+        fin_b is None or debut_a is None or debut_a <= fin_b
+    )
+
+
+def _debut(creneau):
+    return creneau.debut
+
+
+class IndexIntervalles:
+    """
+    Creneaux tries par debut. Une recherche ne parcourt que les creneaux
+    commencant dans [debut - marge - duree_max, fin + marge) : O(log n + k).
+    """
+
+    def __init__(self, elements=()):
+        self._elements = []
+        self._duree_max = 0
+        for creneau in elements:
+            self.ajouter(creneau)
+
+    def __len__(self):
+        return len(self._elements)
+
+    def __iter__(self):
+        return iter(self._elements)
+
+    def ajouter(self, creneau):
+        insort(self._elements, creneau, key=_debut)
+        self._duree_max = max(self._duree_max, creneau.fin - creneau.debut)
+
+    def chevauchements(self, creneau, marge=0):
+        """Creneaux a moins de `marge` minutes de `creneau` sur des periodes compatibles."""
+        premier = bisect_left(self._elements, creneau.debut - marge - self._duree_max, key=_debut)
+        dernier = bisect_left(self._elements, creneau.fin + marge, key=_debut)
+        for element in self._elements[premier:dernier]:
+            if (
+                element.fin + marge > creneau.debut
+                and element.debut < creneau.fin + marge
+                and periodes_chevauchent(element.periode, creneau.periode)
+            ):
+                yield element
+
+
+def balayer(elements, marge=0):
+    """
+    Paires de creneaux a moins de `marge` minutes l'un de l'autre, par tri
+    puis balayage : les creneaux actifs sont gardes dans un tas ordonne par
+    fin, ce qui evite toute comparaison deux a deux. O(n log n + k).
+
+    Les creneaux d'une meme `valeur` (un depart de plus de 24 h moins la
+    marge rejoint sa propre occurrence du lendemain) ne sont pas opposes.
+    """
+    actifs = []
+    for rang, creneau in enumerate(sorted(elements, key=_debut)):
+        while actifs and actifs[0][0] + marge <= creneau.debut:
+            heapq.heappop(actifs)
+        for _, _, actif in actifs:
+            if actif.valeur != creneau.valeur and periodes_chevauchent(actif.periode, creneau.periode):
+                yield actif, creneau
+        heapq.heappush(actifs, (creneau.fin, rang, creneau))
@@ -0,0 +1,261 @@
+"""Etat de maintenance de la flotte.
+
+L'echeance de revision d'un bus est la plus proche de deux limites : la
+date (derniere revision + intervalle en jours) et le kilometrage (les
+kilometres parcourus depuis la revision, projetes au rythme des departs
+actifs). Les kilometres sont deduits des `Segment.distance_km` des trajets
+et du nombre de jours ou chaque depart a circule depuis la revision ;
+Depart.bus n'etant pas date, l'affectation actuelle est supposee valoir
+sur toute la periode.
+"""
+import math
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q, Sum
+
+from .intervalles import CHAMPS_DEPART, IndexIntervalles, creneaux
+from .models import JOURS_SEMAINE, Bus, Depart, ExceptionCalendrier
+from .services import temps_retournement
+from .signals import departs_modifies_en_masse
+
+
+def intervalle_revision():
+    """Nombre de jours maximum entre deux revisions."""
+    return timedelta(days=getattr(settings, "BUS_INTERVALLE_REVISION_JOURS", 180))
+
+
+def intervalle_revision_km():
+    """Kilometres maximum entre deux revisions."""
+    return getattr(settings, "BUS_INTERVALLE_REVISION_KM", 20000)
+
+
+def delai_alerte_revision():
+    """Jours avant l'echeance a partir desquels une revision est a planifier."""
+    return timedelta(days=getattr(settings, "BUS_ALERTE_REVISION_JOURS", 14))
+
+
+def bus_exploitable(date, prefixe=""):
+    """
+    Condition sur Bus (ou sur `prefixe`, ex. "bus__") : en service, revision
+    a jour par la date et echeance calculee non depassee. Une echeance
+    anterieure a la derniere revision date d'avant celle-ci et est ignoree.
+    """
+    revision = f"{prefixe}derniere_revision"
+    echeance = f"{prefixe}echeance_revision"
+    return (
+        Q(**{f"{prefixe}en_service": True})
+        & (Q(**{f"{revision}__isnull": True}) | Q(**{f"{revision}__gte": date - intervalle_revision()}))
+        & (
+            Q(**{f"{echeance}__isnull": True})
+            | Q(**{f"{echeance}__gte": date})
+            | Q(**{f"{echeance}__lte": F(revision)})
+        )
+    )
+
+
+def bus_disponibles(date):
+    """Bus en service dont la revision est a jour a `date` (revision inconnue : accepte)."""
+    return Bus.objects.filter(bus_exploitable(date))
+
+
+def _jours_circules(ligne, du, au, exceptions):
+    """Nombre de jours de [du, au] ou circule un depart lu avec `values(*CHAMPS_DEPART)`."""
+    if du > au:
+        return 0
+    if ligne["calendrier_id"] is None:
+        return (au - du).days + 1
+
+    jours = {i for i, jour in enumerate(JOURS_SEMAINE) if ligne[f"calendrier__{jour}"]}
+    debut = max(du, ligne["calendrier__date_debut"] or du)
+    fin = min(au, ligne["calendrier__date_fin"] or au)
+    total = 0
+    if debut <= fin:
+        semaines, reste = divmod((fin - debut).days + 1, 7)
+        total = semaines * len(jours) + sum(
+            1 for decalage in range(reste) if (debut.weekday() + decalage) % 7 in jours
+        )
+    for jour, type_exception in exceptions.get(ligne["calendrier_id"], ()):
+        if not du <= jour <= au:
+            continue
+        regulier = debut <= jour <= fin and jour.weekday() in jours
+        if type_exception == ExceptionCalendrier.Type.AJOUT and not regulier:
+            total += 1
+        elif type_exception == ExceptionCalendrier.Type.SUPPRESSION and regulier:
+            total -= 1
+    return total
+
+
+def _jours_par_semaine(ligne):
+    if ligne["calendrier_id"] is None:
+        return 7
+    return sum(1 for jour in JOURS_SEMAINE if ligne[f"calendrier__{jour}"])
+
+
+@dataclass
+class EtatMaintenance:
+    A_JOUR = "A_JOUR"
+    A_PLANIFIER = "A_PLANIFIER"
+    EN_RETARD = "EN_RETARD"
+    HORS_SERVICE = "HORS_SERVICE"
+    INCONNU = "INCONNU"
+
+    bus: Bus
+    date: object
+    km_depuis_revision: int = 0
+    km_par_semaine: Decimal = Decimal(0)
+    echeance: object = None
+
+    @property
+    def statut(self):
+        if not self.bus.en_service:
+            return self.HORS_SERVICE
+        if self.echeance is None:
+            return self.INCONNU
+        if self.echeance < self.date:
+            return self.EN_RETARD
+        if self.echeance < self.date + delai_alerte_revision():
+            return self.A_PLANIFIER
+        return self.A_JOUR
+
+
+def planifier(date):
+    """
+    Etat de maintenance de chaque bus a `date`. Un seul agregat (kilometres
+    par depart actif, jointure trajet -> etapes -> segments), plus la lecture
+    des bus et des exceptions de calendrier.
+    """
+    limite_km = intervalle_revision_km()
+    bus = list(Bus.objects.order_by("immatriculation"))
+    revisions = [b.derniere_revision for b in bus if b.derniere_revision is not None]
+
+    departs = (
+        Depart.objects.filter(actif=True)
+        .values("bus_id", *CHAMPS_DEPART)
+        .annotate(km=Sum("trip__etapetrajet__segment__distance_km"))
+        .order_by()
+    )
+    exceptions = defaultdict(list)
+    if revisions:
+        lignes = ExceptionCalendrier.objects.filter(
+            calendrier__departs__actif=True, date__gt=min(revisions), date__lt=date,
+        ).values_list("calendrier_id", "date", "type").distinct()
+        for calendrier_id, jour, type_exception in lignes:
+            exceptions[calendrier_id].append((jour, type_exception))
+
+    etats = {b.pk: EtatMaintenance(bus=b, date=date) for b in bus}
+    parcourus = defaultdict(Decimal)
+    for ligne in departs:
+        etat = etats[ligne["bus_id"]]
+        km = ligne["km"] or Decimal(0)
+        etat.km_par_semaine += km * _jours_par_semaine(ligne)
+        revision = etat.bus.derniere_revision
+        if revision is not None:
+            jours = _jours_circules(ligne, revision + timedelta(days=1), date - timedelta(days=1), exceptions)
+            parcourus[ligne["bus_id"]] += km * jours
+
+    for etat in etats.values():
+        revision = etat.bus.derniere_revision
+        if revision is None:
+            continue
+        etat.km_depuis_revision = round(parcourus[etat.bus.pk])
+        etat.echeance = revision + intervalle_revision()
+        restants = limite_km - etat.km_depuis_revision
+        if restants <= 0:
+            etat.echeance = min(etat.echeance, date - timedelta(days=1))
+        elif etat.km_par_semaine > 0:
+            jours = math.ceil(restants * 7 / etat.km_par_semaine)
+            etat.echeance = min(etat.echeance, date + timedelta(days=jours - 1))
+    return list(etats.values())
+
+
+def enregistrer(etats):
+    """Stocke kilometrage et echeance sur les bus : la recherche exclut ensuite les bus en retard."""
+    modifies = []
+    for etat in etats:
+        etat.bus.km_depuis_revision = etat.km_depuis_revision
+        etat.bus.echeance_revision = etat.echeance
+        modifies.append(etat.bus)
+    Bus.objects.bulk_update(modifies, ["km_depuis_revision", "echeance_revision"], batch_size=1000)
+    return modifies
+
+
+@dataclass
+class Remplacement:
+    depart_id: int
+    heure_depart: object
+    bus_actuel_id: int
+    bus_id: int | None = None
+
+
+def suggerer_remplacements(date, marge=None):
+    """
+    Pour chaque depart actif dont le bus n'est pas exploitable a `date`, un
+    bus exploitable de meme categorie et de capacite au moins egale, libre
+    sur tous les creneaux du depart (temps de retournement compris). Deux
+    requetes : les departs bloques, puis les bus candidats avec leurs departs
+    (jointure gauche). Les bus proposes sont reserves au fil de l'eau pour ne
+    pas etre suggeres deux fois sur le meme creneau.
+    """
+    marge = temps_retournement() if marge is None else marge
+    bloques = (
+        Depart.objects.filter(actif=True)
+        .exclude(bus_exploitable(date, prefixe="bus__"))
+        .order_by("heure_depart", "pk")
+        .values("pk", "bus_id", "bus__categorie_id", "bus__capacite", *CHAMPS_DEPART)
+    )
+    bloques = list(bloques)
+    if not bloques:
+        return []
+
+    candidats, index = {}, defaultdict(IndexIntervalles)
+    lignes = bus_disponibles(date).order_by("capacite", "pk").values(
+        "pk",
+        "capacite",
+        "categorie_id",
+        "departs__pk",
+        "departs__actif",
+        *(f"departs__{champ}" for champ in CHAMPS_DEPART),
+    )
+    for ligne in lignes:
+        candidats.setdefault(ligne["pk"], ligne)
+        if ligne["departs__actif"]:
+            for creneau in creneaux(ligne, prefixe="departs__", valeur=ligne["departs__pk"]):
+                index[ligne["pk"]].ajouter(creneau)
+
+    remplacements = []
+    for depart in bloques:
+        remplacement = Remplacement(
+            depart_id=depart["pk"], heure_depart=depart["heure_depart"], bus_actuel_id=depart["bus_id"],
+        )
+        occupations = creneaux(depart, valeur=depart["pk"])
+        for pk, candidat in candidats.items():
+            if candidat["categorie_id"] != depart["bus__categorie_id"] or candidat["capacite"] < depart["bus__capacite"]:
+                continue
+            if any(next(index[pk].chevauchements(creneau, marge), None) for creneau in occupations):
+                continue
+            remplacement.bus_id = pk
+            for creneau in occupations:
+                index[pk].ajouter(creneau)
+            break
+        remplacements.append(remplacement)
+    return remplacements
+
+
+@transaction.atomic
+def appliquer_remplacements(remplacements):
+    """Affecte les bus suggeres en un seul bulk_update ; retourne les departs modifies."""
+    modifies = [
+        Depart(pk=remplacement.depart_id, bus_id=remplacement.bus_id)
+        for remplacement in remplacements
+        if remplacement.bus_id is not None
+    ]
+    Depart.objects.bulk_update(modifies, ["bus"], batch_size=1000)
+    transaction.on_commit(
+        lambda: departs_modifies_en_masse.send(sender=Depart, crees=[], modifies=modifies)
+    )
+    return modifies
@@ -0,0 +1,51 @@
+from itertools import groupby
+
+from django.core.management.base import BaseCommand
+
+from trips.intervalles import CHAMPS_DEPART, balayer, creneaux
+from trips.models import JOURS_SEMAINE, Depart
+from trips.services import temps_retournement
+
+
+class Command(BaseCommand):
+    help = "Liste les departs actifs qui engagent le meme bus sur des creneaux incompatibles."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--retournement",
+            type=int,
+            help="Temps de retournement en minutes (defaut : BUS_TEMPS_RETOURNEMENT_MINUTES).",
+        )
+        parser.add_argument("--bus", help="Limiter a une immatriculation.")
+
+    def handle(self, *args, **options):
+        marge = temps_retournement() if options["retournement"] is None else options["retournement"]
+        departs = Depart.objects.filter(actif=True).order_by("bus_id")
+        if options["bus"]:
+            departs = departs.filter(bus__immatriculation=options["bus"])
+        lignes = departs.values("pk", "bus_id", "bus__immatriculation", "trip__nom", *CHAMPS_DEPART).iterator(
+            chunk_size=2000
+        )
+
+        total = 0
+        for _, lignes_bus in groupby(lignes, key=lambda ligne: ligne["bus_id"]):
+            elements = [creneau for ligne in lignes_bus for creneau in creneaux(ligne, valeur=ligne)]
+            vus = set()
+            for a, b in balayer(elements, marge=marge):
+                paire = tuple(sorted((a.valeur["pk"], b.valeur["pk"])))
+                if paire in vus:
+                    continue
+                vus.add(paire)
+                jour = next((c.jour for c in (a, b) if c.jour is not None), None)
+                self.stdout.write(
+                    f"{a.valeur['bus__immatriculation']} : "
+                    f"#{a.valeur['pk']} {a.valeur['trip__nom']} {a.valeur['heure_depart']:%H:%M}-{a.valeur['heure_arrivee']:%H:%M}"
+                    f" / #{b.valeur['pk']} {b.valeur['trip__nom']} {b.valeur['heure_depart']:%H:%M}-{b.valeur['heure_arrivee']:%H:%M}"
+                    + (f" (des le {JOURS_SEMAINE[jour]})" if jour is not None else "")
+                )
+            total += len(vus)
+
+        if total:
+            self.stdout.write(self.style.WARNING(f"{total} conflit(s) de bus detecte(s)."))
+        else:
+            self.stdout.write(self.style.SUCCESS("Aucun conflit de bus."))
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from trips.gtfs import TAILLE_LOT, ExportGTFS
+
+
+class Command(BaseCommand):
+    help = "Exporte le reseau actif au format GTFS (repertoire, ou archive si la destination finit par .zip)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("destination")
+        parser.add_argument("--taille-lot", type=int, default=TAILLE_LOT)
+
+    def handle(self, *args, **options):
+        ExportGTFS(
+            taille_lot=options["taille_lot"],
+            agence=getattr(settings, "GTFS_AGENCE", "Gare CI"),
+            url=getattr(settings, "GTFS_AGENCE_URL", ""),
+            fuseau=getattr(settings, "GTFS_FUSEAU", "Africa/Abidjan"),
+        ).ecrire(options["destination"])
+        self.stdout.write(self.style.SUCCESS(f"Flux GTFS ecrit dans {options['destination']}."))
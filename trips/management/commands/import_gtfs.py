@@ -0,0 +1,39 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from trips.gtfs import TAILLE_LOT, ImportGTFS, SourceGTFS
+from trips.models import Bus
+
+
+class Command(BaseCommand):
+    help = "Importe un flux GTFS (repertoire ou .zip) : arrets, lignes, voyages et horaires."
+
+    def add_arguments(self, parser):
+        parser.add_argument("chemin", help="Repertoire ou archive .zip contenant les fichiers GTFS.")
+        parser.add_argument("--bus", help="Immatriculation du bus affecte aux nouveaux departs.")
+        parser.add_argument("--dry-run", action="store_true", help="Affiche les differences sans rien enregistrer.")
+        parser.add_argument("--taille-lot", type=int, default=TAILLE_LOT)
+
+    def handle(self, *args, **options):
+        bus = None
+        if options["bus"]:
+            bus = Bus.objects.filter(immatriculation=options["bus"]).first()
+            if bus is None:
+                raise CommandError(f"Bus {options['bus']} introuvable.")
+
+        source = SourceGTFS(options["chemin"])
+        try:
+            rapport = ImportGTFS(source, bus=bus, taille_lot=options["taille_lot"]).executer(
+                dry_run=options["dry_run"]
+            )
+        except ValidationError as e:
+            raise CommandError(" ".join(e.messages))
+        finally:
+            source.fermer()
+
+        for ligne in rapport.lignes():
+            self.stdout.write(ligne)
+        if options["dry_run"]:
+            self.stdout.write(self.style.WARNING("Simulation : aucune modification enregistree."))
+        else:
+            self.stdout.write(self.style.SUCCESS("Import GTFS termine."))
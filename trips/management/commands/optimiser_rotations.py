@@ -0,0 +1,35 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from trips import rotation
+
+
+class Command(BaseCommand):
+    help = "Propose (ou applique) une affectation des bus minimisant le nombre de bus pour une journee."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--date", type=date.fromisoformat, help="Journee a planifier (defaut : demain).")
+        parser.add_argument("--retournement", type=int, help="Temps de retournement en minutes.")
+        parser.add_argument("--appliquer", action="store_true", help="Enregistre les bus proposes.")
+
+    def handle(self, *args, **options):
+        jour = options["date"] or timezone.localdate() + timedelta(days=1)
+        plan = rotation.planifier(jour, marge=options["retournement"])
+
+        self.stdout.write(
+            f"{jour:%d/%m/%Y} : {plan.bus_necessaires} bus necessaires "
+            f"({plan.bus_actuels} actuellement), {len(plan.changements)} depart(s) a reaffecter."
+        )
+        for numero, rot in enumerate(plan.rotations, start=1):
+            horaires = ", ".join(f"#{depart['pk']} {depart['heure_depart']:%H:%M}" for depart in rot.departs)
+            self.stdout.write(f"  Rotation {numero} -> bus {rot.bus_id or '?'} : {horaires}")
+        if plan.sans_bus:
+            self.stdout.write(self.style.WARNING(
+                f"{len(plan.sans_bus)} rotation(s) sans bus disponible (capacite, categorie ou revision)."
+            ))
+
+        if options["appliquer"]:
+            modifies = rotation.appliquer(plan)
+            self.stdout.write(self.style.SUCCESS(f"{len(modifies)} depart(s) reaffecte(s)."))
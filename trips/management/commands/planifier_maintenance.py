@@ -0,0 +1,46 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from trips import maintenance
+
+
+class Command(BaseCommand):
+    help = (
+        "Calcule l'echeance de revision de chaque bus (date et kilometrage), "
+        "l'enregistre et propose des bus de remplacement pour les departs bloques."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--date", type=date.fromisoformat, help="Date de reference (defaut : aujourd'hui).")
+        parser.add_argument("--retournement", type=int, help="Temps de retournement en minutes.")
+        parser.add_argument("--remplacer", action="store_true", help="Affecte les bus de remplacement proposes.")
+
+    def handle(self, *args, **options):
+        jour = options["date"] or timezone.localdate()
+        etats = maintenance.planifier(jour)
+        maintenance.enregistrer(etats)
+
+        for etat in etats:
+            if etat.statut == maintenance.EtatMaintenance.A_JOUR:
+                continue
+            echeance = f"{etat.echeance:%d/%m/%Y}" if etat.echeance else "inconnue"
+            self.stdout.write(
+                f"  {etat.bus} : {etat.statut} (echeance {echeance}, {etat.km_depuis_revision} km depuis revision)"
+            )
+
+        remplacements = maintenance.suggerer_remplacements(jour, marge=options["retournement"])
+        sans_bus = [remplacement for remplacement in remplacements if remplacement.bus_id is None]
+        self.stdout.write(f"{len(etats)} bus verifies, {len(remplacements)} depart(s) bloque(s).")
+        for remplacement in remplacements:
+            self.stdout.write(
+                f"  Depart #{remplacement.depart_id} {remplacement.heure_depart:%H:%M} : "
+                f"bus {remplacement.bus_actuel_id} -> {remplacement.bus_id or '?'}"
+            )
+        if sans_bus:
+            self.stdout.write(self.style.WARNING(f"{len(sans_bus)} depart(s) sans bus de remplacement."))
+
+        if options["remplacer"]:
+            modifies = maintenance.appliquer_remplacements(remplacements)
+            self.stdout.write(self.style.SUCCESS(f"{len(modifies)} depart(s) reaffecte(s)."))
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0010_depart_permanent_simple'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Calendrier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nom', models.CharField(max_length=100)),
+                ('lundi', models.BooleanField(default=True)),
+                ('mardi', models.BooleanField(default=True)),
+                ('mercredi', models.BooleanField(default=True)),
+                ('jeudi', models.BooleanField(default=True)),
+                ('vendredi', models.BooleanField(default=True)),
+                ('samedi', models.BooleanField(default=True)),
+                ('dimanche', models.BooleanField(default=True)),
+                ('date_debut', models.DateField(blank=True, null=True)),
+                ('date_fin', models.DateField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['nom'],
+            },
+        ),
+        migrations.AddField(
+            model_name='depart',
+            name='calendrier',
+            field=models.ForeignKey(blank=True, help_text='Vide : le depart circule tous les jours.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='departs', to='trips.calendrier'),
+        ),
+        migrations.CreateModel(
+            name='ExceptionCalendrier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('type', models.CharField(choices=[('AJOUT', 'Service ajoute'), ('SUPPRESSION', 'Service supprime')], default='SUPPRESSION', max_length=12)),
+                ('calendrier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exceptions', to='trips.calendrier')),
+            ],
+            options={
+                'ordering': ['date'],
+                'unique_together': {('calendrier', 'date')},
+            },
+        ),
+    ]
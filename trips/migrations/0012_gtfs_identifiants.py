@@ -0,0 +1,43 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0011_calendrier_service'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='arret',
+            name='code_gtfs',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='arret',
+            name='latitude',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True),
+        ),
+        migrations.AddField(
+            model_name='arret',
+            name='longitude',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True),
+        ),
+        migrations.AddField(
+            model_name='calendrier',
+            name='code_gtfs',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='depart',
+            name='code_gtfs',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='code_gtfs',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+    ]
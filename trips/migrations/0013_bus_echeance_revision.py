@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0012_gtfs_identifiants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bus',
+            name='echeance_revision',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='bus',
+            name='km_depuis_revision',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -1,4 +1,8 @@
 from django.db import models
+from django.db.models import Exists, OuterRef, Q
+
+
+JOURS_SEMAINE = ["lundi", "mardi", "mercredi", "jeudi", "vendredi", "samedi", "dimanche"]
 
 
 class Category(models.Model):
@@ -43,6 +47,9 @@ class Bus(models.Model):
     en_service = models.BooleanField(default=True)
     photo = models.ImageField(upload_to="buses/", null=True, blank=True)
     derniere_revision = models.DateField(null=True, blank=True)
+    # Calcules par `manage.py planifier_maintenance`.
+    km_depuis_revision = models.PositiveIntegerField(default=0, editable=False)
+    echeance_revision = models.DateField(null=True, blank=True, editable=False)
 
     def __str__(self):
         return self.immatriculation
@@ -71,6 +78,9 @@ class Arret(models.Model):
     ville = models.ForeignKey(Ville, on_delete=models.CASCADE)
     nom = models.CharField(max_length=100)
     adresse = models.CharField(max_length=200)
+    latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    code_gtfs = models.CharField(max_length=64, unique=True, null=True, blank=True)
 
     def __str__(self):
         return f"{self.nom} - {self.ville.nom}"
@@ -112,6 +122,7 @@ class Trip(models.Model):
     arret_arrivee = models.ForeignKey(Arret, on_delete=models.CASCADE, related_name="trips_arrivee")
     price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     actif = models.BooleanField(default=True)
+    code_gtfs = models.CharField(max_length=64, unique=True, null=True, blank=True)
 
     @property
     def est_direct(self):
@@ -141,14 +152,124 @@ class EtapeTrajet(models.Model):
         return f"{self.trip.nom} - Etape {self.ordre}"
 
 
+class Calendrier(models.Model):
+    """Calendrier de service : jours de circulation sur une periode de validite."""
+
+    nom = models.CharField(max_length=100)
+    lundi = models.BooleanField(default=True)
+    mardi = models.BooleanField(default=True)
+    mercredi = models.BooleanField(default=True)
+    jeudi = models.BooleanField(default=True)
+    vendredi = models.BooleanField(default=True)
+    samedi = models.BooleanField(default=True)
+    dimanche = models.BooleanField(default=True)
+    date_debut = models.DateField(null=True, blank=True)
+    date_fin = models.DateField(null=True, blank=True)
+    code_gtfs = models.CharField(max_length=64, unique=True, null=True, blank=True)
+
+    class Meta:
+        ordering = ["nom"]
+
+    def __str__(self):
+        return self.nom
+
+    @property
+    def jours(self):
+        return [jour for jour in JOURS_SEMAINE if getattr(self, jour)]
+
+    def circule_le(self, date):
+        """Verification en memoire (utilise les exceptions prefetchees si disponibles)."""
+        for exception in self.exceptions.all():
+            if exception.date == date:
+                return exception.type == ExceptionCalendrier.Type.AJOUT
+        if self.date_debut and date < self.date_debut:
+            return False
+        if self.date_fin and date > self.date_fin:
+            return False
+        return getattr(self, JOURS_SEMAINE[date.weekday()])
+
+
+class ExceptionCalendrier(models.Model):
+    class Type(models.TextChoices):
+        AJOUT = "AJOUT", "Service ajoute"
+        SUPPRESSION = "SUPPRESSION", "Service supprime"
+
+    calendrier = models.ForeignKey(Calendrier, on_delete=models.CASCADE, related_name="exceptions")
+    date = models.DateField()
+    type = models.CharField(max_length=12, choices=Type.choices, default=Type.SUPPRESSION)
+
+    class Meta:
+        ordering = ["date"]
+        unique_together = ("calendrier", "date")
+
+    def __str__(self):
+        return f"{self.calendrier} - {self.date:%d/%m/%Y} ({self.get_type_display()})"
+
+
+class DepartQuerySet(models.QuerySet):
+    def circulant_le(self, date):
+        """Departs qui circulent a `date` : calendrier developpe en SQL, sans boucle Python."""
+        exceptions = ExceptionCalendrier.objects.filter(calendrier=OuterRef("calendrier"), date=date)
+        regulier = (
+            Q(**{f"calendrier__{JOURS_SEMAINE[date.weekday()]}": True})
+            & (Q(calendrier__date_debut__isnull=True) | Q(calendrier__date_debut__lte=date))
+            & (Q(calendrier__date_fin__isnull=True) | Q(calendrier__date_fin__gte=date))
+            & ~Exists(exceptions.filter(type=ExceptionCalendrier.Type.SUPPRESSION))
+        )
+        return self.filter(
+            Q(calendrier__isnull=True)
+            | regulier
+            | Exists(exceptions.filter(type=ExceptionCalendrier.Type.AJOUT))
+        )
+
+    def exploitables(self, date):
+        """Departs dont le bus est en service et a jour de revision a `date`."""
+        from .maintenance import bus_exploitable
+
+        return self.filter(bus_exploitable(date, prefixe="bus__"))
+
+    def avec_places_pour(self, date):
+        """Annote `places_reservees` et `places_disponibles` pour `date` (une sous-requete)."""
+        from django.db.models import F, IntegerField, Subquery, Sum, Value
+        from django.db.models.functions import Coalesce
+        from reservations.models import Reservation, ReservationStatus
+
+        reservees = (
+            Reservation.objects.filter(
+                depart=OuterRef("pk"),
+                date_voyage=date,
+                statut__in=[ReservationStatus.EN_ATTENTE, ReservationStatus.CONFIRMEE],
+            )
+            .order_by()
+            .values("depart")
+            .annotate(total=Sum("nombre_places"))
+            .values("total")
+        )
+        return self.annotate(
+            places_reservees=Coalesce(Subquery(reservees, output_field=IntegerField()), Value(0)),
+            places_disponibles=F("bus__capacite") - F("places_reservees"),
+        )
+
+
 class Depart(models.Model):
     trip = models.ForeignKey(Trip, on_delete=models.CASCADE, related_name="departs")
     bus = models.ForeignKey(Bus, on_delete=models.CASCADE, related_name="departs")
     heure_depart = models.TimeField()
     heure_arrivee = models.TimeField()
     prix = models.DecimalField(max_digits=8, decimal_places=2)
+    calendrier = models.ForeignKey(
+        Calendrier,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="departs",
+        help_text="Vide : le depart circule tous les jours.",
+    )
 
     actif = models.BooleanField(default=True)
+    code_gtfs = models.CharField(max_length=64, unique=True, null=True, blank=True)
+
+    objects = DepartQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Départ"
@@ -182,3 +303,6 @@ class Depart(models.Model):
 
     def est_complet_pour(self, date):
         return self.places_disponibles_pour(date) <= 0
+
+    def circule_le(self, date):
+        return self.calendrier is None or self.calendrier.circule_le(date)
@@ -0,0 +1,161 @@
+"""Plan de rotation : nombre minimal de bus pour couvrir les departs d'une journee.
+
+Les departs sont parcourus par heure de depart ; chaque arret garde un tas
+des bus qui y attendent, ordonne par heure de disponibilite (arrivee +
+temps de retournement). Un depart reprend le bus disponible le plus tot a
+son arret d'origine, sinon ouvre une nouvelle rotation : c'est le
+partitionnement d'intervalles glouton, optimal sans haut-le-pied. Les
+rotations sont calculees par categorie de bus (celle du bus actuel du
+depart) puis associees aux bus en service, revision a jour, de capacite
+suffisante pour les places deja vendues ce jour-la.
+
+Depart.bus n'est pas date : le plan s'applique a tous les jours ou le
+depart circule. Verifier ensuite les autres jours avec `conflits_flotte`.
+"""
+import heapq
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+
+from django.db import transaction
+
+from .intervalles import duree_minutes, minutes
+from .maintenance import bus_disponibles
+from .models import Depart
+from .services import temps_retournement
+from .signals import departs_modifies_en_masse
+
+
+@dataclass
+class Rotation:
+    categorie_id: int | None
+    departs: list = field(default_factory=list)
+    places_requises: int = 0
+    bus_id: int | None = None
+
+
+@dataclass
+class PlanRotation:
+    date: object
+    rotations: list
+    bus_actuels: int
+    sans_bus: list = field(default_factory=list)
+
+    @property
+    def bus_necessaires(self):
+        return len(self.rotations)
+
+    @property
+    def affectations(self):
+        """{depart_id: bus_id propose} pour les rotations pourvues."""
+        return {
+            depart["pk"]: rotation.bus_id
+            for rotation in self.rotations
+            if rotation.bus_id is not None
+            for depart in rotation.departs
+        }
+
+    @property
+    def changements(self):
+        return {
+            depart["pk"]: rotation.bus_id
+            for rotation in self.rotations
+            if rotation.bus_id is not None
+            for depart in rotation.departs
+            if depart["bus_id"] != rotation.bus_id
+        }
+
+
+def _rotations(departs, marge):
+    """Partitionnement glouton d'une categorie de departs en rotations."""
+    en_attente = defaultdict(list)  # arret -> tas de (disponible_a, rang, rotation)
+    rotations = []
+    for depart in sorted(departs, key=lambda depart: minutes(depart["heure_depart"])):
+        debut = minutes(depart["heure_depart"])
+        tas = en_attente[depart["trip__arret_depart_id"]]
+        if tas and tas[0][0] <= debut:
+            _, rang, rotation = heapq.heappop(tas)
+        else:
+            rang, rotation = len(rotations), Rotation(categorie_id=depart["bus__categorie_id"])
+            rotations.append(rotation)
+        rotation.departs.append(depart)
+        rotation.places_requises = max(rotation.places_requises, depart["places_reservees"])
+        fin = debut + duree_minutes(depart["heure_depart"], depart["heure_arrivee"]) + marge
+        heapq.heappush(en_attente[depart["trip__arret_arrivee_id"]], (fin, rang, rotation))
+    return rotations
+
+
+def _attribuer_bus(rotations, bus):
+    """
+    Les rotations les plus exigeantes d'abord : le bus actuel le plus frequent
+    s'il convient, sinon le plus petit bus libre de capacite suffisante.
+    """
+    libres = {pk: capacite for pk, capacite in bus}
+    par_capacite = sorted((capacite, pk) for pk, capacite in bus)
+    sans_bus = []
+    for rotation in sorted(rotations, key=lambda rotation: -rotation.places_requises):
+        actuels = Counter(depart["bus_id"] for depart in rotation.departs)
+        choix = next(
+            (
+                pk
+                for pk, _ in actuels.most_common()
+                if libres.get(pk, -1) >= rotation.places_requises
+            ),
+            None,
+        )
+        if choix is None:
+            rang = bisect_left(par_capacite, (rotation.places_requises, 0))
+            if rang < len(par_capacite):
+                choix = par_capacite[rang][1]
+        if choix is None:
+            sans_bus.append(rotation)
+            continue
+        rotation.bus_id = choix
+        par_capacite.remove((libres.pop(choix), choix))
+    return sans_bus
+
+
+def planifier(date, marge=None):
+    """Plan de rotation des departs actifs circulant a `date` (deux requetes)."""
+    marge = temps_retournement() if marge is None else marge
+    departs = list(
+        Depart.objects.circulant_le(date)
+        .avec_places_pour(date)
+        .filter(actif=True, trip__actif=True)
+        .values(
+            "pk",
+            "bus_id",
+            "bus__categorie_id",
+            "heure_depart",
+            "heure_arrivee",
+            "trip__arret_depart_id",
+            "trip__arret_arrivee_id",
+            "places_reservees",
+        )
+    )
+    par_categorie = defaultdict(list)
+    for depart in departs:
+        par_categorie[depart["bus__categorie_id"]].append(depart)
+
+    bus_par_categorie = defaultdict(list)
+    for pk, capacite, categorie_id in bus_disponibles(date).values_list("pk", "capacite", "categorie_id"):
+        bus_par_categorie[categorie_id].append((pk, capacite))
+
+    plan = PlanRotation(date=date, rotations=[], bus_actuels=len({depart["bus_id"] for depart in departs}))
+    for categorie_id, departs_categorie in par_categorie.items():
+        rotations = _rotations(departs_categorie, marge)
+        plan.rotations.extend(rotations)
+        plan.sans_bus.extend(_attribuer_bus(rotations, bus_par_categorie[categorie_id]))
+    return plan
+
+
+@transaction.atomic
+def appliquer(plan):
+    """Ecrit les bus proposes en un seul bulk_update ; retourne les departs modifies."""
+    changements = plan.changements
+    modifies = [Depart(pk=pk, bus_id=bus_id) for pk, bus_id in changements.items()]
+    Depart.objects.bulk_update(modifies, ["bus"], batch_size=1000)
+    transaction.on_commit(
+        lambda: departs_modifies_en_masse.send(sender=Depart, crees=[], modifies=modifies)
+    )
+    return modifies
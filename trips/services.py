@@ -0,0 +1,163 @@
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .intervalles import CHAMPS_DEPART, IndexIntervalles, balayer, creneaux, creneaux_depart
+from .models import Depart
+from .signals import departs_modifies_en_masse
+
+
+def temps_retournement():
+    """Minutes d'immobilisation d'un bus a destination avant de repartir."""
+    return getattr(settings, "BUS_TEMPS_RETOURNEMENT_MINUTES", 30)
+
+
+def conflits_bus(depart):
+    """
+    Departs actifs du meme bus dont les creneaux, temps de retournement
+    compris, chevauchent ceux de `depart` (une requete). Retourne des dicts
+    {pk, trip__nom, heure_depart, heure_arrivee}.
+    """
+    if not depart.bus_id or not depart.actif:
+        return []
+    autres = (
+        Depart.objects.filter(bus_id=depart.bus_id, actif=True)
+        .exclude(pk=depart.pk)
+        .values("pk", "trip__nom", *CHAMPS_DEPART)
+    )
+    index = IndexIntervalles()
+    for ligne in autres:
+        for creneau in creneaux(ligne, valeur=ligne):
+            index.ajouter(creneau)
+
+    marge = temps_retournement()
+    conflits = {}
+    for creneau in creneaux_depart(depart, valeur=depart.pk):
+        for existant in index.chevauchements(creneau, marge=marge):
+            conflits.setdefault(existant.valeur["pk"], existant.valeur)
+    return sorted(conflits.values(), key=lambda ligne: ligne["heure_depart"])
+
+
+def horaires_cadences(premier_depart, dernier_depart, frequence_minutes, duree_minutes):
+    """Liste de (heure_depart, heure_arrivee) toutes les `frequence_minutes` minutes."""
+    if frequence_minutes <= 0:
+        raise ValidationError("La frequence doit etre positive.")
+    jour = datetime(2000, 1, 1)
+    courant = datetime.combine(jour, premier_depart)
+    fin = datetime.combine(jour, dernier_depart)
+    horaires = []
+    while courant <= fin:
+        arrivee = courant + timedelta(minutes=duree_minutes)
+        if arrivee.date() != jour.date():
+            raise ValidationError(
+                f"Le depart de {courant:%H:%M} arriverait apres minuit ; reduisez la plage horaire."
+            )
+        horaires.append((courant.time(), arrivee.time()))
+        courant += timedelta(minutes=frequence_minutes)
+    return horaires
+
+
+def conflits_grille(bus, planifies, exclus=()):
+    """
+    Paires (a, b) de creneaux du `bus` qui se chevauchent, retournement
+    compris, dont au moins un est un depart `planifies` (instances non
+    encore ecrites). Les departs enregistres du bus sont lus en une requete,
+    sauf ceux d'`exclus` (pk) que la grille remplace. Chaque element vaut
+    {"trip__nom", "heure_depart", "heure_arrivee"}.
+    """
+    elements = []
+    for rang, depart in enumerate(planifies):
+        valeur = {"planifie": rang, "trip__nom": depart.trip.nom, "heure_depart": depart.heure_depart,
+                  "heure_arrivee": depart.heure_arrivee}
+        elements.extend(creneaux_depart(depart, valeur=valeur))
+    enregistres = (
+        Depart.objects.filter(bus=bus, actif=True)
+        .exclude(pk__in=list(exclus))
+        .values("pk", "trip__nom", *CHAMPS_DEPART)
+    )
+    for ligne in enregistres:
+        elements.extend(creneaux(ligne, valeur=ligne))
+
+    paires, vues = [], set()
+    for a, b in balayer(elements, marge=temps_retournement()):
+        # Une paire se repete pour chaque jour ou les deux departs circulent.
+        cle = frozenset((id(a.valeur), id(b.valeur)))
+        if ("planifie" in a.valeur or "planifie" in b.valeur) and cle not in vues:
+            vues.add(cle)
+            paires.append((a.valeur, b.valeur))
+    return paires
+
+
+def verifier_grille(bus, planifies, exclus=()):
+    """ValidationError listant les premiers chevauchements de `conflits_grille`, s'il y en a."""
+    conflits = conflits_grille(bus, planifies, exclus=exclus)
+    if conflits:
+        raise ValidationError(
+            f"Le bus {bus} serait engage sur des creneaux qui se chevauchent "
+            f"(retournement de {temps_retournement()} min compris) : "
+            + ", ".join(
+                f"{a['heure_depart']:%H:%M}-{a['heure_arrivee']:%H:%M} {a['trip__nom']} / "
+                f"{b['heure_depart']:%H:%M}-{b['heure_arrivee']:%H:%M} {b['trip__nom']}"
+                for a, b in conflits[:3]
+            )
+            + (f" et {len(conflits) - 3} autre(s)." if len(conflits) > 3 else ".")
+        )
+
+
+class GenerateurDeparts:
+    """Cree ou met a jour les departs d'un trajet en un seul passage bulk."""
+
+    CHAMPS_MAJ = ["bus", "heure_arrivee", "prix", "calendrier", "actif"]
+
+    @staticmethod
+    @transaction.atomic
+    def generer(trip, horaires, bus, calendrier=None, desactiver_absents=False):
+        """
+        Les departs existants sont rapproches par heure de depart : ceux qui
+        correspondent sont mis a jour, les autres crees. Avec
+        `desactiver_absents`, les departs du trajet hors grille sont desactives.
+        Une grille qui engage `bus` sur deux creneaux trop proches (frequence
+        inferieure a la duree plus le retournement, ou autre depart du bus)
+        est refusee par ValidationError, sans rien ecrire.
+        Retourne (crees, modifies).
+        """
+        existants = {depart.heure_depart: depart for depart in trip.departs.select_for_update()}
+        crees, modifies = [], []
+
+        for heure_depart, heure_arrivee in horaires:
+            depart = existants.pop(heure_depart, None)
+            if depart is None:
+                crees.append(Depart(
+                    trip=trip,
+                    bus=bus,
+                    heure_depart=heure_depart,
+                    heure_arrivee=heure_arrivee,
+                    prix=trip.price,
+                    calendrier=calendrier,
+                ))
+                continue
+            depart.bus = bus
+            depart.heure_arrivee = heure_arrivee
+            depart.prix = trip.price
+            depart.calendrier = calendrier
+            depart.actif = True
+            modifies.append(depart)
+
+        if desactiver_absents:
+            for depart in existants.values():
+                if depart.actif:
+                    depart.actif = False
+                    modifies.append(depart)
+
+        # bulk_create contourne DepartForm : meme controle que conflits_bus, pour toute la grille.
+        planifies = [depart for depart in crees + modifies if depart.actif]
+        verifier_grille(bus, planifies, exclus=[depart.pk for depart in modifies])
+
+        Depart.objects.bulk_create(crees, batch_size=500)
+        Depart.objects.bulk_update(modifies, GenerateurDeparts.CHAMPS_MAJ, batch_size=500)
+        transaction.on_commit(
+            lambda: departs_modifies_en_masse.send(sender=Depart, crees=crees, modifies=modifies)
+        )
+        return crees, modifies
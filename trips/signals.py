@@ -0,0 +1,19 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from gareci_project import cache
+
+from .models import Trip, Ville
+
+# Envoye apres un bulk_create / bulk_update de departs (qui ne declenchent pas
+# post_save). Arguments : crees, modifies (listes de Depart).
+departs_modifies_en_masse = Signal()
+
+
+@receiver([post_save, post_delete], sender=Ville)
+@receiver([post_save, post_delete], sender=Trip)
+def invalider_referentiel(sender, **kwargs):
+    # Apres le commit : invalide avant, une requete concurrente remettrait
+    # en cache l'etat precedent sous la nouvelle version.
+    transaction.on_commit(cache.invalider)
@@ -1,6 +1,23 @@
-from django.test import TestCase
+import csv
+import os
+import tempfile
+from datetime import date, time, timedelta
+from io import StringIO
 
-from trips.models import Arret, EtapeTrajet, Segment, Trip, Ville
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from gareci_project import cache as cache_gareci
+from reservations.models import Reservation
+from trips.models import Arret, Bus, Calendrier, Depart, EtapeTrajet, ExceptionCalendrier, Segment, Trip, Ville
+from trips import maintenance, rotation
+from trips.services import GenerateurDeparts, horaires_cadences
 
 
 class TripUseCaseTests(TestCase):
@@ -74,3 +91,491 @@ class TripUseCaseTests(TestCase):
             list(trip_escale.etapetrajet_set.values_list("ordre", flat=True)),
             [1, 2],
         )
+
+
+class CalendrierServiceTests(TestCase):
+    def setUp(self):
+        abidjan = Ville.objects.create(nom="Abidjan", code="ABJ")
+        bouake = Ville.objects.create(nom="Bouake", code="BKE")
+        gare_abidjan = Arret.objects.create(ville=abidjan, nom="Gare d'Adjame", adresse="Adjame")
+        gare_bouake = Arret.objects.create(ville=bouake, nom="Gare de Bouake", adresse="Centre")
+        self.trip = Trip.objects.create(
+            nom="Abidjan - Bouake",
+            ville_depart=abidjan,
+            ville_arrivee=bouake,
+            arret_depart=gare_abidjan,
+            arret_arrivee=gare_bouake,
+            price=3500,
+        )
+        self.bus = Bus.objects.create(immatriculation="AB-001-CD", modele="Test", capacite=50)
+        # Semaine ouvree, valable en mars 2030 (le 4 mars 2030 est un lundi).
+        self.semaine = Calendrier.objects.create(
+            nom="Semaine",
+            samedi=False,
+            dimanche=False,
+            date_debut=date(2030, 3, 1),
+            date_fin=date(2030, 3, 31),
+        )
+        self.quotidien = Depart.objects.create(
+            trip=self.trip, bus=self.bus, heure_depart=time(6, 0), heure_arrivee=time(10, 0), prix=3500,
+        )
+        self.ouvre = Depart.objects.create(
+            trip=self.trip, bus=self.bus, heure_depart=time(8, 0), heure_arrivee=time(12, 0), prix=3500,
+            calendrier=self.semaine,
+        )
+
+    def _circulant(self, jour):
+        return set(Depart.objects.circulant_le(jour).values_list("pk", flat=True))
+
+    def test_jours_et_periode_de_validite(self):
+        self.assertEqual(self._circulant(date(2030, 3, 4)), {self.quotidien.pk, self.ouvre.pk})
+        self.assertEqual(self._circulant(date(2030, 3, 9)), {self.quotidien.pk})
+        self.assertEqual(self._circulant(date(2030, 4, 1)), {self.quotidien.pk})
+
+    def test_exceptions_ajout_et_suppression(self):
+        ExceptionCalendrier.objects.create(calendrier=self.semaine, date=date(2030, 3, 5))
+        ExceptionCalendrier.objects.create(
+            calendrier=self.semaine, date=date(2030, 3, 9), type=ExceptionCalendrier.Type.AJOUT,
+        )
+
+        self.assertEqual(self._circulant(date(2030, 3, 5)), {self.quotidien.pk})
+        self.assertEqual(self._circulant(date(2030, 3, 9)), {self.quotidien.pk, self.ouvre.pk})
+        # La verification en memoire donne le meme resultat que le filtre SQL.
+        for jour in (date(2030, 3, 4), date(2030, 3, 5), date(2030, 3, 9), date(2030, 4, 1)):
+            self.assertEqual(self.ouvre.circule_le(jour), self.ouvre.pk in self._circulant(jour))
+
+    def test_generateur_cree_puis_met_a_jour_sans_doublon(self):
+        navette = Bus.objects.create(immatriculation="AB-002-CD", modele="Test", capacite=50)
+        # 4 h de trajet + 30 min de retournement : un depart toutes les 4 h 30 pour un seul bus.
+        horaires = horaires_cadences(time(6, 0), time(15, 0), 270, 240)
+        self.assertEqual(len(horaires), 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            crees, modifies = GenerateurDeparts.generer(self.trip, horaires, navette, calendrier=self.semaine)
+        self.assertEqual((len(crees), len(modifies)), (2, 1))
+        self.assertEqual(self.trip.departs.count(), 4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            crees, modifies = GenerateurDeparts.generer(
+                self.trip, horaires[:2], navette, desactiver_absents=True,
+            )
+        self.assertEqual((len(crees), len(modifies)), (0, 4))
+        self.assertEqual(self.trip.departs.filter(actif=True).count(), 2)
+        self.assertEqual(self.trip.departs.filter(calendrier__isnull=True).count(), 2)
+
+    def test_generateur_refuse_les_chevauchements_de_bus(self):
+        navette = Bus.objects.create(immatriculation="AB-002-CD", modele="Test", capacite=50)
+        # Toutes les heures pour 4 h de trajet : le meme bus serait engage quatre fois a la fois.
+        with self.assertRaisesMessage(ValidationError, "06:00-10:00 Abidjan - Bouake / 07:00-11:00"):
+            GenerateurDeparts.generer(self.trip, horaires_cadences(time(6, 0), time(9, 0), 60, 240), navette)
+        self.assertFalse(Depart.objects.filter(bus=navette).exists())
+
+        # Conflit avec un depart du bus hors grille (8 h - 12 h, en semaine).
+        with self.assertRaisesMessage(ValidationError, "08:00-12:00"):
+            GenerateurDeparts.generer(self.trip, [(time(11, 0), time(13, 0))], self.bus, calendrier=self.semaine)
+        self.assertEqual(self.trip.departs.count(), 2)
+
+    def test_recherche_filtre_par_date_de_voyage(self):
+        url = reverse("trips:search_results")
+        response = self.client.get(url, {"ville_depart": "Abidjan", "date": "2030-03-09"})
+        self.assertEqual([r["depart"].pk for r in response.context["resultats"]], [self.quotidien.pk])
+
+        response = self.client.get(url, {"ville_depart": "Abidjan", "date": "2030-03-04"})
+        resultats = response.context["resultats"]
+        self.assertEqual([r["depart"].pk for r in resultats], [self.quotidien.pk, self.ouvre.pk])
+        self.assertEqual(resultats[0]["places"], 50)
+
+
+FLUX_GTFS = {
+    "stops.txt": [
+        "stop_id,stop_code,stop_name,stop_desc,stop_lat,stop_lon,zone_id,location_type,parent_station",
+        "VILLE-ABJ,ABJ,Abidjan,,,,ABJ,1,",
+        "VILLE-BKE,BKE,Bouake,,,,BKE,1,",
+        "adjame,,Gare d'Adjame,Adjame,5.35,-4.02,ABJ,0,VILLE-ABJ",
+        "yamoussoukro,,Yamoussoukro,,6.82,-5.27,YAM,0,",
+        "bouake,,Gare de Bouake,Centre,7.69,-5.03,BKE,0,VILLE-BKE",
+    ],
+    "routes.txt": [
+        "route_id,agency_id,route_short_name,route_long_name,route_type",
+        "ABJ-BKE,GARECI,,Abidjan - Bouake,3",
+    ],
+    "trips.txt": [
+        "route_id,service_id,trip_id,direction_id",
+        "ABJ-BKE,SEMAINE,v1,0",
+        "ABJ-BKE,QUOTIDIEN,v2,0",
+    ],
+    "stop_times.txt": [
+        "trip_id,arrival_time,departure_time,stop_id,stop_sequence,shape_dist_traveled",
+        "v1,06:00:00,06:00:00,adjame,1,0",
+        "v1,08:30:00,08:40:00,yamoussoukro,2,230",
+        "v1,10:00:00,10:00:00,bouake,3,350",
+        "v2,23:00:00,23:00:00,adjame,1,0",
+        "v2,25:30:00,25:40:00,yamoussoukro,2,230",
+        "v2,27:00:00,27:00:00,bouake,3,350",
+    ],
+    "calendar.txt": [
+        "service_id,monday,tuesday,wednesday,thursday,friday,saturday,sunday,start_date,end_date",
+        "SEMAINE,1,1,1,1,1,0,0,20300101,20991231",
+    ],
+    "calendar_dates.txt": ["service_id,date,exception_type", "SEMAINE,20300101,2"],
+    "fare_attributes.txt": ["fare_id,price,currency_type,payment_method,transfers", "F1,3500,XOF,1,"],
+    "fare_rules.txt": ["fare_id,route_id", "F1,ABJ-BKE"],
+}
+
+
+class GTFSTests(TestCase):
+    def setUp(self):
+        self.repertoire = tempfile.TemporaryDirectory()
+        self.addCleanup(self.repertoire.cleanup)
+        for nom, lignes in FLUX_GTFS.items():
+            with open(os.path.join(self.repertoire.name, nom), "w", encoding="utf-8") as fichier:
+                fichier.write("\n".join(lignes) + "\n")
+        Bus.objects.create(immatriculation="AB-001-CD", modele="Test", capacite=50)
+
+    def _importer(self, *args):
+        sortie = StringIO()
+        call_command("import_gtfs", self.repertoire.name, "--bus", "AB-001-CD", *args, stdout=sortie)
+        return sortie.getvalue()
+
+    def test_simulation_n_enregistre_rien(self):
+        sortie = self._importer("--dry-run")
+
+        self.assertIn("Départs : 2 nouveaux", sortie)
+        self.assertFalse(Depart.objects.exists())
+        self.assertFalse(Arret.objects.filter(code_gtfs__isnull=False).exists())
+
+    def test_import_puis_reimport_idempotent(self):
+        self._importer()
+
+        trip = Trip.objects.get(code_gtfs="ABJ-BKE")
+        self.assertEqual(trip.price, 3500)
+        self.assertEqual(trip.ville_depart.code, "ABJ")
+        self.assertEqual(trip.duree_totale, 230)
+        self.assertEqual(
+            list(trip.etapetrajet_set.values_list("segment__arret_arrivee__nom", flat=True)),
+            ["Yamoussoukro", "Gare de Bouake"],
+        )
+        v1, v2 = Depart.objects.get(code_gtfs="v1"), Depart.objects.get(code_gtfs="v2")
+        self.assertEqual((v1.heure_depart, v1.heure_arrivee, v1.prix), (time(6, 0), time(10, 0), 3500))
+        self.assertEqual((v2.heure_depart, v2.heure_arrivee, v2.calendrier), (time(23, 0), time(3, 0), None))
+        self.assertEqual(v1.calendrier.jours, ["lundi", "mardi", "mercredi", "jeudi", "vendredi"])
+        self.assertIsNone(v1.calendrier.date_fin)
+        self.assertFalse(v1.circule_le(date(2030, 1, 1)))
+
+        sortie = self._importer("--dry-run")
+        self.assertIn("Départs : 0 nouveaux, 0 modifies, 2 inchanges, 0 absents", sortie)
+        self.assertIn("arrets : 0 nouveaux, 0 modifies, 3 inchanges", sortie)
+
+    def test_gros_flux_plus_de_1000_paires_d_arrets(self):
+        # Un OR par paire d'arrets depassait la profondeur d'expression de SQLite (1000).
+        nombre = 1200
+        flux = {
+            "stops.txt": FLUX_GTFS["stops.txt"][:2] + [f"s{rang},,Arret {rang},,,,ABJ,0," for rang in range(nombre + 1)],
+            "routes.txt": FLUX_GTFS["routes.txt"][:1] + [f"r{rang},GARECI,,Ligne {rang},3" for rang in range(nombre)],
+            # Service sans jour de circulation : les voyages peuvent partager le meme bus.
+            "calendar.txt": FLUX_GTFS["calendar.txt"][:1] + ["JAMAIS,0,0,0,0,0,0,0,20300101,20991231"],
+            "trips.txt": FLUX_GTFS["trips.txt"][:1] + [f"r{rang},JAMAIS,v{rang},0" for rang in range(nombre)],
+            "stop_times.txt": FLUX_GTFS["stop_times.txt"][:1] + [
+                ligne
+                for rang in range(nombre)
+                for ligne in (f"v{rang},06:00:00,06:00:00,s{rang},1,0", f"v{rang},07:00:00,07:00:00,s{rang + 1},2,50")
+            ],
+            "fare_rules.txt": FLUX_GTFS["fare_rules.txt"][:1],
+        }
+        for nom, lignes in flux.items():
+            with open(os.path.join(self.repertoire.name, nom), "w", encoding="utf-8") as fichier:
+                fichier.write("\n".join(lignes) + "\n")
+
+        self._importer()
+        self.assertEqual(Segment.objects.count(), nombre)
+        self.assertEqual(EtapeTrajet.objects.count(), nombre)
+        self.assertIn(f"segments : 0 nouveaux, 0 modifies, {nombre} inchanges", self._importer("--dry-run"))
+
+    def test_bus_engage_sur_deux_voyages_qui_se_chevauchent(self):
+        with open(os.path.join(self.repertoire.name, "trips.txt"), "a", encoding="utf-8") as fichier:
+            fichier.write("ABJ-BKE,QUOTIDIEN,v3,0\n")
+        with open(os.path.join(self.repertoire.name, "stop_times.txt"), "a", encoding="utf-8") as fichier:
+            fichier.write("v3,09:00:00,09:00:00,adjame,1,0\nv3,13:00:00,13:00:00,bouake,2,350\n")
+
+        with self.assertRaisesMessage(CommandError, "creneaux qui se chevauchent"):
+            self._importer()
+        self.assertFalse(Depart.objects.exists())
+
+        # Meme refus contre un depart deja enregistre sur le bus.
+        with open(os.path.join(self.repertoire.name, "stop_times.txt"), "w", encoding="utf-8") as fichier:
+            fichier.write("\n".join(FLUX_GTFS["stop_times.txt"]) + "\n")
+        ville = Ville.objects.create(code="SPD", nom="San-Pedro")
+        arret = Arret.objects.create(ville=ville, nom="Gare de San-Pedro", adresse="Port")
+        navette = Trip.objects.create(
+            nom="Navette", ville_depart=ville, ville_arrivee=ville, arret_depart=arret, arret_arrivee=arret, price=500,
+        )
+        Depart.objects.create(trip=navette, bus=Bus.objects.get(), heure_depart=time(1, 0), heure_arrivee=time(2, 0), prix=500)
+        with self.assertRaisesMessage(CommandError, "01:00-02:00 Navette"):
+            self._importer()
+        self.assertEqual(Depart.objects.count(), 1)
+
+    def test_export_n_ecrit_pas_en_base(self):
+        ville = Ville.objects.create(code="SPD", nom="San-Pedro")
+        arret = Arret.objects.create(ville=ville, nom="Gare de San-Pedro", adresse="Port")
+
+        with tempfile.TemporaryDirectory() as destination:
+            call_command("export_gtfs", destination, stdout=StringIO())
+            with open(os.path.join(destination, "stops.txt"), encoding="utf-8") as fichier:
+                self.assertIn(f"arret-{arret.pk}", fichier.read())
+        arret.refresh_from_db()
+        self.assertIsNone(arret.code_gtfs)
+
+    def test_export_relu_par_l_import(self):
+        self._importer()
+        Depart.objects.filter(code_gtfs="v2").update(heure_depart=time(22, 0))
+
+        with tempfile.TemporaryDirectory() as destination:
+            call_command("export_gtfs", destination, stdout=StringIO())
+            with open(os.path.join(destination, "stop_times.txt"), encoding="utf-8") as fichier:
+                horaires = [ligne for ligne in csv.DictReader(fichier) if ligne["trip_id"] == "v1"]
+            self.assertEqual(
+                [(ligne["stop_id"], ligne["arrival_time"]) for ligne in horaires],
+                [("adjame", "06:00:00"), ("yamoussoukro", "08:30:00"), ("bouake", "10:00:00")],
+            )
+
+            sortie = StringIO()
+            call_command("import_gtfs", destination, "--dry-run", stdout=sortie)
+        # Le service QUOTIDIEN ecrit par l'export ne devient pas un calendrier.
+        self.assertIn("calendriers : 0 nouveaux, 0 modifies, 1 inchanges", sortie.getvalue())
+        self.assertIn("Départs : 0 nouveaux, 0 modifies, 2 inchanges", sortie.getvalue())
+
+
+    def test_aller_retour_sur_la_meme_base_sans_doublon(self):
+        self._importer()
+        ville = Ville.objects.get(code="ABJ")
+        nord = Arret.objects.create(ville=ville, nom="Gare Nord", adresse="Nord")
+        sud = Arret.objects.create(ville=ville, nom="Gare Sud", adresse="Sud")
+        navette = Trip.objects.create(
+            nom="Navette", ville_depart=ville, ville_arrivee=ville, arret_depart=nord, arret_arrivee=sud, price=500,
+        )
+        EtapeTrajet.objects.create(
+            trip=navette, ordre=1, segment=Segment.objects.create(arret_depart=nord, arret_arrivee=sud, duree_minutes=45, distance_km=12),
+        )
+        depart = Depart.objects.create(
+            trip=navette, bus=Bus.objects.get(), heure_depart=time(12, 0), heure_arrivee=time(12, 45), prix=500,
+            calendrier=Calendrier.objects.create(nom="Semaine", samedi=False, dimanche=False),
+        )
+        modeles = (Ville, Arret, Segment, Trip, EtapeTrajet, Calendrier, Depart)
+        avant = {modele.__name__: modele.objects.count() for modele in modeles}
+
+        with tempfile.TemporaryDirectory() as destination:
+            call_command("export_gtfs", destination, stdout=StringIO())
+            call_command("import_gtfs", destination, stdout=StringIO())
+
+        self.assertEqual({modele.__name__: modele.objects.count() for modele in modeles}, avant)
+        depart.refresh_from_db()
+        self.assertEqual(
+            (depart.code_gtfs, depart.trip.code_gtfs, depart.calendrier.code_gtfs),
+            (f"depart-{depart.pk}", f"trajet-{navette.pk}", f"service-{depart.calendrier_id}"),
+        )
+
+
+class RotationTests(TestCase):
+    def setUp(self):
+        abidjan = Ville.objects.create(nom="Abidjan", code="ABJ")
+        bouake = Ville.objects.create(nom="Bouake", code="BKE")
+        gare_a = Arret.objects.create(ville=abidjan, nom="Adjame", adresse="Adjame")
+        gare_b = Arret.objects.create(ville=bouake, nom="Bouake", adresse="Centre")
+        self.aller = Trip.objects.create(
+            nom="Aller", ville_depart=abidjan, ville_arrivee=bouake, arret_depart=gare_a, arret_arrivee=gare_b, price=3500,
+        )
+        self.retour = Trip.objects.create(
+            nom="Retour", ville_depart=bouake, ville_arrivee=abidjan, arret_depart=gare_b, arret_arrivee=gare_a, price=3500,
+        )
+        self.bus = [
+            Bus.objects.create(immatriculation=f"AB-{i}", modele="Test", capacite=capacite)
+            for i, capacite in enumerate((50, 50, 50, 70))
+        ]
+        self.jour = date(2030, 3, 4)
+
+    def _depart(self, trip, debut, fin, bus):
+        return Depart.objects.create(trip=trip, bus=bus, heure_depart=time(debut), heure_arrivee=time(fin), prix=3500)
+
+    def test_aller_retour_enchaines_sur_un_bus(self):
+        d1 = self._depart(self.aller, 6, 8, self.bus[0])
+        d2 = self._depart(self.retour, 9, 11, self.bus[1])
+        d3 = self._depart(self.aller, 12, 14, self.bus[2])
+        # Part d'Abidjan pendant que le premier bus est a Bouake : deuxieme rotation.
+        d4 = self._depart(self.aller, 10, 12, self.bus[2])
+
+        with self.assertNumQueries(2):
+            plan = rotation.planifier(self.jour, marge=30)
+        self.assertEqual((plan.bus_actuels, plan.bus_necessaires), (3, 2))
+        self.assertEqual(
+            sorted(sorted(depart["pk"] for depart in rot.departs) for rot in plan.rotations),
+            [[d1.pk, d2.pk, d3.pk], [d4.pk]],
+        )
+        self.assertEqual(plan.affectations[d1.pk], self.bus[0].pk)
+        self.assertEqual(plan.affectations[d4.pk], self.bus[2].pk)
+
+        rotation.appliquer(plan)
+        self.assertEqual(
+            set(Depart.objects.filter(pk__in=[d1.pk, d2.pk, d3.pk]).values_list("bus_id", flat=True)),
+            {self.bus[0].pk},
+        )
+
+    def test_retournement_capacite_et_bus_hors_service(self):
+        d1 = self._depart(self.aller, 6, 8, self.bus[0])
+        d2 = self._depart(self.retour, 8, 10, self.bus[1])
+        self.assertEqual(rotation.planifier(self.jour, marge=30).bus_necessaires, 2)
+
+        Bus.objects.filter(pk=self.bus[0].pk).update(en_service=False)
+        Bus.objects.filter(pk=self.bus[1].pk).update(derniere_revision=date(2020, 1, 1))
+        utilisateur = get_user_model().objects.create_user(username="client", password="x")
+        Reservation.objects.create(
+            utilisateur=utilisateur, depart=d2, date_voyage=self.jour, nombre_places=60, prix_total=0,
+        )
+
+        plan = rotation.planifier(self.jour, marge=0)
+        self.assertEqual(plan.bus_necessaires, 1)
+        self.assertEqual(plan.affectations, {d1.pk: self.bus[3].pk, d2.pk: self.bus[3].pk})
+
+
+@override_settings(BUS_INTERVALLE_REVISION_JOURS=180, BUS_INTERVALLE_REVISION_KM=3000, BUS_ALERTE_REVISION_JOURS=14)
+class MaintenanceTests(TestCase):
+    def setUp(self):
+        abidjan = Ville.objects.create(nom="Abidjan", code="ABJ")
+        bouake = Ville.objects.create(nom="Bouake", code="BKE")
+        gare_a = Arret.objects.create(ville=abidjan, nom="Adjame", adresse="Adjame")
+        gare_b = Arret.objects.create(ville=bouake, nom="Bouake", adresse="Centre")
+        self.trip = Trip.objects.create(
+            nom="Aller", ville_depart=abidjan, ville_arrivee=bouake, arret_depart=gare_a, arret_arrivee=gare_b, price=3500,
+        )
+        segment = Segment.objects.create(arret_depart=gare_a, arret_arrivee=gare_b, distance_km=300, duree_minutes=240)
+        EtapeTrajet.objects.create(trip=self.trip, segment=segment, ordre=1)
+        self.jour = date(2030, 3, 11)  # lundi
+
+    def _bus(self, immatriculation, capacite=50, **champs):
+        return Bus.objects.create(immatriculation=immatriculation, modele="Test", capacite=capacite, **champs)
+
+    def _depart(self, bus, debut, fin, calendrier=None):
+        return Depart.objects.create(
+            trip=self.trip, bus=bus, heure_depart=time(debut), heure_arrivee=time(fin), prix=3500, calendrier=calendrier,
+        )
+
+    def test_echeance_par_kilometrage_et_blocage_des_ventes(self):
+        quotidien = self._bus("AB-1", derniere_revision=self.jour - timedelta(days=10))
+        week_end = self._bus("AB-2", derniere_revision=self.jour - timedelta(days=14))
+        self._bus("AB-3")
+        depart = self._depart(quotidien, 6, 10)
+        samedi_dimanche = Calendrier.objects.create(
+            nom="Week-end", lundi=False, mardi=False, mercredi=False, jeudi=False, vendredi=False,
+        )
+        self._depart(week_end, 6, 10, calendrier=samedi_dimanche)
+        self.assertTrue(Depart.objects.exploitables(self.jour).filter(pk=depart.pk).exists())
+
+        with self.assertNumQueries(3):
+            etats = {etat.bus.immatriculation: etat for etat in maintenance.planifier(self.jour)}
+        # 9 jours circules depuis la revision : 2700 km, il reste une journee.
+        self.assertEqual(etats["AB-1"].km_depuis_revision, 2700)
+        self.assertEqual(etats["AB-1"].echeance, self.jour)
+        self.assertEqual(etats["AB-1"].statut, maintenance.EtatMaintenance.A_PLANIFIER)
+        # Deux week-ends circules : 1200 km, puis 600 km par semaine.
+        self.assertEqual(etats["AB-2"].km_depuis_revision, 1200)
+        self.assertEqual(etats["AB-2"].echeance, self.jour + timedelta(days=20))
+        self.assertEqual(etats["AB-3"].statut, maintenance.EtatMaintenance.INCONNU)
+
+        maintenance.enregistrer(maintenance.planifier(self.jour + timedelta(days=1)))
+        lendemain = self.jour + timedelta(days=1)
+        self.assertEqual(Bus.objects.get(pk=quotidien.pk).echeance_revision, self.jour)
+        self.assertFalse(Depart.objects.exploitables(lendemain).filter(pk=depart.pk).exists())
+
+        # Une nouvelle revision leve le blocage sans attendre le prochain calcul.
+        Bus.objects.filter(pk=quotidien.pk).update(derniere_revision=lendemain)
+        self.assertTrue(Depart.objects.exploitables(lendemain).filter(pk=depart.pk).exists())
+
+    def test_revision_trop_ancienne_ou_hors_service_exclus_de_la_recherche(self):
+        a_jour = self._depart(self._bus("AB-1"), 6, 10)
+        self._depart(self._bus("AB-2", derniere_revision=date(2000, 1, 1)), 7, 11)
+        self._depart(self._bus("AB-3", en_service=False), 8, 12)
+
+        reponse = self.client.get(reverse("trips:search_results"), {"ville_depart": "Abidjan"})
+        self.assertEqual([resultat["depart"].pk for resultat in reponse.context["resultats"]], [a_jour.pk])
+
+    def test_suggestion_de_remplacements_en_lot(self):
+        hors_service = self._bus("AB-1", en_service=False)
+        d1 = self._depart(hors_service, 6, 10)
+        d2 = self._depart(hors_service, 7, 11)
+        self._bus("AB-2", capacite=30)
+        occupe = self._bus("AB-3")
+        self._depart(occupe, 11, 15)
+        libre = self._bus("AB-4", capacite=70)
+
+        with self.assertNumQueries(2):
+            remplacements = maintenance.suggerer_remplacements(self.jour, marge=30)
+        # AB-2 trop petit, AB-3 pas revenu a temps pour d2 ; AB-4 ne prend qu'un des deux.
+        self.assertEqual(
+            [(r.depart_id, r.bus_id) for r in remplacements],
+            [(d1.pk, occupe.pk), (d2.pk, libre.pk)],
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            maintenance.appliquer_remplacements(remplacements)
+        self.assertEqual(Depart.objects.get(pk=d2.pk).bus_id, libre.pk)
+        self.assertEqual(maintenance.suggerer_remplacements(self.jour), [])
+
+
+class CacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.abidjan = Ville.objects.create(code="ABJ", nom="Abidjan")
+
+    def test_page_anonyme_servie_depuis_le_cache(self):
+        self.assertContains(self.client.get(reverse("trips:home")), "Abidjan")
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get(reverse("trips:home")), "Abidjan")
+
+        # Hors transaction validee, l'ancienne page reste servie.
+        Ville.objects.create(code="SPD", nom="San-Pedro")
+        self.assertNotContains(self.client.get(reverse("trips:home")), "San-Pedro")
+        with self.captureOnCommitCallbacks(execute=True):
+            Ville.objects.create(code="BKE", nom="Bouake")
+        self.assertContains(self.client.get(reverse("trips:home")), "Bouake")
+
+    def test_utilisateur_connecte(self):
+        self.client.get(reverse("trips:about"))
+        self.client.force_login(get_user_model().objects.create_user(username="voyageur", password="x"))
+
+        reponse = self.client.get(reverse("trips:about"))
+        self.assertContains(reponse, "Mon profil")
+        self.assertContains(reponse, "csrfmiddlewaretoken")
+
+        # Liste des villes lue dans le fragment, sans requete.
+        self.client.get(reverse("trips:home"))
+        with CaptureQueriesContext(connection) as requetes:
+            self.assertContains(self.client.get(reverse("trips:home")), "Abidjan")
+        self.assertFalse([requete for requete in requetes if "trips_ville" in requete["sql"]])
+
+    def test_trip_et_suppression_invalident(self):
+        arret = Arret.objects.create(ville=self.abidjan, nom="Adjame", adresse="Adjame")
+        version = cache_gareci.version()
+        with self.captureOnCommitCallbacks(execute=True):
+            Trip.objects.create(
+                nom="Navette", ville_depart=self.abidjan, ville_arrivee=self.abidjan,
+                arret_depart=arret, arret_arrivee=arret, price=500,
+            )
+        self.assertNotEqual(cache_gareci.version(), version)
+
+        version = cache_gareci.version()
+        with self.captureOnCommitCallbacks(execute=True):
+            Ville.objects.create(code="KOR", nom="Korhogo").delete()
+        self.assertNotEqual(cache_gareci.version(), version)
+
+    def test_configuration(self):
+        self.assertEqual(
+            cache_gareci.configuration("/srv/gareci", environ={})["BACKEND"],
+            "django.core.cache.backends.locmem.LocMemCache",
+        )
+        fichier = cache_gareci.configuration("/srv/gareci", environ={"CACHE_MOTEUR": "fichier"})
+        self.assertEqual(str(fichier["LOCATION"]), "/srv/gareci/cache")
+        redis = cache_gareci.configuration("/srv/gareci", environ={"CACHE_MOTEUR": "redis", "CACHE_URL": "redis://cache:6379/2"})
+        self.assertEqual(redis["LOCATION"], "redis://cache:6379/2")
+        with self.assertRaises(ImproperlyConfigured):
+            cache_gareci.configuration("/srv/gareci", environ={"CACHE_MOTEUR": "memcached"})
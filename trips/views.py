@@ -1,11 +1,19 @@
 # trips/views.py
+from datetime import datetime
+
 from django.db.models import Count, Q
 from django.shortcuts import render
 from django.utils import timezone
 
+from gareci_project import metriques
+from gareci_project.cache import cache_anonyme
+from gareci_project.repliques import lecture_replique
+
 from .models import Depart, Trip, Ville
 
 
+@lecture_replique
+@cache_anonyme
 def home(request):
     """Page d'accueil publique (client) avec formulaire de recherche."""
     villes = Ville.objects.order_by("nom")
@@ -21,11 +29,21 @@ def home(request):
     )
 
 
+def _date_recherche(request):
+    aujourd_hui = timezone.localdate()
+    try:
+        date_demandee = datetime.strptime(request.GET.get("date", ""), "%Y-%m-%d").date()
+    except ValueError:
+        return aujourd_hui
+    return max(date_demandee, aujourd_hui)
+
+
+@lecture_replique
 def search_results(request):
     ville_depart_nom  = request.GET.get("ville_depart", "").strip()
     ville_arrivee_nom = request.GET.get("ville_arrivee", "").strip()
     resultats         = []
-    date_recherche    = timezone.localdate()
+    date_recherche    = _date_recherche(request)
 
     if ville_depart_nom or ville_arrivee_nom:
         query = Q(actif=True)
@@ -36,18 +54,25 @@ def search_results(request):
         if ville_arrivee_nom:
             query &= Q(trip__arret_arrivee__ville__nom__icontains=ville_arrivee_nom)
         
-        departs = Depart.objects.filter(query).select_related(
-            "trip__arret_depart__ville",
-            "trip__arret_arrivee__ville",
-            "bus__categorie",
-        ).order_by("heure_depart")
-
-        for depart in departs:
-            places = depart.places_disponibles_pour(date_recherche)
-            if places > 0:
+        departs = (
+            Depart.objects.circulant_le(date_recherche)
+            .exploitables(date_recherche)
+            .avec_places_pour(date_recherche)
+            .filter(query, places_disponibles__gt=0)
+            .select_related(
+                "trip__arret_depart__ville",
+                "trip__arret_arrivee__ville",
+                "bus__categorie",
+            )
+            .prefetch_related("trip__etapetrajet_set")
+            .order_by("heure_depart")
+        )
+
+        with metriques.RECHERCHE_DUREE.chronometrer():
+            for depart in departs:
                 resultats.append({
                     "depart": depart,
-                    "places": places,
+                    "places": depart.places_disponibles,
                     "date":   date_recherche,
                 })
 
@@ -63,11 +88,13 @@ def search_results(request):
     })
 
 
+@cache_anonyme
 def about(request):
     """Page A propos publique."""
     return render(request, "about.html", {"active_tab": "about"})
 
 
+@cache_anonyme
 def cgv(request):
     """Page Conditions generales de vente."""
     return render(request, "cgv.html", {"active_tab": "cgv"})